@@ -0,0 +1,16 @@
+from fastapi import Depends, HTTPException
+from fastapi.security import OAuth2PasswordBearer
+from ..core.security import auth_service
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> str:
+    """Resolve the bearer token to a username, rejecting invalid or revoked tokens"""
+    username = await auth_service.verify_token(token)
+    if not username:
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return username
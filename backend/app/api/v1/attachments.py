@@ -0,0 +1,98 @@
+import os
+from typing import Optional, Tuple
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from ..deps import get_current_user
+from ...services.exchange.attachments import attachment_service
+from ...services.exchange.scheduler import GraphError
+
+router = APIRouter(prefix="/attachments", tags=["attachments"])
+
+def _parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range "bytes=" header into an inclusive (start, end) pair.
+    Multi-range and malformed headers are ignored and the whole file is served.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(size - int(end_text), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, min(end, size - 1)
+
+@router.get("/{message_id}/{attachment_id}")
+async def download_attachment(
+    message_id: str,
+    attachment_id: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    current_user: str = Depends(get_current_user)
+):
+    """
+    Download attachment content, with support for single byte-range requests
+    """
+    try:
+        info = await attachment_service.get_attachment_info(
+            username=current_user,
+            message_id=message_id,
+            attachment_id=attachment_id
+        )
+        path = await attachment_service.lookup(info)
+        # Graph's reported size is not the exact content length, so ranges
+        # are served from the cached copy where the real length is known.
+        if path is None and range_header and attachment_service.is_cacheable(info):
+            path = await attachment_service.ensure_cached(
+                current_user, message_id, attachment_id, info
+            )
+    except HTTPException:
+        raise
+    except GraphError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    headers = {
+        "Content-Disposition": 'attachment; filename="{}"'.format(info["name"].replace('"', ""))
+    }
+    if attachment_service.is_cacheable(info):
+        headers["Accept-Ranges"] = "bytes"
+
+    if path is None:
+        return StreamingResponse(
+            attachment_service.stream_content(current_user, message_id, attachment_id, info),
+            media_type=info["content_type"],
+            headers=headers
+        )
+
+    size = os.path.getsize(path)
+    byte_range = _parse_range(range_header, size)
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(
+            attachment_service.read_file(path),
+            media_type=info["content_type"],
+            headers=headers
+        )
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        attachment_service.read_file(path, start, end),
+        status_code=206,
+        media_type=info["content_type"],
+        headers=headers
+    )
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends, HTTPException
+from ..deps import get_current_user, oauth2_scheme
+from ...core.security import auth_service
+
+router = APIRouter(prefix="/auth", tags=["auth"])
+
+@router.post("/logout")
+async def logout(
+    token: str = Depends(oauth2_scheme),
+    current_user: str = Depends(get_current_user)
+):
+    """
+    Revoke the token used for this request
+    """
+    try:
+        await auth_service.revoke_token(token)
+        return {"status": "success", "message": "Logged out successfully"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/logout/all")
+async def logout_everywhere(current_user: str = Depends(get_current_user)):
+    """
+    Revoke every token issued to the current user so far
+    """
+    try:
+        await auth_service.revoke_user(current_user)
+        return {"status": "success", "message": "Logged out of all sessions"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,13 +1,21 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.security import OAuth2PasswordBearer
-from ...core.security import auth_service
-from ...services.exchange.client import exchange_client
-from pydantic import BaseModel
-from datetime import datetime
+import json
+from typing import AsyncIterator, Callable, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from ..deps import get_current_user
+from ...core.config import settings
+from ...core.responses import (
+    FastJSONResponse, cache_headers, dumps, etag_matches, fast_json_enabled,
+    not_modified, version_etag
+)
+from ...services.exchange.calendar import calendar_service
+from ...services.exchange.availability import availability_service
+from ...services.exchange.scheduler import GraphError
+from pydantic import BaseModel, Field
+from datetime import datetime, time
 
 router = APIRouter(prefix="/calendar", tags=["calendar"])
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 class Attendee(BaseModel):
     email: str
@@ -32,34 +40,171 @@ class EventResponse(EventBase):
     created_time: datetime
     modified_time: datetime
 
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> str:
-    username = await auth_service.verify_token(token)
-    if not username:
-        raise HTTPException(
-            status_code=401,
-            detail="Invalid authentication credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    return username
+class AvailabilityRequest(BaseModel):
+    attendees: List[str]
+    start_time: datetime
+    end_time: datetime
+
+class BusyInterval(BaseModel):
+    start_time: datetime
+    end_time: datetime
+    status: str
+
+class AttendeeAvailability(BaseModel):
+    email: str
+    busy: List[BusyInterval]
+    error: Optional[str]
+
+class SlotSearchRequest(BaseModel):
+    required_attendees: List[str] = []
+    optional_attendees: List[str] = []
+    start_time: datetime
+    end_time: datetime
+    duration_minutes: int = Field(30, ge=5, le=1440)
+    granularity_minutes: int = Field(15, ge=5, le=1440)
+    working_hours_start: Optional[time]
+    working_hours_end: Optional[time]
+    time_zone: str = "UTC"
+    exclude_weekends: bool = False
+    tentative_is_busy: bool = True
+    include_organizer: bool = True
+    max_results: int = Field(20, ge=1, le=200)
+
+class MeetingSlot(BaseModel):
+    start_time: datetime
+    end_time: datetime
+    available_optional: List[str]
+    unavailable_optional: List[str]
+
+class SlotSearchResponse(BaseModel):
+    slots: List[MeetingSlot]
+    unresolved_attendees: List[str]
 
 @router.get("/events", response_model=List[EventResponse])
 async def get_events(
     start_date: datetime,
     end_date: datetime,
+    request: Request,
+    response: Response,
     calendar_id: Optional[str] = None,
     current_user: str = Depends(get_current_user)
 ):
     """
-    Get calendar events within a date range
+    Get calendar events within a date range, streamed in start-time order.
+    With CALENDAR_EVENTS_ETAG_ENABLED the range is instead collected so it
+    can be sent with an ETag.
     """
+    if settings.ETAG_ENABLED and settings.CALENDAR_EVENTS_ETAG_ENABLED:
+        return await _get_tagged_events(
+            request, response, current_user, start_date, end_date, calendar_id
+        )
+
+    events = calendar_service.iter_calendar_events(
+        username=current_user,
+        start_date=start_date,
+        end_date=end_date,
+        calendar_id=calendar_id
+    )
+    # Pull the first event before responding so upstream failures still
+    # surface as a 500 rather than a truncated body.
     try:
-        events = await exchange_client.get_calendar_events(
-            username=current_user,
+        first_event = await events.__anext__()
+    except StopAsyncIteration:
+        first_event = None
+    except GraphError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    encode = dumps if fast_json_enabled("calendar.get_events") else _encode_event
+    return StreamingResponse(
+        _stream_events(first_event, events, encode),
+        media_type="application/json"
+    )
+
+async def _get_tagged_events(
+    request: Request,
+    response: Response,
+    username: str,
+    start_date: datetime,
+    end_date: datetime,
+    calendar_id: Optional[str]
+):
+    try:
+        events = await calendar_service.get_calendar_events(
+            username=username,
             start_date=start_date,
             end_date=end_date,
             calendar_id=calendar_id
         )
-        return events
+    except GraphError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    etag = version_etag(events, "modified_time")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    if fast_json_enabled("calendar.get_events"):
+        return FastJSONResponse(events, headers=cache_headers(etag))
+    response.headers.update(cache_headers(etag))
+    return events
+
+def _encode_event(event: dict) -> bytes:
+    return json.dumps(jsonable_encoder(event)).encode()
+
+async def _stream_events(
+    first_event: Optional[dict],
+    events: AsyncIterator[dict],
+    encode: Callable[[dict], bytes]
+) -> AsyncIterator[bytes]:
+    """Encode events as a JSON array one element at a time"""
+    yield b"["
+    if first_event is not None:
+        yield encode(first_event)
+        async for event in events:
+            yield b"," + encode(event)
+    yield b"]"
+
+@router.post("/availability", response_model=List[AttendeeAvailability])
+async def get_availability(
+    request: AvailabilityRequest,
+    current_user: str = Depends(get_current_user)
+):
+    """
+    Get busy intervals for many attendees within a time range
+    """
+    try:
+        return await availability_service.get_availability(
+            username=current_user,
+            attendees=request.attendees,
+            start_time=request.start_time,
+            end_time=request.end_time
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except GraphError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/availability/slots", response_model=SlotSearchResponse)
+async def find_meeting_slots(
+    request: SlotSearchRequest,
+    current_user: str = Depends(get_current_user)
+):
+    """
+    Find meeting slots where all required attendees are free
+    """
+    try:
+        return await availability_service.find_meeting_slots(
+            username=current_user,
+            **request.dict()
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except GraphError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -72,28 +217,38 @@ async def create_event(
     Create a new calendar event
     """
     try:
-        created_event = await exchange_client.create_calendar_event(
+        created_event = await calendar_service.create_calendar_event(
             username=current_user,
             event=event.dict()
         )
         return created_event
+    except GraphError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/events/{event_id}", response_model=EventResponse)
 async def get_event(
     event_id: str,
+    request: Request,
+    response: Response,
     current_user: str = Depends(get_current_user)
 ):
     """
     Get details of a specific calendar event
     """
     try:
-        event = await exchange_client.get_calendar_event(
+        event = await calendar_service.get_calendar_event(
             username=current_user,
             event_id=event_id
         )
+        etag = version_etag([event], "modified_time")
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        response.headers.update(cache_headers(etag))
         return event
+    except GraphError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -107,12 +262,14 @@ async def update_event(
     Update an existing calendar event
     """
     try:
-        updated_event = await exchange_client.update_calendar_event(
+        updated_event = await calendar_service.update_calendar_event(
             username=current_user,
             event_id=event_id,
             event=event.dict()
         )
         return updated_event
+    except GraphError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -125,10 +282,12 @@ async def delete_event(
     Delete a calendar event
     """
     try:
-        await exchange_client.delete_calendar_event(
+        await calendar_service.delete_calendar_event(
             username=current_user,
             event_id=event_id
         )
         return {"status": "success", "message": "Event deleted successfully"}
+    except GraphError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,12 +1,18 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.security import OAuth2PasswordBearer
-from ...core.security import auth_service
-from ...services.exchange.client import exchange_client
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from ..deps import get_current_user
+from ...core.config import settings
+from ...core.responses import (
+    FastJSONResponse, cache_headers, content_etag, etag_matches, fast_json_enabled,
+    not_modified, version_etag
+)
+from ...services.exchange.contacts import contacts_service
+from ...services.exchange.directory import contact_directory
+from ...services.exchange.scheduler import GraphError
 from pydantic import BaseModel, EmailStr
+from datetime import datetime
 
 router = APIRouter(prefix="/contacts", tags=["contacts"])
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 class PhoneNumber(BaseModel):
     type: str  # business, home, mobile
@@ -40,18 +46,18 @@ class ContactResponse(ContactBase):
     created_time: datetime
     modified_time: datetime
 
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> str:
-    username = await auth_service.verify_token(token)
-    if not username:
-        raise HTTPException(
-            status_code=401,
-            detail="Invalid authentication credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    return username
+class ContactSuggestion(BaseModel):
+    id: str
+    display_name: str
+    given_name: Optional[str]
+    surname: Optional[str]
+    email_addresses: List[str]
+    score: int
 
 @router.get("/contacts", response_model=List[ContactResponse])
 async def get_contacts(
+    request: Request,
+    response: Response,
     folder_id: Optional[str] = None,
     search_query: Optional[str] = None,
     page_size: int = 50,
@@ -62,14 +68,49 @@ async def get_contacts(
     Get contacts with optional filtering and pagination
     """
     try:
-        contacts = await exchange_client.get_contacts(
+        contacts = await contacts_service.get_contacts(
             username=current_user,
             folder_id=folder_id,
             search_query=search_query,
             page_size=page_size,
             page_token=page_token
         )
+        etag = version_etag(contacts, "modified_time")
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        if fast_json_enabled("contacts.get_contacts"):
+            return FastJSONResponse(contacts, headers=cache_headers(etag))
+        response.headers.update(cache_headers(etag))
         return contacts
+    except GraphError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/contacts/suggest", response_model=List[ContactSuggestion])
+async def suggest_contacts(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=settings.CONTACTS_SUGGEST_MAX_RESULTS),
+    current_user: str = Depends(get_current_user)
+):
+    """
+    Typeahead suggestions matching name or email prefixes, best matches first
+    """
+    try:
+        suggestions = await contact_directory.suggest(
+            username=current_user,
+            query=q,
+            limit=limit
+        )
+        etag = content_etag(suggestions)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        response.headers.update(cache_headers(etag))
+        return suggestions
+    except GraphError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -82,28 +123,38 @@ async def create_contact(
     Create a new contact
     """
     try:
-        created_contact = await exchange_client.create_contact(
+        created_contact = await contacts_service.create_contact(
             username=current_user,
             contact=contact.dict()
         )
         return created_contact
+    except GraphError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/contacts/{contact_id}", response_model=ContactResponse)
 async def get_contact(
     contact_id: str,
+    request: Request,
+    response: Response,
     current_user: str = Depends(get_current_user)
 ):
     """
     Get details of a specific contact
     """
     try:
-        contact = await exchange_client.get_contact(
+        contact = await contacts_service.get_contact(
             username=current_user,
             contact_id=contact_id
         )
+        etag = version_etag([contact], "modified_time")
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        response.headers.update(cache_headers(etag))
         return contact
+    except GraphError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -117,12 +168,14 @@ async def update_contact(
     Update an existing contact
     """
     try:
-        updated_contact = await exchange_client.update_contact(
+        updated_contact = await contacts_service.update_contact(
             username=current_user,
             contact_id=contact_id,
             contact=contact.dict()
         )
         return updated_contact
+    except GraphError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -135,10 +188,12 @@ async def delete_contact(
     Delete a contact
     """
     try:
-        await exchange_client.delete_contact(
+        await contacts_service.delete_contact(
             username=current_user,
             contact_id=contact_id
         )
         return {"status": "success", "message": "Contact deleted successfully"}
+    except GraphError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,12 +1,26 @@
-from typing import Optional, List
-from fastapi import APIRouter, Depends, HTTPException, Security
-from fastapi.security import OAuth2PasswordBearer
-from ...core.security import auth_service
+import base64
+import binascii
+import json
+import os
+import zlib
+from typing import AsyncIterator, Optional, List
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Request, Response, UploadFile
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from ...core.config import settings
+from ...core.responses import (
+    FastJSONResponse, cache_headers, content_etag, etag_matches, fast_json_enabled,
+    not_modified, version_etag
+)
+from ..deps import get_current_user
 from ...services.exchange.client import exchange_client
-from pydantic import BaseModel, EmailStr
+from ...services.exchange.scheduler import GraphError
+from pydantic import BaseModel, EmailStr, Field
 
 router = APIRouter(prefix="/mail", tags=["mail"])
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+# Response header carrying the page_token of the next page of messages
+NEXT_PAGE_HEADER = "X-Next-Page-Token"
 
 class MessageResponse(BaseModel):
     id: str
@@ -27,60 +41,152 @@ class MessageDetailResponse(BaseModel):
     body: str
     attachments: List[dict]
 
+class BulkMessageRequest(BaseModel):
+    ids: List[str] = Field(..., min_items=1, max_items=settings.MAIL_BULK_MAX_IDS)
+
+class AttachmentUpload(BaseModel):
+    name: str
+    content_type: str = "application/octet-stream"
+    content_bytes: str  # base64
+
 class SendMessageRequest(BaseModel):
     subject: str
     body: str
     to_recipients: List[EmailStr]
     cc_recipients: Optional[List[EmailStr]] = None
     bcc_recipients: Optional[List[EmailStr]] = None
+    attachments: Optional[List[AttachmentUpload]] = None
 
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> str:
-    username = await auth_service.verify_token(token)
-    if not username:
-        raise HTTPException(
-            status_code=401,
-            detail="Invalid authentication credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    return username
+def _format_message(msg: dict) -> dict:
+    """Map a Graph message to the MessageResponse fields"""
+    return {
+        "id": msg["id"],
+        "subject": msg["subject"],
+        "from_address": msg["from"]["emailAddress"]["address"],
+        "to_addresses": [r["emailAddress"]["address"] for r in msg["toRecipients"]],
+        "date": msg["receivedDateTime"],
+        "has_attachments": msg["hasAttachments"],
+        "preview": msg.get("bodyPreview")
+    }
 
 @router.get("/messages", response_model=List[MessageResponse])
 async def get_messages(
+    request: Request,
+    response: Response,
     folder: str = "inbox",
     page_size: int = 50,
     page_token: Optional[str] = None,
+    search: Optional[str] = None,
     current_user: str = Depends(get_current_user)
 ):
     """
-    Retrieve messages from the specified folder
+    Retrieve messages from the specified folder, or search them by relevance
+    when a search query is given. The token for the next page, if any, is
+    returned in the X-Next-Page-Token header.
     """
     try:
-        result = await exchange_client.get_messages(
-            username=current_user,
-            folder=folder,
-            page_size=page_size,
-            page_token=page_token
-        )
+        if search:
+            result = await exchange_client.search_messages(
+                username=current_user,
+                query=search,
+                folder=folder,
+                page_size=page_size,
+                page_token=page_token
+            )
+        else:
+            result = await exchange_client.get_messages(
+                username=current_user,
+                folder=folder,
+                page_size=page_size,
+                page_token=page_token
+            )
         
-        messages = []
-        for msg in result["messages"]:
-            messages.append(MessageResponse(
-                id=msg["id"],
-                subject=msg["subject"],
-                from_address=msg["from"]["emailAddress"]["address"],
-                to_addresses=[r["emailAddress"]["address"] for r in msg["toRecipients"]],
-                date=msg["receivedDateTime"],
-                has_attachments=msg["hasAttachments"],
-                preview=msg.get("bodyPreview")
-            ))
-            
+        etag = version_etag(result["messages"], "changeKey")
+        headers = cache_headers(etag)
+        if result["nextPageToken"]:
+            headers[NEXT_PAGE_HEADER] = result["nextPageToken"]
+        if etag_matches(request, etag):
+            response = not_modified(etag)
+            response.headers.update(headers)
+            return response
+        messages = [_format_message(msg) for msg in result["messages"]]
+        if fast_json_enabled("mail.get_messages"):
+            return FastJSONResponse(messages, headers=headers)
+        response.headers.update(headers)
         return messages
+    except GraphError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/folders/{folder}/export")
+async def export_folder(
+    folder: str,
+    compress: bool = False,
+    current_user: str = Depends(get_current_user)
+):
+    """
+    Export every message in a folder as NDJSON, optionally gzip-compressed.
+    Pages are streamed as they arrive so memory use does not grow with folder size.
+    """
+    pages = exchange_client.iter_folder_pages(
+        username=current_user,
+        folder=folder,
+        page_size=settings.MAIL_EXPORT_PAGE_SIZE
+    )
+    # Fetch the first page up front so upstream failures return a 500
+    try:
+        first_page = await pages.__anext__()
+    except StopAsyncIteration:
+        first_page = []
+    except GraphError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    body = _encode_pages(first_page, pages)
+    filename = f"{folder}.ndjson"
+    media_type = "application/x-ndjson"
+    if compress:
+        body = _gzip_stream(body)
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+async def _encode_pages(
+    first_page: List[dict],
+    pages: AsyncIterator[List[dict]]
+) -> AsyncIterator[bytes]:
+    """Encode each page of Graph messages as one block of NDJSON lines"""
+    page = first_page
+    while True:
+        if page:
+            yield b"".join(
+                json.dumps(_format_message(msg)).encode() + b"\n" for msg in page
+            )
+        try:
+            page = await pages.__anext__()
+        except StopAsyncIteration:
+            return
+
+async def _gzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Gzip-compress a byte stream incrementally"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
 @router.get("/messages/{message_id}", response_model=MessageDetailResponse)
 async def get_message_detail(
     message_id: str,
+    request: Request,
+    response: Response,
     current_user: str = Depends(get_current_user)
 ):
     """
@@ -91,9 +197,41 @@ async def get_message_detail(
             username=current_user,
             message_id=message_id
         )
+        etag = content_etag(message)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        response.headers.update(cache_headers(etag))
         return MessageDetailResponse(**message)
+    except GraphError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/messages/bulk")
+async def get_message_details_bulk(
+    request: BulkMessageRequest,
+    current_user: str = Depends(get_current_user)
+):
+    """
+    Get details for many messages at once, streamed as NDJSON a batch of
+    MAIL_BULK_CHUNK_SIZE ids at a time, in the order batches complete. Each
+    line holds either "message" or "error" for one id.
+    """
+    try:
+        results = await exchange_client.get_message_details(
+            username=current_user,
+            message_ids=list(dict.fromkeys(request.ids))
+        )
+    except GraphError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return StreamingResponse(_stream_ndjson(results), media_type="application/x-ndjson")
+
+async def _stream_ndjson(items: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    """Encode items as newline-delimited JSON"""
+    async for item in items:
+        yield json.dumps(jsonable_encoder(item)).encode() + b"\n"
 
 @router.post("/messages/send")
 async def send_message(
@@ -103,6 +241,19 @@ async def send_message(
     """
     Send a new email message
     """
+    attachments = []
+    for attachment in message.attachments or []:
+        try:
+            content = base64.b64decode(attachment.content_bytes, validate=True)
+        except binascii.Error:
+            raise HTTPException(status_code=422, detail=f"Invalid base64 content for {attachment.name}")
+        attachments.append({
+            "name": attachment.name,
+            "content_type": attachment.content_type,
+            "size": len(content),
+            "content": content
+        })
+
     try:
         result = await exchange_client.send_message(
             username=current_user,
@@ -110,8 +261,53 @@ async def send_message(
             body=message.body,
             to_recipients=[str(r) for r in message.to_recipients],
             cc_recipients=[str(r) for r in message.cc_recipients] if message.cc_recipients else None,
-            bcc_recipients=[str(r) for r in message.bcc_recipients] if message.bcc_recipients else None
+            bcc_recipients=[str(r) for r in message.bcc_recipients] if message.bcc_recipients else None,
+            attachments=attachments
+        )
+        return {"status": "success", "message": result}
+    except GraphError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/messages/send/multipart")
+async def send_message_multipart(
+    subject: str = Form(...),
+    body: str = Form(...),
+    to_recipients: List[EmailStr] = Form(...),
+    cc_recipients: Optional[List[EmailStr]] = Form(None),
+    bcc_recipients: Optional[List[EmailStr]] = Form(None),
+    files: Optional[List[UploadFile]] = File(None),
+    current_user: str = Depends(get_current_user)
+):
+    """
+    Send a new email message with files uploaded as multipart form data.
+    Files are read chunk by chunk from their spooled uploads, never whole.
+    """
+    attachments = []
+    for upload in files or []:
+        upload.file.seek(0, os.SEEK_END)
+        size = upload.file.tell()
+        upload.file.seek(0)
+        attachments.append({
+            "name": upload.filename,
+            "content_type": upload.content_type or "application/octet-stream",
+            "size": size,
+            "file": upload
+        })
+
+    try:
+        result = await exchange_client.send_message(
+            username=current_user,
+            subject=subject,
+            body=body,
+            to_recipients=[str(r) for r in to_recipients],
+            cc_recipients=[str(r) for r in cc_recipients] if cc_recipients else None,
+            bcc_recipients=[str(r) for r in bcc_recipients] if bcc_recipients else None,
+            attachments=attachments
         )
         return {"status": "success", "message": result}
+    except GraphError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,77 @@
+import asyncio
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse
+from ..deps import get_current_user
+from ...services.notifications.subscriptions import subscription_manager
+from ...services.exchange.scheduler import GraphError
+from pydantic import BaseModel
+from datetime import datetime
+
+router = APIRouter(prefix="/notifications", tags=["notifications"])
+
+class SubscriptionResponse(BaseModel):
+    id: str
+    resource: str
+    expires_at: datetime
+
+@router.post("/webhook")
+async def receive_notifications(request: Request, validationToken: Optional[str] = None):
+    """
+    Receive Graph change and lifecycle notifications.
+
+    Graph validates the endpoint by posting a validationToken that has to be
+    echoed back as plain text. Notifications are acknowledged immediately and
+    processed in the background, since Graph expects a reply within seconds.
+    """
+    if validationToken is not None:
+        return PlainTextResponse(validationToken)
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid notification payload")
+
+    future = asyncio.ensure_future(
+        subscription_manager.handle_notifications(payload.get("value", []))
+    )
+    future.add_done_callback(_report_error)
+    return Response(status_code=202)
+
+def _report_error(future: asyncio.Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Error processing notifications: {future.exception()}")
+
+@router.get("/subscriptions", response_model=List[SubscriptionResponse])
+async def get_subscriptions(current_user: str = Depends(get_current_user)):
+    """
+    List the change subscriptions of the current mailbox
+    """
+    return subscription_manager.list_subscriptions(current_user)
+
+@router.post("/subscriptions", response_model=List[SubscriptionResponse])
+async def create_subscriptions(current_user: str = Depends(get_current_user)):
+    """
+    Subscribe the current mailbox to change notifications, so its cached
+    data is refreshed on change instead of by polling
+    """
+    try:
+        return await subscription_manager.subscribe(current_user)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except GraphError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/subscriptions")
+async def delete_subscriptions(current_user: str = Depends(get_current_user)):
+    """
+    Remove the change subscriptions of the current mailbox
+    """
+    try:
+        await subscription_manager.unsubscribe(current_user)
+        return {"status": "success", "message": "Subscriptions deleted successfully"}
+    except GraphError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -15,16 +15,187 @@ class Settings(BaseSettings):
     # Exchange Settings
     EXCHANGE_SERVER: str
     EXCHANGE_VERSION: str = "Exchange2019"
-    
+    EWS_MAX_WORKERS: int = 16
+    EWS_ACCOUNT_POOL_SIZE: int = 256
+    EWS_ACCOUNT_TTL_SECONDS: int = 1800
+    EWS_RETRY_MAX_WAIT: int = 60
+
+    # Mail Settings
+    MAIL_BULK_MAX_IDS: int = 300
+    MAIL_BULK_CHUNK_SIZE: int = 25
+    MAIL_BULK_CONCURRENCY: int = 4
+    MAIL_EXPORT_PAGE_SIZE: int = 250
+    MAIL_INLINE_ATTACHMENT_MAX_BYTES: int = 3 * 1024 ** 2
+    # Upload session chunks must be a multiple of 320 KiB and at most 4 MiB
+    MAIL_UPLOAD_CHUNK_SIZE: int = 10 * 320 * 1024
+    MAIL_UPLOAD_CONCURRENCY: int = 4
+
+    # Mail Prefetch Settings (after a page is served, fetch the next page and
+    # the first unread message details in the background)
+    MAIL_PREFETCH_ENABLED: bool = False
+    MAIL_PREFETCH_UNREAD_DETAILS: int = 5
+    MAIL_PREFETCH_CONCURRENCY: int = 4
+    MAIL_PREFETCH_TTL_SECONDS: int = 60
+    MAIL_PREFETCH_MAX_ENTRIES: int = 5000
+
+    # Search Index Settings
+    SEARCH_INDEX_DIR: str = "data/search"
+    SEARCH_INDEX_MAX_OPEN: int = 64
+
+    # Attachment Cache Settings
+    ATTACHMENT_CACHE_DIR: str = "data/attachments"
+    ATTACHMENT_CACHE_MAX_BYTES: int = 2 * 1024 ** 3
+    ATTACHMENT_CACHE_MAX_FILE_BYTES: int = 200 * 1024 ** 2
+    ATTACHMENT_CHUNK_SIZE: int = 64 * 1024
+
+    # Graph HTTP Transport Settings
+    GRAPH_BASE_URL: str = "https://graph.microsoft.com/v1.0"
+    GRAPH_POOL_LIMIT: int = 100
+    GRAPH_POOL_LIMIT_PER_HOST: int = 50
+    GRAPH_KEEPALIVE_TIMEOUT: float = 60.0
+    GRAPH_DNS_CACHE_TTL: int = 300
+    GRAPH_REQUEST_TIMEOUT: float = 30.0
+    GRAPH_WARMUP_CONNECTIONS: int = 4
+    GRAPH_BATCH_ENABLED: bool = True
+    GRAPH_BATCH_WINDOW_MS: int = 5
+
+    # Graph Throttling Settings (Outlook allows 4 concurrent and 10,000
+    # requests per 10 minutes per mailbox)
+    GRAPH_MAILBOX_CONCURRENCY: int = 4
+    GRAPH_MAILBOX_RATE_PER_SECOND: float = 16.0
+    GRAPH_MAILBOX_BURST: int = 100
+    GRAPH_MAX_RETRIES: int = 4
+    GRAPH_RETRY_BASE_DELAY: float = 0.5
+    GRAPH_RETRY_MAX_DELAY: float = 30.0
+    GRAPH_MAX_RETRY_AFTER: float = 60.0
+    GRAPH_SCHEDULER_MAX_MAILBOXES: int = 10000
+
+    # Hedged Request Settings
+    GRAPH_HEDGING_ENABLED: bool = False
+    GRAPH_HEDGE_PERCENTILE: float = 0.95
+    GRAPH_HEDGE_SAMPLE_SIZE: int = 200
+    GRAPH_HEDGE_MIN_SAMPLES: int = 20
+    GRAPH_HEDGE_MIN_DELAY_MS: int = 50
+    GRAPH_HEDGE_MAX_DELAY_MS: int = 2000
+    GRAPH_HEDGE_MAX_RATIO: float = 0.1
+
+    # Circuit Breaker Settings
+    CIRCUIT_BREAKER_ENABLED: bool = True
+    CIRCUIT_WINDOW_SECONDS: int = 30
+    CIRCUIT_MIN_REQUESTS: int = 20
+    CIRCUIT_ERROR_THRESHOLD: float = 0.5
+    CIRCUIT_OPEN_SECONDS: int = 30
+    CIRCUIT_FALLBACK_MAX_ENTRIES: int = 1000
+    CIRCUIT_FALLBACK_MAX_AGE_SECONDS: int = 900
+
+    # Read Coalescing Settings (identical concurrent list reads share one
+    # upstream call; stale-while-revalidate is opt-in)
+    READ_COALESCING_ENABLED: bool = True
+    READ_STALE_WHILE_REVALIDATE: bool = False
+    READ_FRESH_SECONDS: int = 5  # cached reads younger than this are not refreshed
+    READ_MAX_STALE_MESSAGES_SECONDS: int = 30
+    READ_MAX_STALE_EVENTS_SECONDS: int = 120
+    READ_MAX_STALE_CONTACTS_SECONDS: int = 300
+    READ_CACHE_MAX_ENTRIES: int = 2000
+
+    # Calendar Settings
+    CALENDAR_VIEW_WINDOW_DAYS: int = 7
+    CALENDAR_VIEW_CONCURRENCY: int = 4
+    CALENDAR_VIEW_PAGE_SIZE: int = 100
+    # Tag GET /calendar/events with an ETag. The whole range is then collected
+    # before responding instead of streamed, so it is off by default.
+    CALENDAR_EVENTS_ETAG_ENABLED: bool = False
+
+    # Free/Busy Settings
+    FREEBUSY_WINDOW_DAYS: int = 7
+    FREEBUSY_MAX_RANGE_DAYS: int = 90
+    FREEBUSY_MAX_ATTENDEES: int = 100
+    FREEBUSY_CONCURRENCY: int = 4
+    FREEBUSY_CACHE_TTL_SECONDS: int = 300
+    FREEBUSY_CACHE_MAX_ENTRIES: int = 20000
+
+    # Contact Directory Settings
+    CONTACTS_DIRECTORY_REFRESH_SECONDS: int = 300
+    CONTACTS_DIRECTORY_MAX_USERS: int = 1000
+    CONTACTS_SUGGEST_MAX_RESULTS: int = 25
+
+    # Mailbox Mirror Settings
+    MAIL_MIRROR_ENABLED: bool = False
+    MAIL_MIRROR_DB_PATH: str = "data/mail_mirror.db"
+    MAIL_MIRROR_MAX_AGE_SECONDS: int = 60
+    MAIL_MIRROR_PAGE_SIZE: int = 200
+
+    # Change Notification Settings
+    NOTIFICATIONS_ENABLED: bool = False
+    NOTIFICATIONS_WEBHOOK_URL: str = ""  # Public https URL of /api/v1/notifications/webhook
+    NOTIFICATIONS_RESOURCES: list = ["messages", "events", "contacts"]
+    NOTIFICATIONS_SUBSCRIPTION_MINUTES: int = 4200  # Graph allows at most 4230 for Outlook resources
+    NOTIFICATIONS_RENEW_INTERVAL_SECONDS: int = 300
+    NOTIFICATIONS_RENEW_MARGIN_SECONDS: int = 3600
+    NOTIFICATIONS_FALLBACK_MAX_AGE_SECONDS: int = 3600
+    # "redis" shares subscriptions and change events between worker processes
+    NOTIFICATIONS_BACKEND: str = "memory"  # memory or redis
+    NOTIFICATIONS_REDIS_PREFIX: str = "notifications"
+
+    # Monitoring Settings
+    METRICS_ENABLED: bool = True
+    TRACING_ENABLED: bool = False
+    TRACING_EXPORTER: str = "otlp"  # otlp or console
+    TRACING_OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"
+    TRACING_SERVICE_NAME: str = "exchange-crm-backend"
+    TRACING_SAMPLE_RATIO: float = 1.0
+
+    # Server Settings (production entrypoint: gunicorn -c gunicorn.conf.py)
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    # Worker processes; the per-mailbox Graph limits are split between them
+    SERVER_WORKERS: int = 1
+    SERVER_GRACEFUL_TIMEOUT: int = 30  # seconds to drain in-flight requests on shutdown
+    SERVER_KEEPALIVE: int = 5
+
     # Redis Settings
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
     REDIS_PASSWORD: Optional[str] = None
+
+    # Graph Payload Cache Settings (per-process L1 in front of Redis)
+    CACHE_ENABLED: bool = False
+    CACHE_BACKEND: str = "memory"  # memory or redis
+    CACHE_KEY_PREFIX: str = "graph"
+    CACHE_L1_MAX_BYTES: int = 64 * 1024 ** 2
+    # With Redis, bounds how long another worker's invalidation can go unseen
+    CACHE_L1_TTL_SECONDS: int = 10
+    CACHE_COMPRESS_MIN_BYTES: int = 1024
+    CACHE_COMPRESS_LEVEL: int = 1
+    CACHE_TTL_MESSAGES_SECONDS: int = 60
+    CACHE_TTL_EVENTS_SECONDS: int = 300
+    CACHE_TTL_CONTACTS_SECONDS: int = 900
+
+    # Token Cache Settings
+    TOKEN_REFRESH_MARGIN_SECONDS: int = 300
+    TOKEN_CACHE_BACKEND: str = "memory"  # memory or redis
+    TOKEN_CACHE_REDIS_KEY: str = "msal:token_cache"
     
     # Security
     SECRET_KEY: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Cap on custom token lifetimes; revocations are kept this long
+    ACCESS_TOKEN_MAX_EXPIRE_MINUTES: int = 24 * 60
     ALGORITHM: str = "HS256"
+    TOKEN_VERIFY_CACHE_MAX_ENTRIES: int = 10000  # verified API tokens kept in memory; 0 disables
+    # Revoked API tokens are shared through Redis when TOKEN_CACHE_BACKEND is "redis"
+    TOKEN_REVOCATION_REDIS_PREFIX: str = "auth:revoked"
+    
+    # Response Settings
+    # Routes ("<router>.<endpoint>") that encode with orjson and skip response_model validation
+    FAST_JSON_ROUTES: list = ["mail.get_messages", "calendar.get_events", "contacts.get_contacts"]
+    # Strong ETags on GET list and detail routes, answering If-None-Match with 304
+    # (the calendar events range also needs CALENDAR_EVENTS_ETAG_ENABLED)
+    ETAG_ENABLED: bool = True
+    # Gzip JSON/NDJSON bodies of at least this size for clients that accept it
+    GZIP_ENABLED: bool = True
+    GZIP_MIN_BYTES: int = 1024
+    GZIP_LEVEL: int = 5
     
     # CORS
     BACKEND_CORS_ORIGINS: list = ["http://localhost:3000"]  # Frontend URL
@@ -0,0 +1,158 @@
+import hashlib
+import zlib
+from typing import Any, Dict, List, Optional
+import orjson
+from fastapi.encoders import jsonable_encoder
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+from .config import settings
+
+# Response types worth compressing; downloads and exports set their own types
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+def _default(value: Any) -> Any:
+    # orjson handles dicts, lists, str/int/float and datetimes natively;
+    # anything else (pydantic models, sets, ...) goes through FastAPI's encoder
+    return jsonable_encoder(value)
+
+def dumps(content: Any) -> bytes:
+    """Encode content as JSON bytes with orjson"""
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+class FastJSONResponse(Response):
+    """
+    JSON response encoded with orjson. Returning it from a route skips
+    response_model validation, so the content must already match the
+    documented shape.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def fast_json_enabled(route: str) -> bool:
+    """Whether a route ("mail.get_messages") uses the fast response path"""
+    return route in settings.FAST_JSON_ROUTES
+
+def _etag(value: Any) -> str:
+    return '"' + hashlib.sha1(dumps(value)).hexdigest() + '"'
+
+def content_etag(content: Any) -> Optional[str]:
+    """Strong ETag hashing the formatted content, or None if ETags are disabled"""
+    if not settings.ETAG_ENABLED:
+        return None
+    return _etag(content)
+
+def version_etag(items: List[Dict[str, Any]], version_field: str) -> Optional[str]:
+    """
+    Strong ETag for items from each one's id and version field (changeKey,
+    modified_time), so the body need not be encoded to compute it. Falls
+    back to hashing the items when any lacks a version.
+    """
+    if not settings.ETAG_ENABLED:
+        return None
+    if all(version_field in item for item in items):
+        return _etag([(item["id"], item[version_field]) for item in items])
+    return _etag(items)
+
+def etag_matches(request: Request, etag: Optional[str]) -> bool:
+    """Whether the request's If-None-Match already names etag"""
+    header = request.headers.get("if-none-match")
+    if etag is None or header is None:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    tags = [tag.strip() for tag in header.split(",")]
+    return etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+
+def cache_headers(etag: Optional[str]) -> Dict[str, str]:
+    """Headers letting clients revalidate with If-None-Match on every use"""
+    if etag is None:
+        return {}
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag))
+
+class CompressionMiddleware:
+    """
+    ASGI middleware gzipping JSON and NDJSON responses for clients that
+    accept it. Bodies under minimum_size, partial content, binary downloads
+    and already-compressed exports pass through untouched. Streamed bodies
+    are flushed per chunk so they still arrive incrementally.
+
+    ETags are computed on the uncompressed content, so a compressed
+    response, and a 304 to a client that accepts gzip, carries them as weak
+    validators.
+    """
+
+    def __init__(self, app: Any, minimum_size: int, level: int):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or "gzip" not in Headers(scope=scope).get("accept-encoding", ""):
+            await self.app(scope, receive, send)
+            return
+
+        state: Dict[str, Any] = {"start": None, "compressor": None}
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows whether to compress
+                state["start"] = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            start = state["start"]
+            if start is not None:
+                state["start"] = None
+                headers = MutableHeaders(raw=start["headers"])
+                if start["status"] == 304:
+                    self._vary(headers)
+                if not self._compressible(start["status"], headers, body, more_body):
+                    await send(start)
+                    await send(message)
+                    return
+                state["compressor"] = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+                body = self._compress(state["compressor"], body, more_body)
+                headers["Content-Encoding"] = "gzip"
+                self._vary(headers)
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(len(body))
+                await send(start)
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+                return
+
+            if state["compressor"] is not None:
+                body = self._compress(state["compressor"], body, more_body)
+                message = {"type": "http.response.body", "body": body, "more_body": more_body}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _vary(self, headers: MutableHeaders) -> None:
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("etag")
+        if etag is not None and not etag.startswith("W/"):
+            headers["ETag"] = "W/" + etag
+
+    def _compressible(self, status: int, headers: MutableHeaders, body: bytes, more_body: bool) -> bool:
+        if status != 200 or "content-encoding" in headers:
+            return False
+        if not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES):
+            return False
+        return more_body or len(body) >= self.minimum_size
+
+    def _compress(self, compressor: Any, body: bytes, more_body: bool) -> bytes:
+        data = compressor.compress(body)
+        return data + compressor.flush(zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH)
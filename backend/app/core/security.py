@@ -1,15 +1,31 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Any, Optional
+from typing import Any, Dict, Optional, Tuple
 from jose import JWTError, jwt
-from msal import ConfidentialClientApplication
+from msal import ConfidentialClientApplication, SerializableTokenCache
+import redis
+import redis.asyncio
 from .config import settings
+from .telemetry import TOKEN_ACQUISITION_SECONDS, record_cache, tracer
+
+# After a Redis error, check only this worker's revocations for this long
+REDIS_RETRY_SECONDS = 5
+
+# Expired revocations are dropped at most this often while verifying
+REVOCATION_PRUNE_INTERVAL_SECONDS = 60
 
 class AuthService:
     def __init__(self):
+        self.token_cache = SerializableTokenCache()
         self.msal_app = ConfidentialClientApplication(
             client_id=settings.AZURE_AD_CLIENT_ID,
             client_credential=settings.AZURE_AD_CLIENT_SECRET,
-            authority=f"https://login.microsoftonline.com/{settings.AZURE_AD_TENANT_ID}"
+            authority=f"https://login.microsoftonline.com/{settings.AZURE_AD_TENANT_ID}",
+            token_cache=self.token_cache
         )
         
         self.scopes = [
@@ -18,22 +34,115 @@ class AuthService:
             "https://graph.microsoft.com/Mail.Send",
             "https://graph.microsoft.com/Calendars.ReadWrite"
         ]
+
+        # Client credentials tokens are per application, not per user, so a
+        # single entry keyed by scope set serves every mailbox.
+        self._cache_key = " ".join(sorted(self.scopes))
+        self._tokens: Dict[str, Tuple[str, float]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._msal_lock = threading.Lock()
+        # Verified API tokens: digest -> (username, exp, iat)
+        self._verified: "OrderedDict[str, Tuple[str, float, float]]" = OrderedDict()
+        # Revoked token digests -> exp, and per-user cut-offs for tokens issued earlier
+        self._revoked: Dict[str, float] = {}
+        self._revoked_before: Dict[str, float] = {}
+        self._revocations_pruned_at = 0.0
+        self._redis: Optional[redis.Redis] = None
+        # Revocations are shared between workers and checked on every request,
+        # so through an asyncio client rather than the MSAL cache's blocking one
+        self._revocation_redis: Optional[redis.asyncio.Redis] = None
+        self._revocation_redis_down_until = 0.0
+        if settings.TOKEN_CACHE_BACKEND == "redis":
+            self._redis = redis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                password=settings.REDIS_PASSWORD
+            )
+            self._revocation_redis = redis.asyncio.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                password=settings.REDIS_PASSWORD
+            )
     
     async def get_access_token(self, username: str) -> Optional[str]:
         """
-        Get access token for Exchange access using client credentials flow
+        Get access token for Exchange access using client credentials flow.
+
+        Tokens are served from an in-process cache and refreshed in the
+        background once they come within TOKEN_REFRESH_MARGIN_SECONDS of
+        expiry. Concurrent callers share a single acquisition.
         """
+        cached = self._tokens.get(self._cache_key)
+        if cached:
+            token, expires_at = cached
+            remaining = expires_at - time.time()
+            if remaining > 0:
+                record_cache("access_token", True)
+                if remaining <= settings.TOKEN_REFRESH_MARGIN_SECONDS:
+                    self._refresh_token()
+                return token
+        record_cache("access_token", False)
+
         try:
-            result = self.msal_app.acquire_token_silent(self.scopes, account=username)
-            if not result:
-                result = self.msal_app.acquire_token_for_client(scopes=self.scopes)
-            
-            if "access_token" in result:
-                return result["access_token"]
+            return await self._refresh_token()
+        except Exception:
+            # Already reported by _acquisition_done
             return None
-        except Exception as e:
-            print(f"Error getting access token: {e}")
+
+    def _refresh_token(self) -> asyncio.Future:
+        """Start a token acquisition, or join the one already in flight"""
+        future = self._inflight.get(self._cache_key)
+        if future is None:
+            future = asyncio.ensure_future(self._acquire_token())
+            self._inflight[self._cache_key] = future
+            future.add_done_callback(self._acquisition_done)
+        return future
+
+    def _acquisition_done(self, future: asyncio.Future) -> None:
+        self._inflight.pop(self._cache_key, None)
+        # Background refreshes have no awaiter, so errors are reported here
+        # rather than surfacing as unretrieved task exceptions.
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Error getting access token: {future.exception()}")
+
+    async def _acquire_token(self) -> Optional[str]:
+        loop = asyncio.get_event_loop()
+        started = time.monotonic()
+        with tracer.start_as_current_span("AuthService acquire token"):
+            try:
+                result = await loop.run_in_executor(None, self._acquire_token_sync)
+            except Exception:
+                TOKEN_ACQUISITION_SECONDS.labels("error").observe(time.monotonic() - started)
+                raise
+        acquired = "access_token" in result
+        TOKEN_ACQUISITION_SECONDS.labels("ok" if acquired else "failed").observe(time.monotonic() - started)
+        if not acquired:
             return None
+        expires_at = time.time() + int(result.get("expires_in", 0))
+        self._tokens[self._cache_key] = (result["access_token"], expires_at)
+        return result["access_token"]
+
+    def _acquire_token_sync(self) -> Dict[str, Any]:
+        """Run the blocking MSAL calls; executed on a worker thread"""
+        with self._msal_lock:
+            self._load_shared_cache()
+            result = self.msal_app.acquire_token_silent(self.scopes, account=None)
+            if not result:
+                result = self.msal_app.acquire_token_for_client(scopes=self.scopes)
+            self._save_shared_cache()
+            return result
+
+    def _load_shared_cache(self) -> None:
+        if self._redis is None:
+            return
+        data = self._redis.get(settings.TOKEN_CACHE_REDIS_KEY)
+        if data:
+            self.token_cache.deserialize(data.decode("utf-8"))
+
+    def _save_shared_cache(self) -> None:
+        if self._redis is None or not self.token_cache.has_state_changed:
+            return
+        self._redis.set(settings.TOKEN_CACHE_REDIS_KEY, self.token_cache.serialize())
 
     async def create_access_token(
         self,
@@ -41,16 +150,20 @@ class AuthService:
         expires_delta: Optional[timedelta] = None
     ) -> str:
         """
-        Create JWT access token for internal API authentication
+        Create JWT access token for internal API authentication. Custom
+        lifetimes are capped at ACCESS_TOKEN_MAX_EXPIRE_MINUTES so that
+        revocations can expire too.
         """
         if expires_delta:
-            expire = datetime.utcnow() + expires_delta
+            expire = datetime.utcnow() + min(
+                expires_delta, timedelta(seconds=self._max_token_lifetime())
+            )
         else:
             expire = datetime.utcnow() + timedelta(
                 minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
             )
             
-        to_encode = {"exp": expire, "sub": str(subject)}
+        to_encode = {"exp": expire, "iat": time.time(), "sub": str(subject)}
         encoded_jwt = jwt.encode(
             to_encode,
             settings.SECRET_KEY,
@@ -60,19 +173,131 @@ class AuthService:
 
     async def verify_token(self, token: str) -> Optional[str]:
         """
-        Verify JWT token and return username
+        Verify JWT token and return username.
+
+        Verified tokens are cached by digest until their exp, so repeated
+        calls with the same token skip signature verification. Revocations
+        are checked on every call, cached or not, and with the redis
+        TOKEN_CACHE_BACKEND they apply in every worker.
         """
+        digest = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        now = time.time()
+        if now - self._revocations_pruned_at > REVOCATION_PRUNE_INTERVAL_SECONDS:
+            self._prune_revoked()
+        cached = self._verified.get(digest)
+        if cached is not None and cached[1] > now:
+            record_cache("verified_token", True)
+            self._verified.move_to_end(digest)
+            username, _, issued_at = cached
+            return None if await self._is_revoked(digest, username, issued_at) else username
+        if cached is not None:
+            del self._verified[digest]
+        record_cache("verified_token", False)
+
         try:
             payload = jwt.decode(
                 token,
                 settings.SECRET_KEY,
                 algorithms=[settings.ALGORITHM]
             )
-            username: str = payload.get("sub")
-            if username is None:
-                return None
-            return username
         except JWTError:
             return None
+        username: str = payload.get("sub")
+        if username is None:
+            return None
+        issued_at = float(payload.get("iat") or 0)
+        if await self._is_revoked(digest, username, issued_at):
+            return None
+
+        expires_at = payload.get("exp")
+        if expires_at is not None and settings.TOKEN_VERIFY_CACHE_MAX_ENTRIES > 0:
+            self._verified[digest] = (username, float(expires_at), issued_at)
+            self._verified.move_to_end(digest)
+            while len(self._verified) > settings.TOKEN_VERIFY_CACHE_MAX_ENTRIES:
+                self._verified.popitem(last=False)
+        return username
+
+    def _revoked_token_key(self, digest: str) -> str:
+        return f"{settings.TOKEN_REVOCATION_REDIS_PREFIX}:token:{digest}"
+
+    def _revoked_user_key(self, username: str) -> str:
+        return f"{settings.TOKEN_REVOCATION_REDIS_PREFIX}:user:{username}"
+
+    def _shared_revocations(self) -> bool:
+        return self._revocation_redis is not None and time.monotonic() >= self._revocation_redis_down_until
+
+    async def _is_revoked(self, digest: str, username: str, issued_at: float) -> bool:
+        if digest in self._revoked:
+            return True
+        revoked_before = self._revoked_before.get(username)
+        if self._shared_revocations():
+            try:
+                token_revoked, user_revoked_before = await self._revocation_redis.mget(
+                    self._revoked_token_key(digest), self._revoked_user_key(username)
+                )
+            except (redis.RedisError, OSError) as e:
+                print(f"Revocation check failed, using this worker's revocations for {REDIS_RETRY_SECONDS}s: {e}")
+                self._revocation_redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+            else:
+                if token_revoked is not None:
+                    return True
+                if user_revoked_before is not None:
+                    revoked_before = max(revoked_before or 0.0, float(user_revoked_before))
+        return revoked_before is not None and issued_at <= revoked_before
+
+    async def revoke_token(self, token: str) -> None:
+        """Reject a token from now on, e.g. on logout"""
+        digest = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        cached = self._verified.pop(digest, None)
+        try:
+            # Only kept until the token would have expired anyway
+            expires_at = float(jwt.get_unverified_claims(token).get("exp") or 0)
+        except JWTError:
+            return
+        if cached is None and expires_at <= time.time():
+            return
+        self._revoked[digest] = expires_at
+        self._prune_revoked()
+        if self._revocation_redis is not None:
+            try:
+                await self._revocation_redis.set(
+                    self._revoked_token_key(digest), 1, ex=max(int(expires_at - time.time()) + 1, 1)
+                )
+            except (redis.RedisError, OSError) as e:
+                raise Exception(f"Failed to revoke token: {e}")
+
+    async def revoke_user(self, username: str) -> None:
+        """Reject every token issued to a user until now"""
+        revoked_before = time.time()
+        self._revoked_before[username] = revoked_before
+        self._prune_revoked()
+        for digest in [d for d, entry in self._verified.items() if entry[0] == username]:
+            del self._verified[digest]
+        if self._revocation_redis is not None:
+            try:
+                await self._revocation_redis.set(
+                    self._revoked_user_key(username), revoked_before,
+                    ex=int(self._max_token_lifetime()) + 1
+                )
+            except (redis.RedisError, OSError) as e:
+                raise Exception(f"Failed to revoke tokens: {e}")
+
+    def _max_token_lifetime(self) -> float:
+        """Seconds the longest-lived API token stays valid"""
+        return max(settings.ACCESS_TOKEN_EXPIRE_MINUTES, settings.ACCESS_TOKEN_MAX_EXPIRE_MINUTES) * 60
+
+    def _prune_revoked(self) -> None:
+        now = time.time()
+        self._revocations_pruned_at = now
+        for digest in [d for d, expires_at in self._revoked.items() if expires_at <= now]:
+            del self._revoked[digest]
+        # A cut-off only matters while tokens issued before it can still be valid
+        horizon = now - self._max_token_lifetime()
+        for username in [u for u, cutoff in self._revoked_before.items() if cutoff < horizon]:
+            del self._revoked_before[username]
+
+    async def close(self) -> None:
+        if self._revocation_redis is not None:
+            await self._revocation_redis.close()
 
 auth_service = AuthService()
@@ -0,0 +1,9 @@
+from uvicorn.workers import UvicornWorker
+
+class ProductionWorker(UvicornWorker):
+    """
+    Gunicorn worker running the app on uvicorn with the uvloop event loop
+    and httptools HTTP parser. Fails to start rather than silently falling
+    back to asyncio and h11 if either is missing.
+    """
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools", "lifespan": "on"}
@@ -0,0 +1,156 @@
+import os
+import time
+from typing import Any, Callable, Dict, Iterable
+from fastapi import FastAPI, Response
+from opentelemetry import trace
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+from prometheus_client.core import GaugeMetricFamily
+from starlette.routing import Match
+from .config import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "API request latency by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    "upstream_request_duration_seconds",
+    "Latency of single Graph HTTP attempts and EWS operations",
+    ["service", "endpoint"],
+    buckets=LATENCY_BUCKETS
+)
+UPSTREAM_RESPONSES = Counter(
+    "upstream_responses_total",
+    "Graph HTTP attempts and EWS operations by outcome",
+    ["service", "endpoint", "status"]
+)
+TOKEN_ACQUISITION_SECONDS = Histogram(
+    "token_acquisition_duration_seconds",
+    "Time to acquire an Exchange access token from Azure AD",
+    ["result"],
+    buckets=LATENCY_BUCKETS
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups by cache and result (hit or miss)",
+    ["cache", "result"]
+)
+
+tracer = trace.get_tracer("exchange_crm")
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+def record_upstream(service: str, endpoint: str, status: Any, seconds: float) -> None:
+    UPSTREAM_REQUEST_SECONDS.labels(service, endpoint).observe(seconds)
+    UPSTREAM_RESPONSES.labels(service, endpoint, str(status)).inc()
+
+class _PoolCollector:
+    """Reads pool usage from registered providers at scrape time"""
+
+    def __init__(self):
+        self.pools: Dict[str, Callable[[], Dict[str, float]]] = {}
+
+    def collect(self) -> Iterable[GaugeMetricFamily]:
+        gauge = GaugeMetricFamily("pool_usage", "Connection, worker and queue pool usage", labels=["pool", "state"])
+        for pool, stats in self.pools.items():
+            try:
+                values = stats()
+            except Exception as e:
+                print(f"Error reading {pool} pool stats: {e}")
+                continue
+            for state, value in values.items():
+                gauge.add_metric([pool, state], value)
+        yield gauge
+
+_pool_collector = _PoolCollector()
+REGISTRY.register(_pool_collector)
+
+def register_pool(pool: str, stats: Callable[[], Dict[str, float]]) -> None:
+    """Expose a pool's usage, e.g. {"in_use": 3, "idle": 5, "limit": 100}, as gauges"""
+    _pool_collector.pools[pool] = stats
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request latency per route template, so
+    /mail/messages/{message_id} is one series rather than one per message.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.monotonic()
+        status = {"code": 500}
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                HTTP_REQUEST_SECONDS.labels(
+                    scope["method"], self._route(scope), status["code"]
+                ).observe(time.monotonic() - started)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _route(self, scope: Dict[str, Any]) -> str:
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+def setup_telemetry(app: FastAPI) -> None:
+    """Add the metrics middleware and, if enabled, export traces"""
+    if settings.METRICS_ENABLED:
+        app.add_middleware(MetricsMiddleware)
+    if settings.TRACING_ENABLED:
+        _setup_tracing(app)
+
+def _setup_tracing(app: FastAPI) -> None:
+    from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+    if settings.TRACING_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter(endpoint=settings.TRACING_OTLP_ENDPOINT)
+    elif settings.TRACING_EXPORTER == "console":
+        exporter = ConsoleSpanExporter()
+    else:
+        raise ValueError(f"Unknown TRACING_EXPORTER: {settings.TRACING_EXPORTER}")
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": settings.TRACING_SERVICE_NAME}),
+        sampler=ParentBased(TraceIdRatioBased(settings.TRACING_SAMPLE_RATIO))
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    FastAPIInstrumentor.instrument_app(app, excluded_urls="health,metrics")
+
+def shutdown_tracing() -> None:
+    """Flush spans that are still buffered"""
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        provider.shutdown()
+
+def metrics_response() -> Response:
+    registry = REGISTRY
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        # Several workers (see gunicorn.conf.py): sum every worker's metrics.
+        # Pool usage is that of the worker answering the scrape.
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_pool_collector)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -1,7 +1,24 @@
-from fastapi import FastAPI
+import math
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from .core.config import settings
-from .api.v1 import mail, calendar, contacts
+from .core.responses import CompressionMiddleware
+from .core.telemetry import setup_telemetry, register_pool, metrics_response, shutdown_tracing
+from .api.v1 import auth, mail, calendar, contacts, attachments, notifications
+from .core.security import auth_service
+from .services.cache.tiered import graph_cache
+from .services.exchange.transport import graph_transport
+from .services.exchange.ews import ews_pool
+from .services.exchange.scheduler import graph_scheduler, GraphError
+from .services.exchange.prefetch import mail_prefetcher
+from .services.exchange.reads import read_coalescer
+from .services.exchange.resilience import circuit_breakers
+from .services.exchange.sync import mailbox_mirror
+from .services.search.index import mail_search_index
+from .services.notifications.events import event_bus
+from .services.notifications.subscriptions import subscription_manager
+from .services.notifications.handlers import register_cache_handlers
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -16,23 +33,72 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", mail.NEXT_PAGE_HEADER],
 )
 
+if settings.GZIP_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.GZIP_MIN_BYTES,
+        level=settings.GZIP_LEVEL
+    )
+
+# Request metrics and, if enabled, tracing
+setup_telemetry(app)
+register_pool("graph_connections", graph_transport.pool_stats)
+register_pool("graph_scheduler", graph_scheduler.stats)
+register_pool("ews_workers", ews_pool.pool_stats)
+register_pool("graph_cache_l1", graph_cache.stats)
+
 # Include routers
+app.include_router(auth.router, prefix=settings.API_V1_STR)
 app.include_router(mail.router, prefix=settings.API_V1_STR)
 app.include_router(calendar.router, prefix=settings.API_V1_STR)
 app.include_router(contacts.router, prefix=settings.API_V1_STR)
+app.include_router(attachments.router, prefix=settings.API_V1_STR)
+app.include_router(notifications.router, prefix=settings.API_V1_STR)
+
+register_cache_handlers()
+
+@app.exception_handler(GraphError)
+async def graph_error_handler(request: Request, exc: GraphError):
+    # Pass upstream throttling on as-is so clients back off rather than retry a 500
+    headers = {"Retry-After": str(math.ceil(exc.retry_after))} if exc.retry_after is not None else None
+    return JSONResponse(status_code=exc.status, content={"detail": str(exc)}, headers=headers)
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "upstream": dict(graph_scheduler.stats(), open_circuits=circuit_breakers.open_circuits())
+    }
+
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return metrics_response()
 
 @app.on_event("startup")
 async def startup_event():
     # Initialize services
-    pass
+    await graph_transport.start()
+    event_bus.start()
+    subscription_manager.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    # Runs once the server has drained in-flight requests (bounded by
+    # SERVER_GRACEFUL_TIMEOUT under gunicorn). Background reads only warm
+    # this worker's caches, so they are cancelled rather than awaited.
+    mail_prefetcher.close()
+    read_coalescer.close()
     # Cleanup services
-    pass
+    await subscription_manager.close()
+    await event_bus.close()
+    await graph_transport.close()
+    await graph_cache.close()
+    await auth_service.close()
+    ews_pool.close()
+    mailbox_mirror.close()
+    mail_search_index.close()
+    shutdown_tracing()
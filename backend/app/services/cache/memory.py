@@ -0,0 +1,60 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Set, Tuple
+
+class MemoryLRU:
+    """
+    In-process LRU of encoded values bounded by total size in bytes rather
+    than entry count, so a few large pages can't crowd out memory the way
+    many small entries would under a count limit. Entries carry a tag
+    (e.g. (resource, mailbox)) for bulk invalidation.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        # key -> (expires_at, generation, data, tag)
+        self._entries: "OrderedDict[str, Tuple[float, int, bytes, Hashable]]" = OrderedDict()
+        self._tags: Dict[Hashable, Set[str]] = {}
+
+    def _size(self, key: str, data: bytes) -> int:
+        return len(key) + len(data)
+
+    def get(self, key: str) -> Optional[Tuple[int, bytes]]:
+        """(generation, data) for key, or None if missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1], entry[2]
+
+    def set(self, key: str, generation: int, data: bytes, ttl: float, tag: Hashable) -> None:
+        size = self._size(key, data)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, generation, data, tag)
+        self._tags.setdefault(tag, set()).add(key)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        _, _, data, tag = self._entries.pop(key)
+        self.bytes -= self._size(key, data)
+        keys = self._tags.get(tag)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._tags[tag]
+
+    def invalidate_tag(self, tag: Hashable) -> None:
+        for key in list(self._tags.get(tag, ())):
+            self._remove(key)
+
+    def stats(self) -> Dict[str, float]:
+        return {"entries": len(self._entries), "bytes": self.bytes, "limit_bytes": self.max_bytes}
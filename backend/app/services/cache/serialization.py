@@ -0,0 +1,24 @@
+import zlib
+from typing import Any
+import orjson
+from ...core.config import settings
+
+# First byte of every encoded value
+_PLAIN = b"\x00"
+_ZLIB = b"\x01"
+
+def dumps(value: Any) -> bytes:
+    """
+    Encode a JSON-compatible value, such as a Graph payload, as compact bytes.
+    Values of at least CACHE_COMPRESS_MIN_BYTES are zlib-compressed.
+    """
+    data = orjson.dumps(value)
+    if len(data) >= settings.CACHE_COMPRESS_MIN_BYTES:
+        return _ZLIB + zlib.compress(data, settings.CACHE_COMPRESS_LEVEL)
+    return _PLAIN + data
+
+def loads(data: bytes) -> Any:
+    body = memoryview(data)[1:]
+    if data[:1] == _ZLIB:
+        return orjson.loads(zlib.decompress(body))
+    return orjson.loads(body)
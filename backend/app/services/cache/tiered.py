@@ -0,0 +1,155 @@
+import hashlib
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+import orjson
+import redis
+import redis.asyncio
+from ...core.config import settings
+from ...core.telemetry import record_cache
+from .memory import MemoryLRU
+from .serialization import dumps, loads
+
+# After a Redis error, use L1 only for this long before trying again
+REDIS_RETRY_SECONDS = 5
+
+class TieredCache:
+    """
+    Two-level cache for Graph payloads, tagged by (resource, mailbox).
+
+    L1 is a per-process LRU bounded by CACHE_L1_MAX_BYTES. L2 is Redis when
+    CACHE_BACKEND is "redis", shared by every worker. Values are stored as
+    compact orjson/zlib bytes with a per-resource TTL.
+
+    Each entry records the generation of its tag at the time it was
+    fetched. Invalidating a mailbox's resource sets a new generation (in
+    Redis too), so every older entry stops matching at once and is left to
+    expire. L1 copies live at most CACHE_L1_TTL_SECONDS with Redis, which
+    bounds how long another worker's invalidation can go unseen.
+    """
+
+    def __init__(self):
+        self._l1 = MemoryLRU(settings.CACHE_L1_MAX_BYTES)
+        self._generations: Dict[Tuple[str, str], int] = {}
+        self._redis: Optional[redis.asyncio.Redis] = None
+        if settings.CACHE_BACKEND == "redis":
+            self._redis = redis.asyncio.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                password=settings.REDIS_PASSWORD
+            )
+        self._redis_down_until = 0.0
+
+    def _ttl(self, resource: str) -> int:
+        return {
+            "messages": settings.CACHE_TTL_MESSAGES_SECONDS,
+            "events": settings.CACHE_TTL_EVENTS_SECONDS,
+            "contacts": settings.CACHE_TTL_CONTACTS_SECONDS
+        }[resource]
+
+    def _key(self, resource: str, username: str, params: Tuple[Hashable, ...]) -> str:
+        digest = hashlib.sha1(orjson.dumps(params, default=str)).hexdigest()
+        return f"{settings.CACHE_KEY_PREFIX}:{resource}:{username}:{digest}"
+
+    def _generation_key(self, resource: str, username: str) -> str:
+        return f"{settings.CACHE_KEY_PREFIX}:generation:{resource}:{username}"
+
+    def _redis_available(self) -> bool:
+        return self._redis is not None and time.monotonic() >= self._redis_down_until
+
+    def _redis_failed(self, action: str, error: Exception) -> None:
+        print(f"Cache {action} failed, using memory only for {REDIS_RETRY_SECONDS}s: {error}")
+        self._redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+
+    async def get(self, resource: str, username: str, params: Tuple[Hashable, ...]) -> Optional[Any]:
+        """Cached value for a read, or None"""
+        tag = (resource, username)
+        key = self._key(resource, username, params)
+        entry = self._l1.get(key)
+        hit = entry is not None and entry[0] == self._generations.get(tag, 0)
+        record_cache(f"{resource}_l1", hit)
+        if hit:
+            return loads(entry[1])
+        if not self._redis_available():
+            return None
+
+        try:
+            generation, data = await self._redis.mget(self._generation_key(resource, username), key)
+        except (redis.RedisError, OSError) as e:
+            self._redis_failed("read", e)
+            return None
+        generation = int(generation or 0)
+        self._generations[tag] = generation
+        hit = data is not None and int.from_bytes(data[:8], "big") == generation
+        record_cache(f"{resource}_l2", hit)
+        if not hit:
+            return None
+        self._l1.set(key, generation, data[8:], min(self._ttl(resource), settings.CACHE_L1_TTL_SECONDS), tag)
+        return loads(data[8:])
+
+    async def get_or_fetch(
+        self,
+        resource: str,
+        username: str,
+        params: Tuple[Hashable, ...],
+        fetch: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Serve a read from cache, or fetch and cache it"""
+        if not settings.CACHE_ENABLED:
+            return await fetch()
+        cached = await self.get(resource, username, params)
+        if cached is not None:
+            return cached
+        # Read before fetching, so a result fetched across an invalidation is never served
+        generation = self._generations.get((resource, username), 0)
+        value = await fetch()
+        await self._store(resource, username, params, generation, value)
+        return value
+
+    async def _store(
+        self,
+        resource: str,
+        username: str,
+        params: Tuple[Hashable, ...],
+        generation: int,
+        value: Any
+    ) -> None:
+        tag = (resource, username)
+        if self._generations.get(tag, 0) != generation:
+            return
+        key = self._key(resource, username, params)
+        data = dumps(value)
+        ttl = self._ttl(resource)
+        if self._redis is None:
+            self._l1.set(key, generation, data, ttl, tag)
+            return
+        self._l1.set(key, generation, data, min(ttl, settings.CACHE_L1_TTL_SECONDS), tag)
+        if self._redis_available():
+            try:
+                await self._redis.set(key, generation.to_bytes(8, "big") + data, ex=ttl)
+            except (redis.RedisError, OSError) as e:
+                self._redis_failed("write", e)
+
+    async def invalidate(self, resource: str, username: str) -> None:
+        """Drop every cached read of a resource for one mailbox"""
+        if not settings.CACHE_ENABLED:
+            return
+        tag = (resource, username)
+        # Time-based, so a generation key lost from Redis can't repeat an old value
+        generation = time.time_ns() // 1000
+        self._generations[tag] = generation
+        self._l1.invalidate_tag(tag)
+        if self._redis_available():
+            try:
+                await self._redis.set(self._generation_key(resource, username), generation)
+            except (redis.RedisError, OSError) as e:
+                self._redis_failed("invalidation", e)
+
+    def stats(self) -> Dict[str, float]:
+        """L1 size; hit and miss counts are exported per resource and tier in cache_requests_total"""
+        return self._l1.stats()
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.close()
+
+graph_cache = TieredCache()
@@ -0,0 +1,273 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+from typing import Any, AsyncIterator, Dict, Optional
+from ...core.config import settings
+from ...core.security import auth_service
+from ...core.telemetry import record_cache
+from .transport import graph_transport, GRAPH_BASE_URL
+from .batch import graph_batcher
+
+class AttachmentCache:
+    """
+    Size-bounded, content-addressed on-disk store for attachment bytes.
+
+    Blobs are named by the SHA-256 of their content. Aliases map one
+    mailbox's attachment to a blob, so identical bytes downloaded for many
+    mailboxes are stored only once, but each mailbox resolves only the
+    attachments it downloaded itself.
+
+    That means an attachment sent to 500 mailboxes is still fetched from
+    Graph once per mailbox. Graph exposes no content hash, so a mailbox
+    can't prove it holds the same bytes without downloading them, and
+    matching on sender-controlled metadata would let one mailbox read
+    another's attachment.
+
+    Least recently used blobs are evicted once ATTACHMENT_CACHE_MAX_BYTES
+    is exceeded.
+    """
+
+    def __init__(self):
+        self.directory = settings.ATTACHMENT_CACHE_DIR
+        self._blob_dir = os.path.join(self.directory, "blobs")
+        self._alias_dir = os.path.join(self.directory, "aliases")
+        self._tmp_dir = os.path.join(self.directory, "tmp")
+        self._total_bytes: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _ensure_dirs(self) -> None:
+        for directory in (self._blob_dir, self._alias_dir, self._tmp_dir):
+            os.makedirs(directory, exist_ok=True)
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self._blob_dir, digest[:2], digest)
+
+    def lookup(self, alias: str) -> Optional[str]:
+        """Return the blob path for an alias and mark it recently used"""
+        try:
+            with open(os.path.join(self._alias_dir, alias)) as f:
+                digest = f.read().strip()
+            path = self._blob_path(digest)
+            os.utime(path)
+            return path
+        except OSError:
+            return None
+
+    def create_temp(self) -> Any:
+        self._ensure_dirs()
+        return tempfile.NamedTemporaryFile(dir=self._tmp_dir, delete=False)
+
+    def commit(self, alias: str, temp_path: str, digest: str) -> str:
+        """Move a fully written temp file into the store under its digest"""
+        path = self._blob_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = os.path.getsize(temp_path)
+        with self._lock:
+            if os.path.exists(path):
+                os.unlink(temp_path)
+            else:
+                os.replace(temp_path, path)
+                if self._total_bytes is not None:
+                    self._total_bytes += size
+            alias_tmp = os.path.join(self._tmp_dir, f"{alias}.alias")
+            with open(alias_tmp, "w") as f:
+                f.write(digest)
+            os.replace(alias_tmp, os.path.join(self._alias_dir, alias))
+            self._evict()
+        return path
+
+    def discard(self, temp_path: str) -> None:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        if self._total_bytes is None:
+            self._total_bytes = sum(size for _, size, _ in self._scan())
+        if self._total_bytes <= settings.ATTACHMENT_CACHE_MAX_BYTES:
+            return
+        # Stale aliases pointing at evicted blobs are treated as misses by lookup()
+        for path, size, _ in sorted(self._scan(), key=lambda entry: entry[2]):
+            if self._total_bytes <= settings.ATTACHMENT_CACHE_MAX_BYTES:
+                break
+            try:
+                os.unlink(path)
+                self._total_bytes -= size
+            except OSError:
+                pass
+
+    def _scan(self):
+        for root, _, files in os.walk(self._blob_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+class AttachmentService:
+    """Streams attachment content from Graph through the local attachment cache"""
+
+    def __init__(self):
+        self.graph_base_url = GRAPH_BASE_URL
+        self.cache = AttachmentCache()
+        self._filling: Dict[str, asyncio.Future] = {}
+
+    async def _get_headers(self, username: str) -> Dict[str, str]:
+        """Get headers for Microsoft Graph API requests"""
+        token = await auth_service.get_access_token(username)
+        return {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json"
+        }
+
+    async def _run(self, func, *args) -> Any:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, func, *args)
+
+    async def get_attachment_info(
+        self,
+        username: str,
+        message_id: str,
+        attachment_id: str
+    ) -> Dict[str, Any]:
+        """
+        Get attachment metadata and the mailbox-scoped cache alias
+        """
+        attachment = await graph_batcher.request(
+            "GET",
+            f"{self.graph_base_url}/users/{username}/messages/{message_id}/attachments/{attachment_id}",
+            headers=await self._get_headers(username),
+            params={"$select": "id,name,contentType,size"}
+        )
+        if attachment.status != 200:
+            raise Exception(f"Failed to get attachment: {attachment.body.get('error', {}).get('message')}")
+
+        # Sender-controlled fields (Message-ID, name, size) must not pick the
+        # cached bytes, or one mailbox could be served another's content.
+        alias_source = "/".join([username.lower(), message_id, attachment_id])
+        return {
+            "name": attachment.body.get("name") or attachment_id,
+            "content_type": attachment.body.get("contentType") or "application/octet-stream",
+            "size": attachment.body.get("size") or 0,
+            "alias": hashlib.sha256(alias_source.encode("utf-8")).hexdigest()
+        }
+
+    def is_cacheable(self, info: Dict[str, Any]) -> bool:
+        return info["size"] <= settings.ATTACHMENT_CACHE_MAX_FILE_BYTES
+
+    async def lookup(self, info: Dict[str, Any]) -> Optional[str]:
+        """Path of the cached content, if present"""
+        path = await self._run(self.cache.lookup, info["alias"])
+        record_cache("attachment", path is not None)
+        return path
+
+    async def ensure_cached(
+        self,
+        username: str,
+        message_id: str,
+        attachment_id: str,
+        info: Dict[str, Any]
+    ) -> Optional[str]:
+        """Download the attachment into the cache if needed and return its path"""
+        path = await self._run(self.cache.lookup, info["alias"])
+        if path is not None or not self.is_cacheable(info):
+            return path
+        pending = self._filling.get(info["alias"])
+        if pending is not None:
+            path = await asyncio.shield(pending)
+            if path is not None:
+                return path
+        async for _ in self.stream_content(username, message_id, attachment_id, info):
+            pass
+        return await self._run(self.cache.lookup, info["alias"])
+
+    async def stream_content(
+        self,
+        username: str,
+        message_id: str,
+        attachment_id: str,
+        info: Dict[str, Any]
+    ) -> AsyncIterator[bytes]:
+        """
+        Stream attachment bytes from Graph, writing them into the cache as they
+        pass through. Concurrent misses for the same attachment wait for the
+        first download and are then served from disk.
+        """
+        alias = info["alias"]
+        pending = self._filling.get(alias)
+        if pending is not None:
+            path = await asyncio.shield(pending)
+            if path is not None:
+                async for chunk in self.read_file(path):
+                    yield chunk
+                return
+
+        if not self.is_cacheable(info):
+            async for chunk in self._fetch_upstream(username, message_id, attachment_id):
+                yield chunk
+            return
+
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._filling[alias] = future
+        temp = await self._run(self.cache.create_temp)
+        digest = hashlib.sha256()
+        path = None
+        try:
+            async for chunk in self._fetch_upstream(username, message_id, attachment_id):
+                digest.update(chunk)
+                await self._run(temp.write, chunk)
+                yield chunk
+            await self._run(temp.close)
+            path = await self._run(self.cache.commit, alias, temp.name, digest.hexdigest())
+        finally:
+            if path is None:
+                await self._run(temp.close)
+                await self._run(self.cache.discard, temp.name)
+            self._filling.pop(alias, None)
+            future.set_result(path)
+
+    async def _fetch_upstream(
+        self,
+        username: str,
+        message_id: str,
+        attachment_id: str
+    ) -> AsyncIterator[bytes]:
+        async for chunk in graph_transport.stream(
+            f"{self.graph_base_url}/users/{username}/messages/{message_id}/attachments/{attachment_id}/$value",
+            await self._get_headers(username),
+            "download attachment",
+            settings.ATTACHMENT_CHUNK_SIZE
+        ):
+            yield chunk
+
+    async def read_file(
+        self,
+        path: str,
+        start: int = 0,
+        end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        """Read an inclusive byte range of a cached file in chunks"""
+        f = await self._run(open, path, "rb")
+        try:
+            await self._run(f.seek, start)
+            remaining = (end - start + 1) if end is not None else None
+            while remaining is None or remaining > 0:
+                size = settings.ATTACHMENT_CHUNK_SIZE
+                if remaining is not None:
+                    size = min(size, remaining)
+                chunk = await self._run(f.read, size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            await self._run(f.close)
+
+attachment_service = AttachmentService()
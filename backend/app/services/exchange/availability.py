@@ -0,0 +1,401 @@
+import asyncio
+import time as clock
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import datetime, time, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from ...core.config import settings
+from ...core.security import auth_service
+from ...core.telemetry import record_cache
+from .transport import GRAPH_BASE_URL
+from .batch import graph_batcher
+
+# getSchedule accepts at most 20 schedules per call
+SCHEDULE_BATCH_SIZE = 20
+
+BUSY_STATUSES = {"busy", "oof", "tentative"}
+
+# (start, end, status) in UTC epoch seconds
+ScheduleItem = Tuple[float, float, str]
+
+def _epoch(value: datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+def _from_epoch(value: float) -> datetime:
+    """Naive UTC datetime, matching the rest of the calendar service"""
+    return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+
+class BusyIntervals:
+    """
+    Sorted, non-overlapping busy intervals with O(log n) overlap queries.
+
+    Input intervals are merged once on construction; starts and ends are
+    kept in parallel lists so lookups are a single bisect.
+    """
+
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, intervals: Iterable[Tuple[float, float]] = ()):
+        self.starts: List[float] = []
+        self.ends: List[float] = []
+        for start, end in sorted(intervals):
+            if end <= start:
+                continue
+            if self.ends and start <= self.ends[-1]:
+                if end > self.ends[-1]:
+                    self.ends[-1] = end
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    @classmethod
+    def union(cls, sets: Iterable["BusyIntervals"]) -> "BusyIntervals":
+        return cls(
+            interval for busy in sets for interval in zip(busy.starts, busy.ends)
+        )
+
+    def overlaps(self, start: float, end: float) -> bool:
+        """Whether [start, end) intersects any busy interval"""
+        index = bisect_right(self.starts, start) - 1
+        if index >= 0 and self.ends[index] > start:
+            return True
+        return index + 1 < len(self.starts) and self.starts[index + 1] < end
+
+    def free_ranges(self, start: float, end: float) -> List[Tuple[float, float]]:
+        """Gaps between busy intervals within [start, end)"""
+        ranges = []
+        cursor = start
+        index = max(bisect_right(self.starts, start) - 1, 0)
+        while index < len(self.starts) and self.starts[index] < end:
+            if self.starts[index] > cursor:
+                ranges.append((cursor, self.starts[index]))
+            cursor = max(cursor, self.ends[index])
+            index += 1
+        if cursor < end:
+            ranges.append((cursor, end))
+        return ranges
+
+class AvailabilityService:
+    """
+    Free/busy lookups and meeting slot search across many attendees.
+
+    Schedules are fetched with getSchedule in fixed, epoch-aligned windows
+    of FREEBUSY_WINDOW_DAYS and cached per (requester, attendee, window), so
+    overlapping searches reuse each other's results. Slots are computed
+    locally from the merged busy intervals.
+    """
+
+    def __init__(self):
+        self.graph_base_url = GRAPH_BASE_URL
+        self._cache: "OrderedDict[Tuple[str, str, float], Tuple[float, Optional[List[ScheduleItem]], Optional[str]]]" = OrderedDict()
+        self._pending: Dict[Tuple[str, str, float], asyncio.Future] = {}
+
+    async def _get_headers(self, username: str) -> Dict[str, str]:
+        token = await auth_service.get_access_token(username)
+        return {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json",
+            "Prefer": 'outlook.timezone="UTC"'
+        }
+
+    def invalidate(self, attendee: str) -> None:
+        """Drop cached availability of one attendee for every requester"""
+        attendee = attendee.lower()
+        for key in [key for key in self._cache if key[1] == attendee]:
+            del self._cache[key]
+
+    async def get_schedules(
+        self,
+        username: str,
+        attendees: List[str],
+        start_time: datetime,
+        end_time: datetime
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Get schedule items per attendee within a time range.
+
+        Returns {attendee: {"items": [(start, end, status)], "error": str or None}}
+        with times as UTC epoch seconds.
+        """
+        start, end = _epoch(start_time), _epoch(end_time)
+        if end <= start:
+            raise ValueError("end_time must be after start_time")
+        if (end - start) / 86400 > settings.FREEBUSY_MAX_RANGE_DAYS:
+            raise ValueError(f"Time range cannot exceed {settings.FREEBUSY_MAX_RANGE_DAYS} days")
+        attendees = list(dict.fromkeys(a.lower() for a in attendees))
+        if len(attendees) > settings.FREEBUSY_MAX_ATTENDEES:
+            raise ValueError(f"At most {settings.FREEBUSY_MAX_ATTENDEES} attendees are supported")
+
+        windows = self._windows(start, end)
+        await self._load(username, attendees, windows)
+
+        schedules = {}
+        for attendee in attendees:
+            # Items spanning a window boundary are returned for both windows
+            items: Dict[ScheduleItem, None] = {}
+            error = None
+            for window in windows:
+                entry = self._cache.get((username, attendee, window))
+                if entry is None or entry[2] is not None:
+                    error = entry[2] if entry else "Availability unavailable"
+                    continue
+                items.update((item, None) for item in entry[1] if item[1] > start and item[0] < end)
+            schedules[attendee] = {"items": list(items), "error": error}
+        return schedules
+
+    async def get_availability(
+        self,
+        username: str,
+        attendees: List[str],
+        start_time: datetime,
+        end_time: datetime
+    ) -> List[Dict[str, Any]]:
+        """
+        Get busy intervals for each attendee within a time range
+        """
+        schedules = await self.get_schedules(username, attendees, start_time, end_time)
+        return [
+            {
+                "email": attendee,
+                "busy": [
+                    {
+                        "start_time": _from_epoch(start),
+                        "end_time": _from_epoch(end),
+                        "status": status
+                    }
+                    for start, end, status in sorted(schedule["items"])
+                ],
+                "error": schedule["error"]
+            }
+            for attendee, schedule in schedules.items()
+        ]
+
+    async def find_meeting_slots(
+        self,
+        username: str,
+        required_attendees: List[str],
+        optional_attendees: List[str],
+        start_time: datetime,
+        end_time: datetime,
+        duration_minutes: int,
+        granularity_minutes: int = 15,
+        working_hours_start: Optional[time] = None,
+        working_hours_end: Optional[time] = None,
+        time_zone: str = "UTC",
+        exclude_weekends: bool = False,
+        tentative_is_busy: bool = True,
+        include_organizer: bool = True,
+        max_results: int = 20
+    ) -> Dict[str, Any]:
+        """
+        Find slots where every required attendee is free, ranked by how many
+        optional attendees are free and then by start time.
+
+        Attendees whose availability could not be read are treated as free
+        and reported in unresolved_attendees.
+        """
+        required = list(dict.fromkeys(a.lower() for a in required_attendees))
+        if include_organizer and username.lower() not in required:
+            required.append(username.lower())
+        optional = [
+            a for a in dict.fromkeys(a.lower() for a in optional_attendees) if a not in required
+        ]
+        if not required and not optional:
+            raise ValueError("At least one attendee is required")
+
+        schedules = await self.get_schedules(username, required + optional, start_time, end_time)
+        statuses = BUSY_STATUSES if tentative_is_busy else BUSY_STATUSES - {"tentative"}
+        busy = {
+            attendee: BusyIntervals(
+                (item[0], item[1]) for item in schedule["items"] if item[2] in statuses
+            )
+            for attendee, schedule in schedules.items()
+        }
+        required_busy = BusyIntervals.union(busy[a] for a in required)
+
+        duration = duration_minutes * 60
+        step = granularity_minutes * 60
+        slots = []
+        for range_start, range_end in self._search_ranges(
+            _epoch(start_time), _epoch(end_time),
+            working_hours_start, working_hours_end, time_zone, exclude_weekends
+        ):
+            for free_start, free_end in required_busy.free_ranges(range_start, range_end):
+                # Align slot starts to the granularity grid
+                slot_start = -(-free_start // step) * step
+                while slot_start + duration <= free_end:
+                    slot_end = slot_start + duration
+                    available = [a for a in optional if not busy[a].overlaps(slot_start, slot_end)]
+                    slots.append((slot_start, slot_end, available))
+                    slot_start += step
+
+        slots.sort(key=lambda slot: (-len(slot[2]), slot[0]))
+        return {
+            "slots": [
+                {
+                    "start_time": _from_epoch(slot_start),
+                    "end_time": _from_epoch(slot_end),
+                    "available_optional": available,
+                    "unavailable_optional": [a for a in optional if a not in available]
+                }
+                for slot_start, slot_end, available in slots[:max_results]
+            ],
+            "unresolved_attendees": [
+                attendee for attendee, schedule in schedules.items() if schedule["error"]
+            ]
+        }
+
+    def _windows(self, start: float, end: float) -> List[float]:
+        size = settings.FREEBUSY_WINDOW_DAYS * 86400
+        window = start // size * size
+        windows = []
+        while window < end:
+            windows.append(window)
+            window += size
+        return windows
+
+    def _search_ranges(
+        self,
+        start: float,
+        end: float,
+        working_hours_start: Optional[time],
+        working_hours_end: Optional[time],
+        time_zone: str,
+        exclude_weekends: bool
+    ) -> List[Tuple[float, float]]:
+        """Clip the search range to working hours in the attendee-facing time zone"""
+        if working_hours_start is None and working_hours_end is None and not exclude_weekends:
+            return [(start, end)]
+        try:
+            zone = ZoneInfo(time_zone)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"Unknown time zone: {time_zone}")
+        day_start = working_hours_start or time(0)
+        day_end = working_hours_end
+        ranges = []
+        day = datetime.fromtimestamp(start, zone).date()
+        last_day = datetime.fromtimestamp(end, zone).date()
+        while day <= last_day:
+            if not (exclude_weekends and day.weekday() >= 5):
+                range_start = datetime.combine(day, day_start, zone).timestamp()
+                if day_end is None:
+                    range_end = datetime.combine(day + timedelta(days=1), time(0), zone).timestamp()
+                else:
+                    range_end = datetime.combine(day, day_end, zone).timestamp()
+                range_start, range_end = max(range_start, start), min(range_end, end)
+                if range_start < range_end:
+                    ranges.append((range_start, range_end))
+            day += timedelta(days=1)
+        return ranges
+
+    async def _load(self, username: str, attendees: List[str], windows: List[float]) -> None:
+        """Fill the cache for every (attendee, window) pair, fetching misses in batches"""
+        now = clock.time()
+        waiting = []
+        missing: Dict[float, List[str]] = {}
+        for window in windows:
+            for attendee in attendees:
+                key = (username, attendee, window)
+                entry = self._cache.get(key)
+                hit = entry is not None and entry[0] > now
+                record_cache("freebusy", hit)
+                if hit:
+                    self._cache.move_to_end(key)
+                elif key in self._pending:
+                    waiting.append(self._pending[key])
+                else:
+                    missing.setdefault(window, []).append(attendee)
+
+        headers = await self._get_headers(username) if missing else {}
+        semaphore = asyncio.Semaphore(settings.FREEBUSY_CONCURRENCY)
+        for window, window_attendees in missing.items():
+            for offset in range(0, len(window_attendees), SCHEDULE_BATCH_SIZE):
+                chunk = window_attendees[offset:offset + SCHEDULE_BATCH_SIZE]
+                future = asyncio.ensure_future(
+                    self._fetch(username, headers, chunk, window, semaphore)
+                )
+                keys = [(username, attendee, window) for attendee in chunk]
+                for key in keys:
+                    self._pending[key] = future
+                future.add_done_callback(
+                    lambda _, keys=keys: [self._pending.pop(key, None) for key in keys]
+                )
+                waiting.append(future)
+
+        if waiting:
+            # A failed chunk only fails its own attendees, which get_schedules
+            # reports per attendee; the others keep their results
+            results = await asyncio.gather(
+                *[asyncio.shield(future) for future in waiting],
+                return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    print(f"Error loading schedules for {username}: {result}")
+
+    async def _fetch(
+        self,
+        username: str,
+        headers: Dict[str, str],
+        attendees: List[str],
+        window: float,
+        semaphore: asyncio.Semaphore
+    ) -> None:
+        window_end = window + settings.FREEBUSY_WINDOW_DAYS * 86400
+        body = {
+            "schedules": attendees,
+            "startTime": {"dateTime": _from_epoch(window).isoformat(), "timeZone": "UTC"},
+            "endTime": {"dateTime": _from_epoch(window_end).isoformat(), "timeZone": "UTC"},
+            # Only scheduleItems are used, so keep the availabilityView string short
+            "availabilityViewInterval": 1440
+        }
+        try:
+            async with semaphore:
+                response = await graph_batcher.request(
+                    "POST",
+                    f"{self.graph_base_url}/users/{username}/calendar/getSchedule",
+                    headers=headers,
+                    json_body=body
+                )
+            data = response.body
+            if response.status != 200:
+                raise Exception(f"Failed to get schedules: {data.get('error', {}).get('message')}")
+        except Exception as e:
+            # Recorded as already expired: reported for this lookup, refetched by the next
+            for attendee in attendees:
+                self._store((username, attendee, window), (clock.time(), None, str(e) or "Availability unavailable"))
+            return
+
+        expires_at = clock.time() + settings.FREEBUSY_CACHE_TTL_SECONDS
+        returned = set()
+        for schedule in data.get("value", []):
+            attendee = (schedule.get("scheduleId") or "").lower()
+            returned.add(attendee)
+            key = (username, attendee, window)
+            if schedule.get("error"):
+                # Not cached for long: the error may be transient
+                self._store(key, (clock.time() + 60, None, schedule["error"].get("message") or "Unknown error"))
+                continue
+            items = [
+                (
+                    _epoch(datetime.fromisoformat(item["start"]["dateTime"][:19])),
+                    _epoch(datetime.fromisoformat(item["end"]["dateTime"][:19])),
+                    (item.get("status") or "busy").lower()
+                )
+                for item in schedule.get("scheduleItems", [])
+            ]
+            self._store(key, (expires_at, items, None))
+        for attendee in attendees:
+            if attendee not in returned:
+                self._store((username, attendee, window), (clock.time() + 60, None, "No schedule returned"))
+
+    def _store(self, key: Tuple[str, str, float], entry: Tuple[float, Optional[List[ScheduleItem]], Optional[str]]) -> None:
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > settings.FREEBUSY_CACHE_MAX_ENTRIES:
+            self._cache.popitem(last=False)
+
+availability_service = AvailabilityService()
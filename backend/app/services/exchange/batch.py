@@ -0,0 +1,200 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote, urlencode
+from ...core.config import settings
+from .transport import graph_transport, GraphResponse, GRAPH_BASE_URL
+from .scheduler import (
+    graph_scheduler, mailbox_concurrency, mailbox_of, parse_retry_after, GraphError,
+    IDEMPOTENT_METHODS, RETRYABLE_STATUSES
+)
+
+# Graph rejects $batch payloads with more than 20 sub-requests
+MAX_BATCH_SIZE = 20
+
+class _BatchItem:
+    def __init__(
+        self,
+        method: str,
+        url: str,
+        headers: Dict[str, str],
+        body: Optional[Any],
+        future: asyncio.Future
+    ):
+        self.method = method
+        self.url = url
+        self.headers = headers
+        self.body = body
+        self.future = future
+
+class GraphBatcher:
+    """
+    Micro-batching dispatcher for Microsoft Graph requests.
+
+    Requests made with the same access token within GRAPH_BATCH_WINDOW_MS are
+    sent as a single JSON $batch POST and each caller receives its own
+    sub-response, with the sub-request's own status, headers and body.
+    """
+
+    def __init__(self):
+        self.graph_base_url = GRAPH_BASE_URL
+        self._pending: Dict[str, List[_BatchItem]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        headers: Dict[str, str],
+        params: Optional[Dict[str, Any]] = None,
+        json_body: Optional[Any] = None,
+        hedge: bool = False
+    ) -> GraphResponse:
+        """
+        Send a Graph request, coalescing it with concurrent requests when batching is enabled.
+        Hedged reads are sent on their own, since a batch waits for its slowest member.
+        """
+        hedged = hedge and settings.GRAPH_HEDGING_ENABLED
+        if hedged or not settings.GRAPH_BATCH_ENABLED or not url.startswith(self.graph_base_url):
+            return await graph_transport.request(
+                method, url, headers=headers, params=params, json_body=json_body, hedge=hedge
+            )
+
+        relative_url = url[len(self.graph_base_url):]
+        if params:
+            separator = "&" if "?" in relative_url else "?"
+            relative_url += separator + urlencode(params, safe="$,", quote_via=quote)
+
+        # Sub-requests inherit authentication from the outer $batch request,
+        # so batches are keyed by the Authorization header.
+        sub_headers = dict(headers)
+        authorization = sub_headers.pop("Authorization", "")
+
+        loop = asyncio.get_event_loop()
+        item = _BatchItem(method, relative_url, sub_headers, json_body, loop.create_future())
+        queue = self._pending.setdefault(authorization, [])
+        queue.append(item)
+        if len(queue) >= MAX_BATCH_SIZE:
+            self._flush(authorization)
+        elif len(queue) == 1:
+            self._timers[authorization] = loop.call_later(
+                settings.GRAPH_BATCH_WINDOW_MS / 1000,
+                self._flush,
+                authorization
+            )
+        return await item.future
+
+    def _flush(self, authorization: str) -> None:
+        timer = self._timers.pop(authorization, None)
+        if timer is not None:
+            timer.cancel()
+        items = self._pending.pop(authorization, [])
+        if items:
+            asyncio.ensure_future(self._send(authorization, items))
+
+    async def _send(self, authorization: str, items: List[_BatchItem]) -> None:
+        await asyncio.gather(*[
+            self._send_group(authorization, group) for group in self._group(items)
+        ])
+
+    def _group(self, items: List[_BatchItem]) -> List[List[_BatchItem]]:
+        """
+        Split items so no batch carries more sub-requests for one mailbox than
+        Graph runs concurrently per mailbox; the excess would come back as 429s.
+        """
+        groups: List[List[_BatchItem]] = []
+        counts: List[Dict[str, int]] = []
+        for item in items:
+            mailbox = mailbox_of(item.url)
+            for group, count in zip(groups, counts):
+                if count.get(mailbox, 0) < mailbox_concurrency():
+                    group.append(item)
+                    count[mailbox] = count.get(mailbox, 0) + 1
+                    break
+            else:
+                groups.append([item])
+                counts.append({mailbox: 1})
+        return groups
+
+    async def _send_group(self, authorization: str, items: List[_BatchItem]) -> None:
+        try:
+            if len(items) == 1:
+                # Nothing to coalesce with; skip the $batch envelope
+                await self._send_single(authorization, items[0])
+                return
+
+            await self._send_batch(authorization, items)
+        except Exception as e:
+            for item in items:
+                if not item.future.done():
+                    item.future.set_exception(e)
+
+    async def _send_single(self, authorization: str, item: _BatchItem) -> None:
+        headers = dict(item.headers, Authorization=authorization)
+        response = await graph_transport.request(
+            item.method,
+            self.graph_base_url + item.url,
+            headers=headers,
+            json_body=item.body
+        )
+        if not item.future.done():
+            item.future.set_result(response)
+
+    async def _send_batch(self, authorization: str, items: List[_BatchItem]) -> None:
+        requests = []
+        for index, item in enumerate(items):
+            sub_request: Dict[str, Any] = {
+                "id": str(index),
+                "method": item.method,
+                "url": item.url
+            }
+            if item.headers:
+                sub_request["headers"] = item.headers
+            if item.body is not None:
+                sub_request["body"] = item.body
+            requests.append(sub_request)
+
+        response = await graph_transport.request(
+            "POST",
+            f"{self.graph_base_url}/$batch",
+            headers={
+                "Authorization": authorization,
+                "Content-Type": "application/json"
+            },
+            json_body={"requests": requests}
+        )
+        if response.status != 200:
+            raise Exception(
+                f"Graph batch request failed: {response.body.get('error', {}).get('message')}"
+            )
+
+        throttled = []
+        for sub_response in response.body.get("responses", []):
+            item = items[int(sub_response["id"])]
+            status = sub_response.get("status", 500)
+            headers = sub_response.get("headers", {})
+            if status in RETRYABLE_STATUSES:
+                if status == 429 or item.method in IDEMPOTENT_METHODS:
+                    throttled.append((item, parse_retry_after(headers)))
+                elif not item.future.done():
+                    item.future.set_exception(GraphError(status, "Microsoft Graph is temporarily unavailable"))
+                continue
+            if not item.future.done():
+                item.future.set_result(GraphResponse(status, headers, sub_response.get("body")))
+
+        # Sub-requests Graph throttled are retried on their own through the
+        # scheduler, after pausing their mailboxes for the Retry-After period.
+        for item, retry_after in throttled:
+            graph_scheduler.pause([mailbox_of(item.url)], retry_after or graph_scheduler.backoff(0))
+        results = await asyncio.gather(
+            *[self._send_single(authorization, item) for item, _ in throttled],
+            return_exceptions=True
+        )
+        for (item, _), result in zip(throttled, results):
+            if isinstance(result, Exception) and not item.future.done():
+                item.future.set_exception(result)
+
+        for item in items:
+            if not item.future.done():
+                item.future.set_exception(Exception("Graph batch response is missing a sub-response"))
+
+graph_batcher = GraphBatcher()
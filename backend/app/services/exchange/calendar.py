@@ -1,11 +1,19 @@
-from typing import List, Optional, Dict, Any
-from datetime import datetime
-import aiohttp
+import asyncio
+from typing import AsyncIterator, List, Optional, Dict, Any, Tuple
+from datetime import datetime, timedelta, timezone
+from ...core.config import settings
 from ...core.security import auth_service
+from .transport import GRAPH_BASE_URL
+from .batch import graph_batcher
+from .reads import invalidate_reads, read_coalescer
+from .resilience import fallback_cache
+from ..cache.tiered import graph_cache
+
+EVENT_SELECT = "id,subject,organizer,start,end,location,body,attendees,isAllDay,createdDateTime,lastModifiedDateTime"
 
 class CalendarService:
     def __init__(self):
-        self.graph_base_url = "https://graph.microsoft.com/v1.0"
+        self.graph_base_url = GRAPH_BASE_URL
         
     async def _get_headers(self, username: str) -> Dict[str, str]:
         """Get headers for Microsoft Graph API requests"""
@@ -26,28 +34,149 @@ class CalendarService:
         """
         Get calendar events within a date range using Microsoft Graph API
         """
+        return [
+            event async for event in self.iter_calendar_events(
+                username, start_date, end_date, calendar_id
+            )
+        ]
+
+    async def iter_calendar_events(
+        self,
+        username: str,
+        start_date: datetime,
+        end_date: datetime,
+        calendar_id: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield calendar events within a date range in start-time order.
+
+        Uses calendarView so recurring series are expanded into occurrences.
+        The range is split into CALENDAR_VIEW_WINDOW_DAYS sub-windows that are
+        paginated concurrently, at most CALENDAR_VIEW_CONCURRENCY at a time.
+        """
+        key = ("events", username, start_date, end_date, calendar_id)
+        async for event in read_coalescer.iterate(key, lambda: fallback_cache.iterate(
+            key, lambda: self._iter_calendar_view(username, start_date, end_date, calendar_id)
+        )):
+            yield event
+
+    async def _iter_calendar_view(
+        self,
+        username: str,
+        start_date: datetime,
+        end_date: datetime,
+        calendar_id: Optional[str]
+    ) -> AsyncIterator[Dict[str, Any]]:
         headers = await self._get_headers(username)
-        
-        # Format datetime for Graph API
-        start_str = start_date.isoformat() + 'Z'
-        end_str = end_date.isoformat() + 'Z'
-        
+        start_date = self._to_utc(start_date)
+        end_date = self._to_utc(end_date)
+
         # Build calendar path
         calendar_path = f"/calendars/{calendar_id}" if calendar_id else ""
-        
-        params = {
-            "$select": "id,subject,organizer,start,end,location,body,attendees,createdDateTime,lastModifiedDateTime",
-            "$filter": f"start/dateTime ge '{start_str}' and end/dateTime le '{end_str}'"
+        url = f"{self.graph_base_url}/users/{username}{calendar_path}/calendarView"
+
+        semaphore = asyncio.Semaphore(settings.CALENDAR_VIEW_CONCURRENCY)
+        tasks = [
+            asyncio.ensure_future(self._fetch_window(
+                username, url, headers, window_start, window_end, index == 0, semaphore
+            ))
+            for index, (window_start, window_end) in enumerate(
+                self._split_range(start_date, end_date)
+            )
+        ]
+        try:
+            # Windows are consecutive and each event is kept only in the window
+            # it starts in, so emitting windows in order keeps events sorted.
+            for task in tasks:
+                for event in await task:
+                    yield event
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _fetch_window(
+        self,
+        username: str,
+        url: str,
+        headers: Dict[str, str],
+        window_start: datetime,
+        window_end: datetime,
+        is_first: bool,
+        semaphore: asyncio.Semaphore
+    ) -> List[Dict[str, Any]]:
+        """Fetch every page of calendarView for one sub-window"""
+        first_params: Dict[str, Any] = {
+            "startDateTime": window_start.isoformat() + 'Z',
+            "endDateTime": window_end.isoformat() + 'Z',
+            "$select": EVENT_SELECT,
+            "$orderby": "start/dateTime",
+            "$top": settings.CALENDAR_VIEW_PAGE_SIZE
         }
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                f"{self.graph_base_url}/users/{username}{calendar_path}/events",
-                headers=headers,
-                params=params
-            ) as response:
-                data = await response.json()
-                return [self._format_event(event) for event in data.get("value", [])]
+
+        async def fetch() -> List[Dict[str, Any]]:
+            raw_events = []
+            next_url: Optional[str] = url
+            params: Optional[Dict[str, Any]] = first_params
+            async with semaphore:
+                while next_url:
+                    response = await graph_batcher.request("GET", next_url, headers=headers, params=params, hedge=True)
+                    response.raise_for_status("get events")
+                    data = response.body
+                    raw_events.extend(data.get("value", []))
+                    next_url, params = data.get("@odata.nextLink"), None
+            return raw_events
+
+        raw_events = await graph_cache.get_or_fetch(
+            "events", username, (url, first_params["startDateTime"], first_params["endDateTime"]), fetch
+        )
+        events = [self._format_event(event) for event in raw_events]
+
+        # calendarView returns every event overlapping the window, so events
+        # spanning a window boundary also show up in the following window.
+        if not is_first:
+            events = [event for event in events if event["start_time"] >= window_start]
+        return events
+
+    def _split_range(self, start_date: datetime, end_date: datetime) -> List[Tuple[datetime, datetime]]:
+        step = timedelta(days=settings.CALENDAR_VIEW_WINDOW_DAYS)
+        windows = []
+        cursor = start_date
+        while cursor < end_date:
+            window_end = min(cursor + step, end_date)
+            windows.append((cursor, window_end))
+            cursor = window_end
+        return windows
+
+    def _to_utc(self, value: datetime) -> datetime:
+        """Normalize to the naive UTC datetimes used throughout this service"""
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+    async def get_calendar_event(
+        self,
+        username: str,
+        event_id: str
+    ) -> Dict[str, Any]:
+        """
+        Get a single calendar event using Microsoft Graph API
+        """
+        async def fetch_event() -> Dict[str, Any]:
+            response = await graph_batcher.request(
+                "GET",
+                f"{self.graph_base_url}/users/{username}/events/{event_id}",
+                headers=await self._get_headers(username),
+                hedge=True
+            )
+            response.raise_for_status("get event")
+            return response.body
+
+        async def fetch() -> Dict[str, Any]:
+            return self._format_event(
+                await graph_cache.get_or_fetch("events", username, ("event", event_id), fetch_event)
+            )
+
+        return await fallback_cache.call(("event", username, event_id), fetch)
 
     async def create_calendar_event(
         self,
@@ -90,14 +219,16 @@ class CalendarService:
                 for attendee in event["attendees"]
             ]
             
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self.graph_base_url}/users/{username}/events",
-                headers=headers,
-                json=event_data
-            ) as response:
-                data = await response.json()
-                return self._format_event(data)
+        response = await graph_batcher.request(
+            "POST",
+            f"{self.graph_base_url}/users/{username}/events",
+            headers=headers,
+            json_body=event_data
+        )
+        response.raise_for_status("create event")
+        data = response.body
+        await invalidate_reads("events", username)
+        return self._format_event(data)
 
     async def update_calendar_event(
         self,
@@ -141,14 +272,16 @@ class CalendarService:
                 for attendee in event["attendees"]
             ]
             
-        async with aiohttp.ClientSession() as session:
-            async with session.patch(
-                f"{self.graph_base_url}/users/{username}/events/{event_id}",
-                headers=headers,
-                json=event_data
-            ) as response:
-                data = await response.json()
-                return self._format_event(data)
+        response = await graph_batcher.request(
+            "PATCH",
+            f"{self.graph_base_url}/users/{username}/events/{event_id}",
+            headers=headers,
+            json_body=event_data
+        )
+        response.raise_for_status("update event")
+        data = response.body
+        await invalidate_reads("events", username)
+        return self._format_event(data)
 
     async def delete_calendar_event(
         self,
@@ -160,14 +293,15 @@ class CalendarService:
         """
         headers = await self._get_headers(username)
         
-        async with aiohttp.ClientSession() as session:
-            async with session.delete(
-                f"{self.graph_base_url}/users/{username}/events/{event_id}",
-                headers=headers
-            ) as response:
-                if response.status != 204:
-                    data = await response.json()
-                    raise Exception(f"Failed to delete event: {data.get('error', {}).get('message')}")
+        response = await graph_batcher.request(
+            "DELETE",
+            f"{self.graph_base_url}/users/{username}/events/{event_id}",
+            headers=headers
+        )
+        if response.status != 204:
+            data = response.body
+            raise Exception(f"Failed to delete event: {data.get('error', {}).get('message')}")
+        await invalidate_reads("events", username)
 
     def _format_event(self, event: Dict[str, Any]) -> Dict[str, Any]:
         """Format event data from Graph API to match our schema"""
@@ -1,14 +1,29 @@
-from typing import List, Optional, Dict, Any
+import asyncio
+import base64
+import weakref
+from typing import AsyncIterator, Awaitable, Iterator, List, Optional, Dict, Any, Tuple
 from datetime import datetime
-import aiohttp
-from exchangelib import Credentials, Account, DELEGATE, Configuration
+from exchangelib import Account
+from exchangelib.properties import ItemId
 from ...core.config import settings
 from ...core.security import auth_service
+from .transport import graph_transport, GRAPH_BASE_URL
+from .batch import graph_batcher
+from .ews import ews_pool
+from .prefetch import mail_prefetcher
+from .reads import invalidate_reads, read_coalescer
+from .scheduler import graph_scheduler, GraphError
+from .resilience import fallback_cache
+from .sync import mailbox_mirror, MESSAGE_SELECT
+from ..search.index import mail_search_index
+from ..cache.tiered import graph_cache
 
 class ExchangeClient:
     def __init__(self):
-        self.graph_base_url = "https://graph.microsoft.com/v1.0"
+        self.graph_base_url = GRAPH_BASE_URL
         self.ews_base_url = settings.EXCHANGE_SERVER
+        # Shared by every bulk fetch against the same mailbox
+        self._bulk_semaphores: "weakref.WeakValueDictionary[str, asyncio.Semaphore]" = weakref.WeakValueDictionary()
         
     async def _get_graph_headers(self, username: str) -> Dict[str, str]:
         """Get headers for Microsoft Graph API requests"""
@@ -19,21 +34,8 @@ class ExchangeClient:
         }
         
     async def _get_ews_account(self, username: str) -> Account:
-        """Get EWS Account instance"""
-        token = await auth_service.get_access_token(username)
-        credentials = Credentials(
-            username,
-            access_token=token
-        )
-        config = Configuration(
-            server=self.ews_base_url,
-            credentials=credentials
-        )
-        return Account(
-            primary_smtp_address=username,
-            config=config,
-            access_type=DELEGATE
-        )
+        """Get pooled EWS Account instance"""
+        return await ews_pool.get_account(username)
 
     async def get_messages(
         self,
@@ -43,46 +45,259 @@ class ExchangeClient:
         page_token: Optional[str] = None
     ) -> Dict[str, Any]:
         """
-        Get messages from specified folder using Microsoft Graph API
+        Get messages from specified folder using Microsoft Graph API,
+        or from the local delta-synced mirror when MAIL_MIRROR_ENABLED is set
         """
+        if settings.MAIL_MIRROR_ENABLED:
+            result = await mailbox_mirror.get_messages(
+                username,
+                folder=folder,
+                page_size=page_size,
+                page_token=page_token
+            )
+        else:
+            result = mail_prefetcher.get(("messages", username, folder, page_size, page_token))
+            if result is None:
+                result = await self._read_messages(username, folder, page_size, page_token)
+            if result["nextPageToken"] and settings.MAIL_PREFETCH_ENABLED:
+                next_token = result["nextPageToken"]
+                mail_prefetcher.schedule(
+                    ("messages", username, folder, page_size, next_token),
+                    lambda: self._read_messages(username, folder, page_size, next_token)
+                )
+        self._prefetch_details(username, result["messages"])
+        return result
+
+    async def _read_messages(
+        self,
+        username: str,
+        folder: str,
+        page_size: int,
+        page_token: Optional[str]
+    ) -> Dict[str, Any]:
+        key = ("messages", username, folder, page_size, page_token)
+        return await read_coalescer.call(key, lambda: fallback_cache.call(
+            key, lambda: self._fetch_messages(username, folder, page_size, page_token)
+        ))
+
+    def _prefetch_details(self, username: str, messages: List[Dict[str, Any]]) -> None:
+        """Start fetching the details of the first unread messages of a page"""
+        if not settings.MAIL_PREFETCH_ENABLED:
+            return
+        unread = [msg["id"] for msg in messages if msg.get("isRead") is False]
+        for message_id in unread[:settings.MAIL_PREFETCH_UNREAD_DETAILS]:
+            mail_prefetcher.schedule(
+                ("message_detail", username, message_id),
+                lambda message_id=message_id: self._read_message_detail(username, message_id)
+            )
+
+    async def _fetch_messages(
+        self,
+        username: str,
+        folder: str,
+        page_size: int,
+        page_token: Optional[str]
+    ) -> Dict[str, Any]:
         headers = await self._get_graph_headers(username)
         params = {
             "$top": page_size,
             "$orderby": "receivedDateTime desc",
-            "$select": "id,subject,from,toRecipients,receivedDateTime,hasAttachments,bodyPreview"
+            "$select": MESSAGE_SELECT
         }
         if page_token:
             params["$skiptoken"] = page_token
-            
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
+
+        async def fetch() -> Dict[str, Any]:
+            response = await graph_batcher.request(
+                "GET",
                 f"{self.graph_base_url}/users/{username}/mailFolders/{folder}/messages",
                 headers=headers,
-                params=params
-            ) as response:
-                data = await response.json()
-                return {
-                    "messages": data.get("value", []),
-                    "nextPageToken": data.get("@odata.nextLink", "").split("skiptoken=")[-1]
-                    if "@odata.nextLink" in data else None
-                }
+                params=params,
+                hedge=True
+            )
+            response.raise_for_status("get messages")
+            mail_search_index.schedule_index(username, folder, response.body.get("value", []))
+            return response.body
+
+        data = await graph_cache.get_or_fetch("messages", username, (folder, page_size, page_token), fetch)
+        return {
+            "messages": data.get("value", []),
+            "nextPageToken": data.get("@odata.nextLink", "").split("skiptoken=")[-1]
+            if "@odata.nextLink" in data else None
+        }
+
+    async def search_messages(
+        self,
+        username: str,
+        query: str,
+        folder: Optional[str] = None,
+        page_size: int = 50,
+        page_token: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Search messages already seen for this mailbox using the local full-text index
+        """
+        return await mail_search_index.search(
+            username,
+            query,
+            folder=folder,
+            page_size=page_size,
+            page_token=page_token
+        )
+
+    async def iter_folder_pages(
+        self,
+        username: str,
+        folder: str = "inbox",
+        page_size: int = 250
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield every page of a folder by following @odata.nextLink. The next
+        page is requested while the caller is still consuming the current one.
+        """
+        params = {
+            "$top": page_size,
+            "$orderby": "receivedDateTime desc",
+            "$select": MESSAGE_SELECT
+        }
+        pending: Optional[asyncio.Future] = asyncio.ensure_future(self._fetch_page(
+            username,
+            f"{self.graph_base_url}/users/{username}/mailFolders/{folder}/messages",
+            params
+        ))
+        try:
+            while pending is not None:
+                data = await pending
+                next_link = data.get("@odata.nextLink")
+                pending = asyncio.ensure_future(
+                    self._fetch_page(username, next_link, None)
+                ) if next_link else None
+                mail_search_index.schedule_index(username, folder, data.get("value", []))
+                yield data.get("value", [])
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    async def _fetch_page(
+        self,
+        username: str,
+        url: str,
+        params: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        # Headers are rebuilt per page so long exports pick up refreshed tokens
+        headers = await self._get_graph_headers(username)
+        response = await graph_transport.request("GET", url, headers=headers, params=params)
+        response.raise_for_status("get messages")
+        return response.body
 
     async def get_message_detail(self, username: str, message_id: str) -> Dict[str, Any]:
         """
         Get detailed message information using EWS for rich content
         """
-        account = await self._get_ews_account(username)
+        prefetched = mail_prefetcher.get(("message_detail", username, message_id))
+        if prefetched is not None:
+            return prefetched
+        return await self._read_message_detail(username, message_id)
+
+    async def _read_message_detail(self, username: str, message_id: str) -> Dict[str, Any]:
+        async def fetch() -> Dict[str, Any]:
+            account = await self._get_ews_account(username)
+            return await ews_pool.run(self._fetch_message_detail, account, message_id)
+
+        return await fallback_cache.call(("message_detail", username, message_id), fetch)
+
+    def _fetch_message_detail(self, account: Account, message_id: str) -> Dict[str, Any]:
+        """Blocking EWS fetch; runs on the EWS thread pool"""
         message = account.inbox.get(id=message_id)
+        return self._format_message_detail(message)
+
+    async def get_message_details(
+        self,
+        username: str,
+        message_ids: List[str]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Fetch many messages with batched EWS GetItem calls of
+        MAIL_BULK_CHUNK_SIZE ids. Returns an iterator yielding {"id",
+        "message"} or {"id", "error"} per id, a whole batch at a time as
+        each batch completes.
+
+        The account is resolved and the first batch awaited before
+        returning, so auth and Exchange outages raise here instead of
+        partway through a streamed response.
+        """
+        account = await self._get_ews_account(username)
+        semaphore = self._bulk_semaphores.get(username)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(settings.MAIL_BULK_CONCURRENCY)
+            self._bulk_semaphores[username] = semaphore
+
+        async def fetch_chunk(chunk: List[str]) -> Tuple[List[str], Any]:
+            """The chunk's results, or the exception fetching it raised"""
+            try:
+                async with semaphore:
+                    return chunk, await ews_pool.run(self._fetch_message_details, account, chunk)
+            except Exception as e:
+                return chunk, e
+
+        size = settings.MAIL_BULK_CHUNK_SIZE
+        tasks = [
+            asyncio.ensure_future(fetch_chunk(message_ids[i:i + size]))
+            for i in range(0, len(message_ids), size)
+        ]
+        completed = asyncio.as_completed(tasks)
+        try:
+            _, first = await next(completed)
+            if isinstance(first, Exception):
+                raise first
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return self._iter_message_details(first, completed, tasks)
+
+    async def _iter_message_details(
+        self,
+        first: List[Dict[str, Any]],
+        completed: Iterator[Awaitable[Tuple[List[str], Any]]],
+        tasks: List[asyncio.Future]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        try:
+            for result in first:
+                yield result
+            for next_done in completed:
+                chunk, results = await next_done
+                if isinstance(results, Exception):
+                    results = [{"id": message_id, "error": str(results)} for message_id in chunk]
+                for result in results:
+                    yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _fetch_message_details(self, account: Account, message_ids: List[str]) -> List[Dict[str, Any]]:
+        """Blocking EWS GetItem for many ids; runs on the EWS thread pool"""
+        items = account.fetch(ids=[ItemId(id=message_id) for message_id in message_ids])
+        results = []
+        for message_id, item in zip(message_ids, items):
+            if isinstance(item, Exception):
+                results.append({"id": message_id, "error": str(item)})
+            else:
+                results.append({"id": message_id, "message": self._format_message_detail(item)})
+        return results
+
+    def _format_message_detail(self, message: Any) -> Dict[str, Any]:
+        """Format an EWS message to match MessageDetailResponse"""
         return {
             "id": message.id,
             "subject": message.subject,
-            "from": str(message.sender.email_address),
-            "to": [str(r.email_address) for r in message.to_recipients],
-            "cc": [str(r.email_address) for r in message.cc_recipients],
-            "bcc": [str(r.email_address) for r in message.bcc_recipients],
+            "from_address": str(message.sender.email_address) if message.sender else "",
+            "to_addresses": [str(r.email_address) for r in message.to_recipients or []],
+            "cc_addresses": [str(r.email_address) for r in message.cc_recipients or []],
+            "bcc_addresses": [str(r.email_address) for r in message.bcc_recipients or []],
             "body": message.body,
             "attachments": [{
-                "id": att.attachment_id,
+                "id": att.attachment_id.id,
                 "name": att.name,
                 "content_type": att.content_type,
                 "size": att.size
@@ -100,7 +315,14 @@ class ExchangeClient:
         attachments: Optional[List[Dict[str, Any]]] = None
     ) -> str:
         """
-        Send a new message using Microsoft Graph API
+        Send a new message using Microsoft Graph API.
+
+        Each attachment is a dict with name, content_type, size and either
+        content (bytes) or file (an object with an async read(size)). When all
+        attachments fit in MAIL_INLINE_ATTACHMENT_MAX_BYTES they are sent inline
+        with sendMail; otherwise the message is created as a draft, attachments
+        are added concurrently (large ones through chunked upload sessions) and
+        the draft is sent.
         """
         headers = await self._get_graph_headers(username)
         message_data = {
@@ -120,17 +342,171 @@ class ExchangeClient:
             message_data["bccRecipients"] = [
                 {"emailAddress": {"address": r}} for r in bcc_recipients
             ]
+
+        attachments = attachments or []
+        if sum(a["size"] for a in attachments) > settings.MAIL_INLINE_ATTACHMENT_MAX_BYTES:
+            result = await self._send_with_upload(username, headers, message_data, attachments)
+            await invalidate_reads("messages", username)
+            return result
+
+        if attachments:
+            message_data["attachments"] = [
+                await self._inline_attachment(a) for a in attachments
+            ]
             
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self.graph_base_url}/users/{username}/sendMail",
-                headers=headers,
-                json={"message": message_data}
-            ) as response:
-                if response.status == 202:
-                    return "Message sent successfully"
-                else:
-                    data = await response.json()
-                    raise Exception(f"Failed to send message: {data.get('error', {}).get('message')}")
+        response = await graph_batcher.request(
+            "POST",
+            f"{self.graph_base_url}/users/{username}/sendMail",
+            headers=headers,
+            json_body={"message": message_data}
+        )
+        response.raise_for_status("send message")
+        await invalidate_reads("messages", username)
+        return "Message sent successfully"
+
+    async def _send_with_upload(
+        self,
+        username: str,
+        headers: Dict[str, str],
+        message_data: Dict[str, Any],
+        attachments: List[Dict[str, Any]]
+    ) -> str:
+        """Create a draft, attach files concurrently, then send the draft"""
+        messages_url = f"{self.graph_base_url}/users/{username}/messages"
+        response = await graph_batcher.request("POST", messages_url, headers=headers, json_body=message_data)
+        response.raise_for_status("create draft")
+        draft_url = f"{messages_url}/{response.body['id']}"
+
+        semaphore = asyncio.Semaphore(settings.MAIL_UPLOAD_CONCURRENCY)
+
+        async def add_attachment(attachment: Dict[str, Any]) -> None:
+            async with semaphore:
+                if attachment["size"] > settings.MAIL_INLINE_ATTACHMENT_MAX_BYTES:
+                    await self._upload_attachment(username, draft_url, attachment)
+                    return
+                response = await graph_batcher.request(
+                    "POST",
+                    f"{draft_url}/attachments",
+                    headers=await self._get_graph_headers(username),
+                    json_body=await self._inline_attachment(attachment)
+                )
+                response.raise_for_status("attach file")
+
+        try:
+            await asyncio.gather(*[add_attachment(a) for a in attachments])
+            response = await graph_batcher.request(
+                "POST",
+                f"{draft_url}/send",
+                headers=await self._get_graph_headers(username)
+            )
+            response.raise_for_status("send message")
+        except Exception:
+            # Don't leave a half-built draft behind in the user's mailbox
+            await graph_batcher.request("DELETE", draft_url, headers=await self._get_graph_headers(username))
+            raise
+        return "Message sent successfully"
+
+    async def _inline_attachment(self, attachment: Dict[str, Any]) -> Dict[str, Any]:
+        if "content" in attachment:
+            content = attachment["content"]
+        else:
+            content = await attachment["file"].read()
+        return {
+            "@odata.type": "#microsoft.graph.fileAttachment",
+            "name": attachment["name"],
+            "contentType": attachment["content_type"],
+            "contentBytes": base64.b64encode(content).decode("ascii")
+        }
+
+    async def _upload_attachment(
+        self,
+        username: str,
+        draft_url: str,
+        attachment: Dict[str, Any]
+    ) -> None:
+        """Upload one attachment to a draft through a Graph upload session"""
+        response = await graph_batcher.request(
+            "POST",
+            f"{draft_url}/attachments/createUploadSession",
+            headers=await self._get_graph_headers(username),
+            json_body={
+                "AttachmentItem": {
+                    "attachmentType": "file",
+                    "name": attachment["name"],
+                    "size": attachment["size"],
+                    "contentType": attachment["content_type"]
+                }
+            }
+        )
+        response.raise_for_status("create upload session")
+        upload_url = response.body["uploadUrl"]
+
+        # Only one chunk per attachment is held in memory at a time
+        size = attachment["size"]
+        offset = 0
+        async for chunk in self._attachment_chunks(attachment):
+            await self._upload_chunk(upload_url, chunk, offset, size)
+            offset += len(chunk)
+        if offset != size:
+            raise Exception(f"Attachment {attachment['name']} ended after {offset} of {size} bytes")
+
+    async def _upload_chunk(self, upload_url: str, chunk: bytes, start: int, size: int) -> None:
+        """
+        PUT one chunk to an upload session. The transport retries transient
+        failures; if the chunk still fails, or a retry is rejected because
+        part of it had already arrived, the upload resumes from the
+        session's nextExpectedRanges.
+        """
+        end = start + len(chunk) - 1
+        offset = start
+        attempt = 0
+        while True:
+            try:
+                # The upload URL is pre-authenticated and must not carry a bearer token
+                response = await graph_transport.request(
+                    "PUT",
+                    upload_url,
+                    headers={"Content-Range": f"bytes {offset}-{end}/{size}"},
+                    data=chunk[offset - start:]
+                )
+            except GraphError:
+                # Still failing after the transport's own retries
+                if attempt >= settings.GRAPH_MAX_RETRIES:
+                    raise
+            else:
+                # A retried PUT is rejected with 416 if part of the chunk had arrived
+                resumable = response.status == 416 or response.status >= 500
+                if not resumable or attempt >= settings.GRAPH_MAX_RETRIES:
+                    response.raise_for_status("upload attachment chunk")
+                    return
+            await asyncio.sleep(graph_scheduler.backoff(attempt))
+            attempt += 1
+            offset = await self._upload_offset(upload_url)
+            if offset > end:
+                return
+            if offset < start:
+                raise Exception(f"Upload session expects byte {offset}, which was already sent")
+
+    async def _upload_offset(self, upload_url: str) -> int:
+        """First byte an upload session is still waiting for"""
+        response = await graph_transport.request("GET", upload_url)
+        response.raise_for_status("get upload session")
+        ranges = response.body.get("nextExpectedRanges") or []
+        if not ranges:
+            raise Exception("Upload session is not expecting more data")
+        return int(ranges[0].split("-")[0])
+
+    async def _attachment_chunks(self, attachment: Dict[str, Any]) -> AsyncIterator[bytes]:
+        chunk_size = settings.MAIL_UPLOAD_CHUNK_SIZE
+        if "content" in attachment:
+            content = attachment["content"]
+            for start in range(0, len(content), chunk_size):
+                yield content[start:start + chunk_size]
+            return
+        while True:
+            chunk = await attachment["file"].read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
 
 exchange_client = ExchangeClient()
@@ -1,11 +1,16 @@
 from typing import List, Optional, Dict, Any
 from datetime import datetime
-import aiohttp
 from ...core.security import auth_service
+from .transport import GRAPH_BASE_URL
+from .batch import graph_batcher
+from .directory import contact_directory
+from .reads import invalidate_reads, read_coalescer
+from .resilience import fallback_cache
+from ..cache.tiered import graph_cache
 
 class ContactsService:
     def __init__(self):
-        self.graph_base_url = "https://graph.microsoft.com/v1.0"
+        self.graph_base_url = GRAPH_BASE_URL
         
     async def _get_headers(self, username: str) -> Dict[str, str]:
         """Get headers for Microsoft Graph API requests"""
@@ -39,15 +44,50 @@ class ContactsService:
             params["$skiptoken"] = page_token
             
         folder_path = f"/contactFolders/{folder_id}" if folder_id else ""
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
+
+        async def fetch_page() -> List[Dict[str, Any]]:
+            response = await graph_batcher.request(
+                "GET",
                 f"{self.graph_base_url}/users/{username}{folder_path}/contacts",
                 headers=headers,
-                params=params
-            ) as response:
-                data = await response.json()
-                return [self._format_contact(contact) for contact in data.get("value", [])]
+                params=params,
+                hedge=True
+            )
+            response.raise_for_status("get contacts")
+            return response.body.get("value", [])
+
+        key = ("contacts", username, folder_id, search_query, page_size, page_token)
+
+        async def fetch() -> List[Dict[str, Any]]:
+            contacts = await graph_cache.get_or_fetch("contacts", username, key[2:], fetch_page)
+            return [self._format_contact(contact) for contact in contacts]
+
+        return await read_coalescer.call(key, lambda: fallback_cache.call(key, fetch))
+
+    async def get_contact(
+        self,
+        username: str,
+        contact_id: str
+    ) -> Dict[str, Any]:
+        """
+        Get a single contact using Microsoft Graph API
+        """
+        async def fetch_contact() -> Dict[str, Any]:
+            response = await graph_batcher.request(
+                "GET",
+                f"{self.graph_base_url}/users/{username}/contacts/{contact_id}",
+                headers=await self._get_headers(username),
+                hedge=True
+            )
+            response.raise_for_status("get contact")
+            return response.body
+
+        async def fetch() -> Dict[str, Any]:
+            return self._format_contact(
+                await graph_cache.get_or_fetch("contacts", username, ("contact", contact_id), fetch_contact)
+            )
+
+        return await fallback_cache.call(("contact", username, contact_id), fetch)
 
     async def create_contact(
         self,
@@ -74,19 +114,19 @@ class ContactsService:
         
         if contact.get("phone_numbers"):
             contact_data.update({
-                "businessPhones": [p.number for p in contact["phone_numbers"] if p.type == "business"],
-                "homePhones": [p.number for p in contact["phone_numbers"] if p.type == "home"],
-                "mobilePhone": next((p.number for p in contact["phone_numbers"] if p.type == "mobile"), None)
+                "businessPhones": [p["number"] for p in contact["phone_numbers"] if p["type"] == "business"],
+                "homePhones": [p["number"] for p in contact["phone_numbers"] if p["type"] == "home"],
+                "mobilePhone": next((p["number"] for p in contact["phone_numbers"] if p["type"] == "mobile"), None)
             })
             
         if contact.get("addresses"):
             contact_data["addresses"] = [
                 {
-                    "street": addr.street,
-                    "city": addr.city,
-                    "state": addr.state,
-                    "postalCode": addr.postal_code,
-                    "countryOrRegion": addr.country
+                    "street": addr["street"],
+                    "city": addr["city"],
+                    "state": addr["state"],
+                    "postalCode": addr["postal_code"],
+                    "countryOrRegion": addr["country"]
                 }
                 for addr in contact["addresses"]
             ]
@@ -102,14 +142,16 @@ class ContactsService:
             if contact.get(our_field):
                 contact_data[graph_field] = contact[our_field]
                 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self.graph_base_url}/users/{username}/contacts",
-                headers=headers,
-                json=contact_data
-            ) as response:
-                data = await response.json()
-                return self._format_contact(data)
+        response = await graph_batcher.request(
+            "POST",
+            f"{self.graph_base_url}/users/{username}/contacts",
+            headers=headers,
+            json_body=contact_data
+        )
+        data = response.body
+        contact_directory.invalidate(username)
+        await invalidate_reads("contacts", username)
+        return self._format_contact(data)
 
     async def update_contact(
         self,
@@ -137,19 +179,19 @@ class ContactsService:
         
         if contact.get("phone_numbers"):
             contact_data.update({
-                "businessPhones": [p.number for p in contact["phone_numbers"] if p.type == "business"],
-                "homePhones": [p.number for p in contact["phone_numbers"] if p.type == "home"],
-                "mobilePhone": next((p.number for p in contact["phone_numbers"] if p.type == "mobile"), None)
+                "businessPhones": [p["number"] for p in contact["phone_numbers"] if p["type"] == "business"],
+                "homePhones": [p["number"] for p in contact["phone_numbers"] if p["type"] == "home"],
+                "mobilePhone": next((p["number"] for p in contact["phone_numbers"] if p["type"] == "mobile"), None)
             })
             
         if contact.get("addresses"):
             contact_data["addresses"] = [
                 {
-                    "street": addr.street,
-                    "city": addr.city,
-                    "state": addr.state,
-                    "postalCode": addr.postal_code,
-                    "countryOrRegion": addr.country
+                    "street": addr["street"],
+                    "city": addr["city"],
+                    "state": addr["state"],
+                    "postalCode": addr["postal_code"],
+                    "countryOrRegion": addr["country"]
                 }
                 for addr in contact["addresses"]
             ]
@@ -165,14 +207,16 @@ class ContactsService:
             if contact.get(our_field):
                 contact_data[graph_field] = contact[our_field]
                 
-        async with aiohttp.ClientSession() as session:
-            async with session.patch(
-                f"{self.graph_base_url}/users/{username}/contacts/{contact_id}",
-                headers=headers,
-                json=contact_data
-            ) as response:
-                data = await response.json()
-                return self._format_contact(data)
+        response = await graph_batcher.request(
+            "PATCH",
+            f"{self.graph_base_url}/users/{username}/contacts/{contact_id}",
+            headers=headers,
+            json_body=contact_data
+        )
+        data = response.body
+        contact_directory.invalidate(username)
+        await invalidate_reads("contacts", username)
+        return self._format_contact(data)
 
     async def delete_contact(
         self,
@@ -184,14 +228,16 @@ class ContactsService:
         """
         headers = await self._get_headers(username)
         
-        async with aiohttp.ClientSession() as session:
-            async with session.delete(
-                f"{self.graph_base_url}/users/{username}/contacts/{contact_id}",
-                headers=headers
-            ) as response:
-                if response.status != 204:
-                    data = await response.json()
-                    raise Exception(f"Failed to delete contact: {data.get('error', {}).get('message')}")
+        response = await graph_batcher.request(
+            "DELETE",
+            f"{self.graph_base_url}/users/{username}/contacts/{contact_id}",
+            headers=headers
+        )
+        if response.status != 204:
+            data = response.body
+            raise Exception(f"Failed to delete contact: {data.get('error', {}).get('message')}")
+        contact_directory.invalidate(username)
+        await invalidate_reads("contacts", username)
 
     def _format_contact(self, contact: Dict[str, Any]) -> Dict[str, Any]:
         """Format contact data from Graph API to match our schema"""
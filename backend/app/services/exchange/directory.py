@@ -0,0 +1,266 @@
+import asyncio
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from ...core.config import settings
+from ...core.security import auth_service
+from ...core.telemetry import record_cache
+from ..notifications.subscriptions import subscription_manager
+from .transport import graph_transport, GRAPH_BASE_URL
+
+CONTACT_SELECT = "id,displayName,givenName,surname,emailAddresses"
+
+# Well-known id of the default contacts folder; Graph's contacts delta
+# only exists per folder
+DEFAULT_CONTACT_FOLDER = "contacts"
+
+# Match weights by field: names beat email addresses, whole-name matches beat words
+_DISPLAY_NAME_WEIGHT = 4
+_NAME_WEIGHT = 3
+_EMAIL_WEIGHT = 2
+_EMAIL_LOCAL_WEIGHT = 1
+
+class _Directory:
+    """Contacts of one user with a sorted (token, weight, contact id) prefix index"""
+
+    def __init__(self):
+        self.contacts: Dict[str, Dict[str, Any]] = {}
+        self.tokens: List[Tuple[str, int, str]] = []
+        self.delta_links: Dict[str, str] = {}
+        self.synced_at = 0.0
+
+    def _entry_tokens(self, contact: Dict[str, Any]) -> List[Tuple[str, int, str]]:
+        contact_id = contact["id"]
+        weights: Dict[str, int] = {}
+
+        def add(text: Optional[str], weight: int) -> None:
+            if text:
+                token = text.strip().lower()
+                if token and weights.get(token, 0) < weight:
+                    weights[token] = weight
+
+        display_name = contact.get("displayName")
+        add(display_name, _DISPLAY_NAME_WEIGHT)
+        for word in (display_name or "").split()[1:]:
+            add(word, _NAME_WEIGHT)
+        add(contact.get("givenName"), _NAME_WEIGHT)
+        add(contact.get("surname"), _NAME_WEIGHT)
+        for email in contact.get("emailAddresses") or []:
+            address = email.get("address")
+            add(address, _EMAIL_WEIGHT)
+            if address and "@" in address:
+                add(address.split("@", 1)[0], _EMAIL_LOCAL_WEIGHT)
+        return [(token, weight, contact_id) for token, weight in weights.items()]
+
+    def _entry(self, contact: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": contact["id"],
+            "display_name": contact.get("displayName") or "",
+            "given_name": contact.get("givenName"),
+            "surname": contact.get("surname"),
+            "email_addresses": [
+                e["address"] for e in contact.get("emailAddresses") or [] if e.get("address")
+            ]
+        }
+
+    def upsert(self, contact: Dict[str, Any]) -> None:
+        self.remove(contact["id"])
+        self.contacts[contact["id"]] = self._entry(contact)
+        for token in self._entry_tokens(contact):
+            insort(self.tokens, token)
+
+    def remove(self, contact_id: str) -> None:
+        if self.contacts.pop(contact_id, None) is not None:
+            self.tokens = [token for token in self.tokens if token[2] != contact_id]
+
+    def load(self, contacts: List[Dict[str, Any]]) -> None:
+        """Bulk load, building the index with a single sort"""
+        self.contacts = {contact["id"]: self._entry(contact) for contact in contacts}
+        self.tokens = sorted(
+            token for contact in contacts for token in self._entry_tokens(contact)
+        )
+
+    def suggest(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        terms = query.lower().split()
+        if not terms:
+            return []
+        scores: Optional[Dict[str, int]] = None
+        for term in terms:
+            term_scores: Dict[str, int] = {}
+            index = bisect_left(self.tokens, (term,))
+            while index < len(self.tokens) and self.tokens[index][0].startswith(term):
+                token, weight, contact_id = self.tokens[index]
+                # Exact token matches rank above plain prefix matches
+                score = weight * 2 + (1 if token == term else 0)
+                if term_scores.get(contact_id, 0) < score:
+                    term_scores[contact_id] = score
+                index += 1
+            # Every query term has to match some token of the contact
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {
+                    contact_id: score + term_scores[contact_id]
+                    for contact_id, score in scores.items()
+                    if contact_id in term_scores
+                }
+            if not scores:
+                return []
+
+        ranked = sorted(
+            scores.items(),
+            key=lambda item: (-item[1], len(self.contacts[item[0]]["display_name"]), self.contacts[item[0]]["display_name"])
+        )
+        return [dict(self.contacts[contact_id], score=score) for contact_id, score in ranked[:limit]]
+
+class ContactDirectory:
+    """
+    Per-user in-memory contact directory for recipient typeahead.
+
+    Each user's contacts are loaded once through the Graph contacts delta
+    API, run per contact folder (the default folder and the folders directly
+    under it), and then refreshed incrementally in the background, so
+    suggestions never wait on Graph after the first load.
+    """
+
+    def __init__(self):
+        self.graph_base_url = GRAPH_BASE_URL
+        self._directories: "OrderedDict[str, _Directory]" = OrderedDict()
+        self._syncing: Dict[str, asyncio.Future] = {}
+
+    async def _get_headers(self, username: str) -> Dict[str, str]:
+        token = await auth_service.get_access_token(username)
+        return {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json"
+        }
+
+    async def suggest(self, username: str, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Return the top matching contacts for a typed prefix"""
+        directory = self._directories.get(username)
+        record_cache("contact_directory", directory is not None)
+        if directory is None:
+            await self.sync(username)
+            directory = self._directories[username]
+        else:
+            self._directories.move_to_end(username)
+            max_age = subscription_manager.max_age(
+                username, "contacts", settings.CONTACTS_DIRECTORY_REFRESH_SECONDS
+            )
+            if time.time() - directory.synced_at > max_age:
+                self._schedule_sync(username)
+        return directory.suggest(query, limit)
+
+    def invalidate(self, username: str) -> None:
+        """Force the next suggestion to refresh the user's directory"""
+        directory = self._directories.get(username)
+        if directory is not None:
+            directory.synced_at = 0.0
+
+    def refresh(self, username: str) -> None:
+        """Apply pending changes to a loaded directory in the background"""
+        if username in self._directories:
+            self.invalidate(username)
+            self._schedule_sync(username)
+
+    def _schedule_sync(self, username: str) -> None:
+        if username not in self._syncing:
+            future = asyncio.ensure_future(self.sync(username))
+            future.add_done_callback(self._report_error)
+
+    def _report_error(self, future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Error refreshing contact directory: {future.exception()}")
+
+    async def sync(self, username: str) -> None:
+        """Load or incrementally refresh a user's directory; concurrent callers share one sync"""
+        future = self._syncing.get(username)
+        if future is None:
+            future = asyncio.ensure_future(self._sync(username))
+            self._syncing[username] = future
+            future.add_done_callback(lambda _: self._syncing.pop(username, None))
+        await asyncio.shield(future)
+
+    async def _folder_ids(self, username: str, headers: Dict[str, str]) -> List[str]:
+        """The default contacts folder followed by the folders under it"""
+        folder_ids = [DEFAULT_CONTACT_FOLDER]
+        url = f"{self.graph_base_url}/users/{username}/contactFolders"
+        params: Optional[Dict[str, Any]] = {"$select": "id"}
+        while url:
+            response = await graph_transport.request("GET", url, headers=headers, params=params)
+            response.raise_for_status("list contact folders")
+            folder_ids.extend(folder["id"] for folder in response.body.get("value", []))
+            url, params = response.body.get("@odata.nextLink"), None
+        return folder_ids
+
+    async def _folder_changes(
+        self,
+        username: str,
+        folder_id: str,
+        delta_link: Optional[str],
+        headers: Dict[str, str]
+    ) -> Optional[Tuple[List[Dict[str, Any]], str]]:
+        """
+        Contacts of one folder changed since delta_link, or all of them
+        without one, and the next delta link. None if delta_link expired.
+        """
+        if delta_link is None:
+            url = f"{self.graph_base_url}/users/{username}/contactFolders/{folder_id}/contacts/delta"
+            params: Optional[Dict[str, Any]] = {"$select": CONTACT_SELECT}
+        else:
+            url, params = delta_link, None
+
+        changes: List[Dict[str, Any]] = []
+        next_delta_link = None
+        while url:
+            response = await graph_transport.request("GET", url, headers=headers, params=params)
+            if response.status == 410 and delta_link is not None:
+                return None
+            response.raise_for_status("sync contacts")
+            changes.extend(response.body.get("value", []))
+            next_delta_link = response.body.get("@odata.deltaLink")
+            url, params = response.body.get("@odata.nextLink"), None
+        return changes, next_delta_link
+
+    async def _sync(self, username: str) -> None:
+        directory = self._directories.get(username)
+        headers = await self._get_headers(username)
+        folder_ids = await self._folder_ids(username, headers)
+
+        # A deleted folder's contacts can only be dropped by reloading
+        initial = directory is None or not set(directory.delta_links) <= set(folder_ids)
+        if not initial:
+            results = await asyncio.gather(*[
+                self._folder_changes(username, folder_id, directory.delta_links.get(folder_id), headers)
+                for folder_id in folder_ids
+            ])
+            # Delta token expired: reload everything
+            initial = None in results
+        if initial:
+            results = await asyncio.gather(*[
+                self._folder_changes(username, folder_id, None, headers)
+                for folder_id in folder_ids
+            ])
+            directory = _Directory()
+            directory.load([
+                contact for changes, _ in results for contact in changes if "@removed" not in contact
+            ])
+        else:
+            for changes, _ in results:
+                for contact in changes:
+                    if "@removed" in contact:
+                        directory.remove(contact["id"])
+                    else:
+                        directory.upsert(contact)
+        directory.delta_links = {
+            folder_id: delta_link for folder_id, (_, delta_link) in zip(folder_ids, results)
+        }
+        directory.synced_at = time.time()
+
+        self._directories[username] = directory
+        self._directories.move_to_end(username)
+        while len(self._directories) > settings.CONTACTS_DIRECTORY_MAX_USERS:
+            self._directories.popitem(last=False)
+
+contact_directory = ContactDirectory()
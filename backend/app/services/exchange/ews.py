@@ -0,0 +1,174 @@
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+import requests
+from exchangelib import Credentials, Account, DELEGATE, Configuration, FaultTolerance
+from exchangelib.errors import (
+    TransportError, ResponseMessageError, RateLimitError, ErrorServerBusy, ErrorTimeoutExpired,
+    ErrorInternalServerError, ErrorInternalServerTransientError, ErrorMailboxStoreUnavailable
+)
+from ...core.config import settings
+from ...core.security import auth_service
+from ...core.telemetry import record_cache, record_upstream, tracer
+from .scheduler import GraphError
+from .resilience import circuit_breakers
+
+# Server-side failures; other response message errors (e.g. ErrorItemNotFound)
+# are about the request, not the health of the server.
+_SERVER_ERRORS = (
+    RateLimitError, ErrorServerBusy, ErrorTimeoutExpired, ErrorInternalServerError,
+    ErrorInternalServerTransientError, ErrorMailboxStoreUnavailable
+)
+
+def _is_server_failure(error: Exception) -> bool:
+    if isinstance(error, _SERVER_ERRORS):
+        return True
+    if isinstance(error, ResponseMessageError):
+        return False
+    return isinstance(error, (TransportError, requests.RequestException, ConnectionError, TimeoutError))
+
+class EWSAccountPool:
+    """
+    LRU+TTL pool of ready exchangelib Account objects keyed by mailbox.
+
+    Building an Account probes the server version, so accounts are reused
+    across requests and only their credentials are swapped when the access
+    token changes. All exchangelib calls are blocking and must go through
+    run() so they execute on the bounded EWS thread pool.
+    """
+
+    def __init__(self):
+        self.ews_base_url = settings.EXCHANGE_SERVER
+        # mailbox -> (account, access token, created at)
+        self._accounts: "OrderedDict[str, Tuple[Account, Optional[str], float]]" = OrderedDict()
+        self._building: Dict[str, asyncio.Future] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._running = 0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=settings.EWS_MAX_WORKERS,
+                thread_name_prefix="ews"
+            )
+        return self._executor
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Run a blocking exchangelib call on the EWS thread pool, behind a
+        circuit breaker per called function. Server-side failures are
+        raised as GraphError(503).
+        """
+        endpoint = f"EWS {func.__name__}"
+        operation = func.__name__.lstrip("_")
+        circuit_breakers.check(endpoint)
+        loop = asyncio.get_event_loop()
+        started = time.monotonic()
+        self._running += 1
+        try:
+            with tracer.start_as_current_span(f"EWS {operation}") as span:
+                span.set_attribute("ews.operation", operation)
+                result = await loop.run_in_executor(
+                    self.executor,
+                    functools.partial(func, *args, **kwargs)
+                )
+        except Exception as e:
+            record_upstream("ews", operation, type(e).__name__, time.monotonic() - started)
+            failed = _is_server_failure(e)
+            circuit_breakers.record(endpoint, not failed)
+            if failed:
+                raise GraphError(503, f"Exchange is temporarily unavailable: {e}") from e
+            raise
+        finally:
+            self._running -= 1
+        record_upstream("ews", operation, "ok", time.monotonic() - started)
+        circuit_breakers.record(endpoint, True)
+        return result
+
+    async def get_account(self, username: str) -> Account:
+        """Get a pooled Account for the mailbox, building one if needed"""
+        token = await auth_service.get_access_token(username)
+
+        entry = self._accounts.get(username)
+        if entry is not None:
+            account, account_token, created = entry
+            if time.monotonic() - created < settings.EWS_ACCOUNT_TTL_SECONDS:
+                record_cache("ews_account", True)
+                self._accounts.move_to_end(username)
+                if account_token != token:
+                    await self.run(self._refresh_credentials, account, username, token)
+                    self._accounts[username] = (account, token, created)
+                return account
+            del self._accounts[username]
+        record_cache("ews_account", False)
+
+        # Concurrent requests for a cold mailbox share one Account build,
+        # shielded so one cancelled caller doesn't cancel it for the others
+        future = self._building.get(username)
+        if future is None:
+            future = asyncio.ensure_future(self._build(username, token))
+            self._building[username] = future
+            future.add_done_callback(lambda _: self._building.pop(username, None))
+        return await asyncio.shield(future)
+
+    async def _build(self, username: str, token: Optional[str]) -> Account:
+        account = await self.run(self._build_account, username, token)
+        self._store(username, account, token)
+        return account
+
+    def _store(self, username: str, account: Account, token: Optional[str]) -> None:
+        self._accounts[username] = (account, token, time.monotonic())
+        self._accounts.move_to_end(username)
+        while len(self._accounts) > settings.EWS_ACCOUNT_POOL_SIZE:
+            self._accounts.popitem(last=False)
+
+    def _build_account(self, username: str, token: Optional[str]) -> Account:
+        credentials = Credentials(
+            username,
+            access_token=token
+        )
+        config = Configuration(
+            server=self.ews_base_url,
+            credentials=credentials,
+            # Waits out ErrorServerBusy back-off hints instead of failing
+            retry_policy=FaultTolerance(max_wait=settings.EWS_RETRY_MAX_WAIT)
+        )
+        return Account(
+            primary_smtp_address=username,
+            config=config,
+            access_type=DELEGATE
+        )
+
+    def _refresh_credentials(self, account: Account, username: str, token: Optional[str]) -> None:
+        # Replacing the protocol credentials drops pooled EWS sessions but
+        # keeps the already negotiated server version.
+        account.protocol.credentials = Credentials(
+            username,
+            access_token=token
+        )
+
+    def pool_stats(self) -> Dict[str, float]:
+        """Busy and queued EWS calls and pooled accounts"""
+        return {
+            "in_use": min(self._running, settings.EWS_MAX_WORKERS),
+            "queued": max(self._running - settings.EWS_MAX_WORKERS, 0),
+            "limit": settings.EWS_MAX_WORKERS,
+            "accounts": len(self._accounts)
+        }
+
+    def invalidate(self, username: str) -> None:
+        """Drop the pooled Account for a mailbox"""
+        self._accounts.pop(username, None)
+
+    def close(self) -> None:
+        """Drop all pooled accounts and stop the EWS thread pool"""
+        self._accounts.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+ews_pool = EWSAccountPool()
@@ -0,0 +1,82 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from ...core.config import settings
+from ...core.telemetry import record_cache
+from .ews import ews_pool
+from .scheduler import graph_scheduler
+
+class Prefetcher:
+    """
+    Short-lived cache of reads fetched in the background before they are
+    asked for, keyed by (kind, username, ...).
+
+    Prefetching is best effort and budgeted: at most MAIL_PREFETCH_CONCURRENCY
+    fetches run at once, and nothing is started while interactive Graph or
+    EWS calls are queueing. Skipped or failed prefetches just mean the later
+    read goes upstream as usual.
+    """
+
+    def __init__(self):
+        self._entries: "OrderedDict[Tuple[Hashable, ...], Tuple[float, Any]]" = OrderedDict()
+        self._running: Dict[Tuple[Hashable, ...], asyncio.Task] = {}
+
+    def get(self, key: Tuple[Hashable, ...]) -> Optional[Any]:
+        """Prefetched value for key, or None"""
+        if not settings.MAIL_PREFETCH_ENABLED:
+            return None
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= time.monotonic():
+            del self._entries[key]
+            entry = None
+        record_cache("prefetch", entry is not None)
+        return None if entry is None else entry[1]
+
+    def _has_budget(self) -> bool:
+        if len(self._running) >= settings.MAIL_PREFETCH_CONCURRENCY:
+            return False
+        # Queued calls mean interactive requests are already waiting on upstream capacity
+        return graph_scheduler.stats()["queued"] == 0 and ews_pool.pool_stats()["queued"] == 0
+
+    def schedule(self, key: Tuple[Hashable, ...], fetch: Callable[[], Awaitable[Any]]) -> bool:
+        """Fetch key in the background if it isn't cached or running and the budget allows"""
+        if key in self._running or key in self._entries or not self._has_budget():
+            return False
+        task = asyncio.ensure_future(self._fetch(key, fetch))
+        self._running[key] = task
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return True
+
+    def _finish(self, key: Tuple[Hashable, ...], task: asyncio.Task) -> None:
+        if self._running.get(key) is task:
+            del self._running[key]
+
+    async def _fetch(self, key: Tuple[Hashable, ...], fetch: Callable[[], Awaitable[Any]]) -> None:
+        try:
+            value = await fetch()
+        except Exception as e:
+            print(f"Error prefetching {key[0]} for {key[1]}: {e}")
+            return
+        if self._running.get(key) is not asyncio.current_task():
+            # Invalidated while fetching
+            return
+        self._entries[key] = (time.monotonic() + settings.MAIL_PREFETCH_TTL_SECONDS, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > settings.MAIL_PREFETCH_MAX_ENTRIES:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, username: str) -> None:
+        """Drop everything prefetched, or being prefetched, for a user"""
+        for key in [key for key in self._entries if key[1] == username]:
+            del self._entries[key]
+        for key in [key for key in self._running if key[1] == username]:
+            del self._running[key]
+
+    def close(self) -> None:
+        """Cancel prefetches still running, e.g. on shutdown"""
+        for task in self._running.values():
+            task.cancel()
+        self._running.clear()
+
+mail_prefetcher = Prefetcher()
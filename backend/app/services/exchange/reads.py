@@ -0,0 +1,186 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+from ...core.config import settings
+from ...core.telemetry import record_cache
+from .availability import availability_service
+from .prefetch import mail_prefetcher
+from .resilience import fallback_cache
+from ..cache.tiered import graph_cache
+
+# Leading key elements each resource's reads are cached under
+RESOURCE_KINDS = {
+    "messages": ("messages", "message_detail"),
+    "events": ("events", "event"),
+    "contacts": ("contacts", "contact")
+}
+
+class ReadCoalescer:
+    """
+    Shared path for list reads keyed by (resource, username, *parameters).
+
+    Identical reads that overlap share one upstream call (single flight).
+    With READ_STALE_WHILE_REVALIDATE set, a cached result is served at once
+    for up to the resource's staleness bound, and reads older than
+    READ_FRESH_SECONDS trigger a background refresh. Writes and change
+    notifications invalidate a user's entries for the resource.
+    """
+
+    def __init__(self):
+        self._entries: "OrderedDict[Tuple[Hashable, ...], Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Tuple[Hashable, ...], asyncio.Future] = {}
+        # Bumped on invalidation so fetches started earlier are not cached
+        self._generations: Dict[Tuple[str, str], int] = {}
+        self._refreshes: Set[asyncio.Task] = set()
+
+    def _max_stale(self, resource: str) -> int:
+        return {
+            "messages": settings.READ_MAX_STALE_MESSAGES_SECONDS,
+            "events": settings.READ_MAX_STALE_EVENTS_SECONDS,
+            "contacts": settings.READ_MAX_STALE_CONTACTS_SECONDS
+        }.get(resource, 0)
+
+    def _cached(self, key: Tuple[Hashable, ...]) -> Tuple[Optional[Any], bool]:
+        """Cached value (or None) and whether it is due a refresh"""
+        if not settings.READ_STALE_WHILE_REVALIDATE:
+            return None, False
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age <= self._max_stale(key[0]):
+                record_cache("reads", True)
+                self._entries.move_to_end(key)
+                return entry[1], age > settings.READ_FRESH_SECONDS
+            del self._entries[key]
+        record_cache("reads", False)
+        return None, False
+
+    def _put(self, key: Tuple[Hashable, ...], generation: int, value: Any) -> None:
+        if not settings.READ_STALE_WHILE_REVALIDATE or self._generations.get(key[:2], 0) != generation:
+            return
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > settings.READ_CACHE_MAX_ENTRIES:
+            self._entries.popitem(last=False)
+
+    def _start(self, key: Tuple[Hashable, ...], fetch: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """Join the in-flight fetch for key, or start one"""
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(key, fetch))
+            self._inflight[key] = future
+            future.add_done_callback(lambda done: self._finish(key, done))
+        return future
+
+    def _finish(self, key: Tuple[Hashable, ...], future: asyncio.Future) -> None:
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if not future.cancelled():
+            # Retrieved here so a refresh nobody waits for doesn't log a warning
+            future.exception()
+
+    async def _fetch(self, key: Tuple[Hashable, ...], fetch: Callable[[], Awaitable[Any]]) -> Any:
+        generation = self._generations.get(key[:2], 0)
+        value = await fetch()
+        self._put(key, generation, value)
+        return value
+
+    def _refresh(self, key: Tuple[Hashable, ...], fetch: Callable[[], Awaitable[Any]]) -> None:
+        async def refresh() -> None:
+            try:
+                await self._start(key, fetch)
+            except Exception as e:
+                print(f"Error refreshing cached {key[0]} for {key[1]}: {e}")
+        task = asyncio.ensure_future(refresh())
+        self._refreshes.add(task)
+        task.add_done_callback(self._refreshes.discard)
+
+    async def call(self, key: Tuple[Hashable, ...], fetch: Callable[[], Awaitable[Any]]) -> Any:
+        if not settings.READ_COALESCING_ENABLED:
+            return await fetch()
+        cached, stale = self._cached(key)
+        if cached is not None:
+            if stale:
+                self._refresh(key, fetch)
+            return cached
+        # Shielded so one caller going away doesn't cancel the others' fetch
+        return await asyncio.shield(self._start(key, fetch))
+
+    async def iterate(self, key: Tuple[Hashable, ...], fetch: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """
+        Like call() for streamed reads. The first reader streams as items
+        arrive; identical reads that start meanwhile get the complete result.
+        """
+        if not settings.READ_COALESCING_ENABLED:
+            async for item in fetch():
+                yield item
+            return
+
+        async def collect() -> List[Any]:
+            return [item async for item in fetch()]
+
+        cached, stale = self._cached(key)
+        if cached is not None:
+            if stale:
+                self._refresh(key, collect)
+            for item in cached:
+                yield item
+            return
+
+        future = self._inflight.get(key)
+        if future is not None:
+            items = await asyncio.shield(future)
+            if items is not None:
+                for item in items:
+                    yield item
+                return
+            # The reader streaming it went away before the end; fetch it ourselves
+
+        future = asyncio.get_event_loop().create_future()
+        self._inflight[key] = future
+        future.add_done_callback(lambda done: self._finish(key, done))
+        generation = self._generations.get(key[:2], 0)
+        items = []
+        try:
+            async for item in fetch():
+                items.append(item)
+                yield item
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            future.set_result(None)
+            raise
+        self._put(key, generation, items)
+        future.set_result(items)
+
+    def invalidate(self, resource: str, username: str) -> None:
+        """Drop cached reads of a resource for one user and detach in-flight fetches"""
+        scope = (resource, username)
+        self._generations[scope] = self._generations.get(scope, 0) + 1
+        for key in [key for key in self._entries if key[:2] == scope]:
+            del self._entries[key]
+        for key in [key for key in self._inflight if key[:2] == scope]:
+            del self._inflight[key]
+
+    def close(self) -> None:
+        """Cancel background refreshes, e.g. on shutdown"""
+        for task in self._refreshes:
+            task.cancel()
+
+read_coalescer = ReadCoalescer()
+
+async def invalidate_reads(resource: str, username: str) -> None:
+    """
+    Drop every cached copy of a user's reads of a resource: coalesced,
+    fallback, prefetched, tiered and derived free/busy. Writes and change
+    notifications go through here so none of them is left serving stale data.
+    """
+    read_coalescer.invalidate(resource, username)
+    fallback_cache.invalidate(RESOURCE_KINDS[resource], username)
+    if resource == "messages":
+        mail_prefetcher.invalidate(username)
+    if resource == "events":
+        availability_service.invalidate(username)
+    await graph_cache.invalidate(resource, username)
@@ -0,0 +1,229 @@
+import time
+from collections import deque, OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+from urllib.parse import urlsplit
+from ...core.config import settings
+from ...core.telemetry import record_cache
+from .scheduler import GraphError
+
+class CircuitOpenError(GraphError):
+    """An upstream endpoint is failing and calls to it are short-circuited"""
+
+    def __init__(self, endpoint: str, retry_after: float):
+        super().__init__(503, f"Upstream endpoint temporarily disabled after repeated failures: {endpoint}", retry_after)
+        self.endpoint = endpoint
+
+def endpoint_key(method: str, url: str) -> str:
+    """
+    Normalize a Graph URL into an endpoint name, e.g.
+    "GET /users/{user}/mailFolders/inbox/messages"
+    """
+    segments = urlsplit(url).path.strip("/").split("/")
+    # Drop the API version prefix ("v1.0", "beta")
+    if segments and segments[0].startswith(("v1", "beta")):
+        segments = segments[1:]
+    normalized = []
+    for index, segment in enumerate(segments):
+        if index > 0 and segments[index - 1].lower() == "users":
+            normalized.append("{user}")
+        elif len(segment) >= 24:
+            normalized.append("{id}")
+        else:
+            normalized.append(segment)
+    return f"{method.upper()} /{'/'.join(normalized)}"
+
+class LatencyTracker:
+    """Recent latencies per endpoint, used to pick hedging delays"""
+
+    def __init__(self):
+        self._samples: Dict[str, Deque[float]] = {}
+        self._requests: Dict[str, int] = {}
+        self._hedges: Dict[str, int] = {}
+
+    def record(self, endpoint: str, seconds: float) -> None:
+        samples = self._samples.get(endpoint)
+        if samples is None:
+            samples = self._samples[endpoint] = deque(maxlen=settings.GRAPH_HEDGE_SAMPLE_SIZE)
+        samples.append(seconds)
+
+    def percentile(self, endpoint: str, fraction: float) -> Optional[float]:
+        samples = self._samples.get(endpoint)
+        if not samples or len(samples) < settings.GRAPH_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[int(fraction * (len(ordered) - 1))]
+
+    def hedge_delay(self, endpoint: str) -> Optional[float]:
+        """
+        Seconds to wait before hedging a request to this endpoint, or None if
+        there is not enough history or the hedge budget is spent
+        """
+        requests = self._requests.get(endpoint, 0) + 1
+        hedges = self._hedges.get(endpoint, 0)
+        if requests > 1000:
+            # Decay so the budget tracks recent traffic
+            requests, hedges = requests // 2, hedges // 2
+        self._requests[endpoint] = requests
+        self._hedges[endpoint] = hedges
+        if hedges >= requests * settings.GRAPH_HEDGE_MAX_RATIO:
+            return None
+        delay = self.percentile(endpoint, settings.GRAPH_HEDGE_PERCENTILE)
+        if delay is None:
+            return None
+        return min(
+            max(delay, settings.GRAPH_HEDGE_MIN_DELAY_MS / 1000),
+            settings.GRAPH_HEDGE_MAX_DELAY_MS / 1000
+        )
+
+    def hedged(self, endpoint: str) -> None:
+        self._hedges[endpoint] = self._hedges.get(endpoint, 0) + 1
+
+class CircuitBreaker:
+    """
+    Rolling error-rate breaker for one endpoint.
+
+    Opens when at least CIRCUIT_MIN_REQUESTS calls in the last
+    CIRCUIT_WINDOW_SECONDS failed at CIRCUIT_ERROR_THRESHOLD or more. After
+    CIRCUIT_OPEN_SECONDS a single probe call is let through; its outcome
+    closes or re-opens the circuit.
+    """
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._probe_started = 0.0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < settings.CIRCUIT_OPEN_SECONDS:
+            return "open"
+        return "half-open"
+
+    def check(self) -> None:
+        """Raise CircuitOpenError unless a call may go through now"""
+        state = self.state
+        if state == "closed":
+            return
+        now = time.monotonic()
+        # A probe that never reported back (e.g. cancelled) must not wedge the circuit
+        if state == "half-open" and (
+            not self._probing or now - self._probe_started > settings.CIRCUIT_OPEN_SECONDS
+        ):
+            self._probing = True
+            self._probe_started = now
+            return
+        remaining = settings.CIRCUIT_OPEN_SECONDS - (now - self._opened_at)
+        raise CircuitOpenError(self.endpoint, max(remaining, 1.0))
+
+    def record(self, ok: bool) -> None:
+        now = time.monotonic()
+        if self._opened_at is not None:
+            if not self._probing:
+                # A call that started before the circuit opened
+                return
+            self._probing = False
+            if ok:
+                self._opened_at = None
+                self._outcomes.clear()
+            else:
+                self._opened_at = now
+            return
+
+        self._outcomes.append((now, ok))
+        cutoff = now - settings.CIRCUIT_WINDOW_SECONDS
+        while self._outcomes and self._outcomes[0][0] < cutoff:
+            self._outcomes.popleft()
+        if len(self._outcomes) >= settings.CIRCUIT_MIN_REQUESTS:
+            failures = sum(1 for _, success in self._outcomes if not success)
+            if failures / len(self._outcomes) >= settings.CIRCUIT_ERROR_THRESHOLD:
+                self._opened_at = now
+                print(f"Circuit opened for {self.endpoint}: {failures}/{len(self._outcomes)} calls failed")
+
+class CircuitBreakers:
+    """Circuit breakers for Graph and EWS, one per endpoint"""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, endpoint: str) -> CircuitBreaker:
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = self._breakers[endpoint] = CircuitBreaker(endpoint)
+        return breaker
+
+    def check(self, endpoint: str) -> None:
+        if settings.CIRCUIT_BREAKER_ENABLED:
+            self.get(endpoint).check()
+
+    def record(self, endpoint: str, ok: bool) -> None:
+        if settings.CIRCUIT_BREAKER_ENABLED:
+            self.get(endpoint).record(ok)
+
+    def open_circuits(self) -> List[str]:
+        return [name for name, breaker in self._breakers.items() if breaker.state != "closed"]
+
+class FallbackCache:
+    """
+    Last successful result of each read, served when the upstream call fails
+    with a GraphError (including an open circuit) instead of surfacing the error.
+    """
+
+    def __init__(self):
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def _get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > settings.CIRCUIT_FALLBACK_MAX_AGE_SECONDS:
+            return None
+        return entry[1]
+
+    def _put(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > settings.CIRCUIT_FALLBACK_MAX_ENTRIES:
+            self._entries.popitem(last=False)
+
+    async def call(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await fetch()
+        except GraphError as e:
+            cached = self._get(key)
+            record_cache("fallback", cached is not None)
+            if cached is None:
+                raise
+            print(f"Serving cached {key[0]} after upstream failure: {e}")
+            return cached
+        self._put(key, value)
+        return value
+
+    async def iterate(self, key: Hashable, fetch: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Like call() for streamed reads; falls back only if nothing was yielded yet"""
+        items = []
+        try:
+            async for item in fetch():
+                items.append(item)
+                yield item
+        except GraphError as e:
+            cached = self._get(key)
+            if items or cached is None:
+                record_cache("fallback", False)
+                raise
+            record_cache("fallback", True)
+            print(f"Serving cached {key[0]} after upstream failure: {e}")
+            for item in cached:
+                yield item
+            return
+        self._put(key, items)
+
+    def invalidate(self, kinds: Tuple[str, ...], username: str) -> None:
+        """Drop a user's results for keys starting with any of kinds"""
+        for key in [key for key in self._entries if key[0] in kinds and key[1] == username]:
+            del self._entries[key]
+
+latency_tracker = LatencyTracker()
+circuit_breakers = CircuitBreakers()
+fallback_cache = FallbackCache()
@@ -0,0 +1,256 @@
+import asyncio
+import random
+import re
+import time
+from contextlib import asynccontextmanager, AsyncExitStack
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Mapping, Optional
+from urllib.parse import unquote, urlsplit
+import aiohttp
+from opentelemetry import trace
+from ...core.config import settings
+from ...core.telemetry import tracer
+
+# Requests that can be repeated without side effects if the first attempt was lost
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+# Throttled (429) requests were rejected before processing and are always
+# safe to retry; the others only for idempotent methods.
+RETRYABLE_STATUSES = {429, 503, 504}
+
+# Requests outside any mailbox, such as /subscriptions, share this key
+APP_KEY = "*"
+
+# Floor for a worker's share of GRAPH_MAILBOX_RATE_PER_SECOND, so a zero or
+# tiny rate slows a mailbox down instead of stalling it or dividing by zero
+MIN_MAILBOX_RATE_PER_SECOND = 0.1
+
+# Graph addresses mailboxes as /users/{id}; Outlook upload session URLs as /Users('{id}')
+_MAILBOX = re.compile(r"/users(?:/|\(')([^/?()']+)", re.IGNORECASE)
+
+class GraphError(Exception):
+    """
+    An upstream Exchange call failed in a way worth passing on to the client:
+    throttled or unavailable after all retries, or short-circuited
+    """
+
+    def __init__(self, status: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+def mailbox_of(url: str) -> str:
+    """Mailbox a Graph URL addresses, used as the throttling key"""
+    match = _MAILBOX.search(urlsplit(url).path if "://" in url else url)
+    return unquote(match.group(1)).lower() if match else APP_KEY
+
+def mailbox_concurrency() -> int:
+    """
+    This worker's share of GRAPH_MAILBOX_CONCURRENCY. Outlook counts
+    requests from every worker process against the same mailbox limits.
+    """
+    return max(1, settings.GRAPH_MAILBOX_CONCURRENCY // settings.SERVER_WORKERS)
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    for name, value in headers.items():
+        if name.lower() == "retry-after":
+            try:
+                return max(float(value), 0.0)
+            except (TypeError, ValueError):
+                return None
+    return None
+
+class _MailboxLimiter:
+    """Concurrency cap, token bucket and Retry-After pause for one mailbox"""
+
+    def __init__(self):
+        # Per-worker shares of the mailbox limits, like mailbox_concurrency()
+        self.concurrency = mailbox_concurrency()
+        self.burst = max(1.0, settings.GRAPH_MAILBOX_BURST / settings.SERVER_WORKERS)
+        self.rate = max(
+            MIN_MAILBOX_RATE_PER_SECOND,
+            settings.GRAPH_MAILBOX_RATE_PER_SECOND / settings.SERVER_WORKERS
+        )
+        self.in_flight = 0
+        self.queued = 0
+        self.tokens = self.burst
+        self.refilled_at = time.monotonic()
+        self.paused_until = 0.0
+        self.condition = asyncio.Condition()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(
+            self.burst,
+            self.tokens + (now - self.refilled_at) * self.rate
+        )
+        self.refilled_at = now
+
+    async def acquire(self, requests: int) -> int:
+        """Wait for capacity for a number of requests; returns the concurrency units held"""
+        units = min(requests, self.concurrency)
+        tokens = min(requests, self.burst)
+        self.queued += 1
+        try:
+            async with self.condition:
+                while True:
+                    delay = self.paused_until - time.monotonic()
+                    if delay <= 0:
+                        self._refill()
+                        if self.tokens < tokens:
+                            delay = (tokens - self.tokens) / self.rate
+                    if delay > 0:
+                        # Sleep outside the condition so other waiters can check in
+                        self.condition.release()
+                        try:
+                            await asyncio.sleep(delay)
+                        finally:
+                            await self.condition.acquire()
+                        continue
+                    if self.in_flight + units > self.concurrency:
+                        await self.condition.wait()
+                        continue
+                    self.tokens -= tokens
+                    self.in_flight += units
+                    return units
+        finally:
+            self.queued -= 1
+
+    async def release(self, units: int) -> None:
+        async with self.condition:
+            self.in_flight -= units
+            self.condition.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    @property
+    def idle(self) -> bool:
+        return self.in_flight == 0 and self.queued == 0 and self.paused_until <= time.monotonic()
+
+class GraphScheduler:
+    """
+    Shared upstream scheduler for every Graph request.
+
+    Applies Outlook's per-mailbox limits locally: at most
+    GRAPH_MAILBOX_CONCURRENCY requests in flight and a token bucket of
+    GRAPH_MAILBOX_RATE_PER_SECOND, so bursts queue here instead of being
+    rejected upstream. Under SERVER_WORKERS processes each worker applies
+    its share of these limits. Throttled responses pause the mailbox for
+    the Retry-After period and are retried with jittered exponential
+    backoff.
+    """
+
+    def __init__(self):
+        self._limiters: Dict[str, _MailboxLimiter] = {}
+
+    def _limiter(self, mailbox: str) -> _MailboxLimiter:
+        limiter = self._limiters.get(mailbox)
+        if limiter is None:
+            limiter = self._limiters[mailbox] = _MailboxLimiter()
+        return limiter
+
+    @asynccontextmanager
+    async def limit(self, mailboxes: Iterable[str]) -> AsyncIterator[None]:
+        """Hold capacity for one request per entry in mailboxes"""
+        counts: Dict[str, int] = {}
+        for mailbox in mailboxes:
+            counts[mailbox] = counts.get(mailbox, 0) + 1
+        held = []
+        try:
+            # Fixed acquisition order so multi-mailbox batches can't deadlock
+            with tracer.start_as_current_span("Graph queue"):
+                for mailbox in sorted(counts):
+                    limiter = self._limiter(mailbox)
+                    held.append((limiter, await limiter.acquire(counts[mailbox])))
+            yield
+        finally:
+            for limiter, units in held:
+                await limiter.release(units)
+            self._prune()
+
+    def pause(self, mailboxes: Iterable[str], seconds: float) -> None:
+        for mailbox in set(mailboxes):
+            self._limiter(mailbox).pause(seconds)
+
+    async def run(
+        self,
+        mailboxes: List[str],
+        idempotent: bool,
+        send: Callable[[], Awaitable[Any]],
+        hold: Optional[AsyncExitStack] = None
+    ) -> Any:
+        """
+        Send a request under the mailbox limits, retrying throttled and
+        transient failures. Raises GraphError once retries are exhausted.
+        With hold, the capacity used by the returned response is released
+        only when hold closes, for responses whose body is streamed later.
+        """
+        attempt = 0
+        while True:
+            try:
+                async with AsyncExitStack() as held:
+                    await held.enter_async_context(self.limit(mailboxes))
+                    response = await send()
+                    if hold is not None and response.status not in RETRYABLE_STATUSES:
+                        hold.push_async_callback(held.pop_all().aclose)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if not idempotent or attempt >= settings.GRAPH_MAX_RETRIES:
+                    raise GraphError(503, f"Graph is unreachable: {e or type(e).__name__}")
+                trace.get_current_span().add_event("retry", {"error": type(e).__name__})
+                await asyncio.sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+
+            if response.status not in RETRYABLE_STATUSES:
+                return response
+            retry_after = parse_retry_after(response.headers)
+            if response.status == 429:
+                self.pause(mailboxes, retry_after if retry_after is not None else self.backoff(attempt))
+
+            retryable = response.status == 429 or idempotent
+            too_long = retry_after is not None and retry_after > settings.GRAPH_MAX_RETRY_AFTER
+            if not retryable or too_long or attempt >= settings.GRAPH_MAX_RETRIES:
+                raise GraphError(
+                    response.status,
+                    "Microsoft Graph is throttling requests for this mailbox"
+                    if response.status == 429 else "Microsoft Graph is temporarily unavailable",
+                    retry_after
+                )
+            trace.get_current_span().add_event("retry", {"http.status_code": response.status})
+            # The pause already delays 429 retries inside limit()
+            if response.status != 429:
+                await asyncio.sleep(retry_after if retry_after is not None else self.backoff(attempt))
+            attempt += 1
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff"""
+        ceiling = min(settings.GRAPH_RETRY_MAX_DELAY, settings.GRAPH_RETRY_BASE_DELAY * 2 ** attempt)
+        return random.uniform(0, ceiling)
+
+    def _prune(self) -> None:
+        if len(self._limiters) > settings.GRAPH_SCHEDULER_MAX_MAILBOXES:
+            for mailbox in [m for m, limiter in self._limiters.items() if limiter.idle]:
+                del self._limiters[mailbox]
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and throttling state across all mailboxes"""
+        now = time.monotonic()
+        return {
+            "queued": sum(limiter.queued for limiter in self._limiters.values()),
+            "in_flight": sum(limiter.in_flight for limiter in self._limiters.values()),
+            "paused_mailboxes": sum(
+                1 for limiter in self._limiters.values() if limiter.paused_until > now
+            )
+        }
+
+    def mailbox_stats(self, mailbox: str) -> Dict[str, Any]:
+        limiter = self._limiters.get(mailbox.lower())
+        if limiter is None:
+            return {"queued": 0, "in_flight": 0, "paused_for": 0.0}
+        return {
+            "queued": limiter.queued,
+            "in_flight": limiter.in_flight,
+            "paused_for": max(limiter.paused_until - time.monotonic(), 0.0)
+        }
+
+graph_scheduler = GraphScheduler()
@@ -0,0 +1,285 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from ...core.config import settings
+from ...core.security import auth_service
+from ...core.telemetry import record_cache
+from ..search.index import mail_search_index
+from ..notifications.subscriptions import subscription_manager
+from .transport import graph_transport, GRAPH_BASE_URL
+from .scheduler import GraphError
+
+MESSAGE_SELECT = "id,subject,from,toRecipients,receivedDateTime,hasAttachments,bodyPreview,isRead,changeKey"
+
+class MailboxMirror:
+    """
+    Local per-mailbox mirror of message headers maintained with Graph delta queries.
+
+    Each (mailbox, folder) pair keeps its own delta link, so a refresh only
+    transfers messages added, changed or removed since the previous sync.
+    Headers and delta links are persisted in SQLite and survive restarts.
+    """
+
+    def __init__(self):
+        self.graph_base_url = GRAPH_BASE_URL
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._syncing: Dict[Tuple[str, str], asyncio.Future] = {}
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(settings.MAIL_MIRROR_DB_PATH)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(settings.MAIL_MIRROR_DB_PATH, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    mailbox TEXT NOT NULL,
+                    folder TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    received TEXT,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (mailbox, folder, id)
+                );
+                CREATE INDEX IF NOT EXISTS messages_by_date
+                    ON messages (mailbox, folder, received DESC);
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    mailbox TEXT NOT NULL,
+                    folder TEXT NOT NULL,
+                    delta_link TEXT,
+                    synced_at REAL,
+                    PRIMARY KEY (mailbox, folder)
+                );
+            """)
+        return self._conn
+
+    async def _run(self, func, *args) -> Any:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, func, *args)
+
+    async def _get_headers(self, username: str) -> Dict[str, str]:
+        token = await auth_service.get_access_token(username)
+        return {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json",
+            "Prefer": f"odata.maxpagesize={settings.MAIL_MIRROR_PAGE_SIZE}"
+        }
+
+    async def get_messages(
+        self,
+        username: str,
+        folder: str = "inbox",
+        page_size: int = 50,
+        page_token: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Get a page of message headers from the mirror, syncing first if it
+        is stale. Until a folder's first sync completes, pages are read from
+        Graph while the sync runs in the background.
+        """
+        # Page tokens are mirror offsets; any other token, such as a Graph
+        # skiptoken issued before the mirror was enabled, restarts paging.
+        offset = int(page_token) if page_token and page_token.isdigit() else 0
+        state = await self._run(self._read_state, username, folder)
+        if state is None:
+            record_cache("mail_mirror", False)
+            self.schedule_sync(username, folder)
+            return await self._read_upstream(username, folder, page_size, offset)
+
+        # With a live change subscription the mirror is only re-synced when
+        # a notification marks it stale, or as a fallback after a long while.
+        max_age = subscription_manager.max_age(username, "messages", settings.MAIL_MIRROR_MAX_AGE_SECONDS)
+        stale = time.time() - (state[1] or 0) > max_age
+        record_cache("mail_mirror", not stale)
+        if stale:
+            try:
+                await self.sync(username, folder)
+            except GraphError as e:
+                # Serve the last synced copy while Graph is failing
+                print(f"Serving stale mirror of {folder} after sync failure: {e}")
+
+        rows = await self._run(self._read_page, username, folder, page_size + 1, offset)
+        return {
+            "messages": [json.loads(row) for row in rows[:page_size]],
+            "nextPageToken": str(offset + page_size) if len(rows) > page_size else None
+        }
+
+    async def _read_upstream(
+        self,
+        username: str,
+        folder: str,
+        page_size: int,
+        offset: int
+    ) -> Dict[str, Any]:
+        """Read a page straight from Graph, with the mirror's offset page tokens"""
+        token = await auth_service.get_access_token(username)
+        response = await graph_transport.request(
+            "GET",
+            f"{self.graph_base_url}/users/{username}/mailFolders/{folder}/messages",
+            headers={
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json"
+            },
+            params={
+                "$top": page_size,
+                "$skip": offset,
+                "$orderby": "receivedDateTime desc",
+                "$select": MESSAGE_SELECT
+            },
+            hedge=True
+        )
+        response.raise_for_status("get messages")
+        return {
+            "messages": response.body.get("value", []),
+            "nextPageToken": str(offset + page_size) if "@odata.nextLink" in response.body else None
+        }
+
+    async def sync(self, username: str, folder: str = "inbox") -> None:
+        """Bring the mirror up to date; concurrent callers share one sync"""
+        key = (username, folder)
+        future = self._syncing.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._sync(username, folder))
+            self._syncing[key] = future
+            future.add_done_callback(lambda _: self._syncing.pop(key, None))
+        await future
+
+    def schedule_sync(self, username: str, folder: str = "inbox") -> None:
+        """Sync in the background without delaying the caller"""
+        future = asyncio.ensure_future(self.sync(username, folder))
+        future.add_done_callback(self._report_error)
+
+    def _report_error(self, future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Error syncing mailbox mirror: {future.exception()}")
+
+    async def invalidate(self, username: str) -> List[str]:
+        """Mark every mirrored folder of a mailbox stale; returns those folders"""
+        return await self._run(self._invalidate, username)
+
+    async def _sync(self, username: str, folder: str) -> None:
+        state = await self._run(self._read_state, username, folder)
+        delta_link = state[0] if state else None
+        if delta_link:
+            url, params = delta_link, None
+        else:
+            # Drop whatever an interrupted first sync left behind
+            await self._run(self._reset, username, folder)
+            url = f"{self.graph_base_url}/users/{username}/mailFolders/{folder}/messages/delta"
+            params = {"$select": MESSAGE_SELECT}
+
+        headers = await self._get_headers(username)
+        reset = False
+        while url:
+            response = await graph_transport.request("GET", url, headers=headers, params=params)
+            if response.status == 410 and not reset:
+                # Delta token expired upstream: drop the mirror and start over, once
+                reset = True
+                await self._run(self._reset, username, folder)
+                url = f"{self.graph_base_url}/users/{username}/mailFolders/{folder}/messages/delta"
+                params = {"$select": MESSAGE_SELECT}
+                continue
+            response.raise_for_status("sync folder")
+            data = response.body
+
+            next_link = data.get("@odata.nextLink")
+            updated, removed = await self._run(
+                self._apply_changes,
+                username,
+                folder,
+                data.get("value", []),
+                data.get("@odata.deltaLink")
+            )
+            await mail_search_index.index_messages(username, folder, updated)
+            await mail_search_index.remove_messages(username, removed)
+            url, params = next_link, None
+
+    def _read_state(self, username: str, folder: str) -> Optional[Tuple[Optional[str], Optional[float]]]:
+        with self._lock:
+            return self.conn.execute(
+                "SELECT delta_link, synced_at FROM sync_state WHERE mailbox = ? AND folder = ?",
+                (username, folder)
+            ).fetchone()
+
+    def _read_page(self, username: str, folder: str, limit: int, offset: int) -> List[str]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT data FROM messages WHERE mailbox = ? AND folder = ? "
+                "ORDER BY received DESC LIMIT ? OFFSET ?",
+                (username, folder, limit, offset)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def _apply_changes(
+        self,
+        username: str,
+        folder: str,
+        changes: List[Dict[str, Any]],
+        delta_link: Optional[str]
+    ) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Apply one page of delta changes; returns (merged messages, removed ids)"""
+        updated = []
+        removed = []
+        with self._lock, self.conn:
+            for item in changes:
+                if "@removed" in item:
+                    self.conn.execute(
+                        "DELETE FROM messages WHERE mailbox = ? AND folder = ? AND id = ?",
+                        (username, folder, item["id"])
+                    )
+                    removed.append(item["id"])
+                    continue
+                # Updates may carry only the changed properties, so merge them
+                # into whatever is already mirrored.
+                existing = self.conn.execute(
+                    "SELECT data FROM messages WHERE mailbox = ? AND folder = ? AND id = ?",
+                    (username, folder, item["id"])
+                ).fetchone()
+                message = json.loads(existing[0]) if existing else {}
+                message.update({k: v for k, v in item.items() if not k.startswith("@odata")})
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO messages (mailbox, folder, id, received, data) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (username, folder, item["id"], message.get("receivedDateTime"), json.dumps(message))
+                )
+                updated.append(message)
+            if delta_link:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO sync_state (mailbox, folder, delta_link, synced_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (username, folder, delta_link, time.time())
+                )
+        return updated, removed
+
+    def _invalidate(self, username: str) -> List[str]:
+        with self._lock, self.conn:
+            rows = self.conn.execute(
+                "SELECT folder FROM sync_state WHERE mailbox = ?", (username,)
+            ).fetchall()
+            self.conn.execute(
+                "UPDATE sync_state SET synced_at = 0 WHERE mailbox = ?", (username,)
+            )
+        return [row[0] for row in rows]
+
+    def _reset(self, username: str, folder: str) -> None:
+        with self._lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM messages WHERE mailbox = ? AND folder = ?", (username, folder)
+            )
+            self.conn.execute(
+                "DELETE FROM sync_state WHERE mailbox = ? AND folder = ?", (username, folder)
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+mailbox_mirror = MailboxMirror()
@@ -0,0 +1,317 @@
+import asyncio
+import json
+import time
+from contextlib import AsyncExitStack
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Mapping, Optional
+import aiohttp
+from opentelemetry import trace
+from opentelemetry.trace import SpanKind
+from ...core.config import settings
+from ...core.telemetry import record_upstream, tracer
+from .scheduler import graph_scheduler, mailbox_of, GraphError, IDEMPOTENT_METHODS
+from .resilience import circuit_breakers, endpoint_key, latency_tracker, CircuitOpenError
+
+GRAPH_BASE_URL = settings.GRAPH_BASE_URL
+
+class GraphResponse:
+    """
+    Status, headers and decoded JSON body of a Graph response. Streamed
+    responses leave the body unread in content instead.
+    """
+
+    def __init__(
+        self,
+        status: int,
+        headers: Mapping[str, str],
+        body: Any,
+        content: Optional[aiohttp.StreamReader] = None
+    ):
+        self.status = status
+        self.headers = headers
+        self.body = body if body is not None else {}
+        self.content = content
+
+    def raise_for_status(self, action: str) -> None:
+        """Raise for error responses; upstream failures (5xx) as GraphError"""
+        if self.status < 400:
+            return
+        error = self.body.get("error", {}) if isinstance(self.body, dict) else {}
+        message = f"Failed to {action}: {error.get('message') or f'HTTP {self.status}'}"
+        if self.status >= 500:
+            raise GraphError(self.status, message)
+        raise Exception(message)
+
+class GraphTransport:
+    """
+    Application-scoped HTTP transport shared by all Graph service classes.
+
+    Holds a single pooled aiohttp session so requests to graph.microsoft.com
+    reuse keep-alive connections instead of paying a TCP+TLS handshake each time.
+    """
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._connector: Optional[aiohttp.TCPConnector] = None
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        self._connector = aiohttp.TCPConnector(
+            limit=settings.GRAPH_POOL_LIMIT,
+            limit_per_host=settings.GRAPH_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=settings.GRAPH_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=settings.GRAPH_DNS_CACHE_TTL,
+            use_dns_cache=True,
+            enable_cleanup_closed=True
+        )
+        return aiohttp.ClientSession(
+            connector=self._connector,
+            timeout=aiohttp.ClientTimeout(total=settings.GRAPH_REQUEST_TIMEOUT)
+        )
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Shared client session, created lazily if startup has not run"""
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+        return self._session
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        params: Optional[Dict[str, Any]] = None,
+        json_body: Optional[Any] = None,
+        hedge: bool = False,
+        data: Optional[bytes] = None
+    ) -> GraphResponse:
+        """
+        Send one request over the shared session and read the whole response.
+        The body is json_body encoded as JSON, or raw data.
+
+        Requests go through the upstream scheduler, which applies per-mailbox
+        limits and retries throttled calls; GraphError is raised if Graph is
+        still throttling or unavailable after the last retry. Each endpoint
+        has a circuit breaker that fails calls fast while Graph keeps erroring.
+        With hedge set, a GET that is slower than the endpoint's recent p95
+        is raced against a second copy when GRAPH_HEDGING_ENABLED is on.
+        The call is traced as one span with a child span per HTTP attempt.
+        """
+        endpoint = endpoint_key(method, url)
+        with tracer.start_as_current_span(f"Graph {endpoint}") as span:
+            span.set_attribute("graph.endpoint", endpoint)
+            response = await self._request(
+                endpoint,
+                method,
+                url,
+                json_body,
+                lambda: self._send(endpoint, method, url, headers, params, json_body, data),
+                hedge
+            )
+            span.set_attribute("http.status_code", response.status)
+            return response
+
+    async def stream(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        action: str,
+        chunk_size: int
+    ) -> AsyncIterator[bytes]:
+        """
+        GET a response too large to read whole and yield its body in chunks.
+
+        Goes through the same scheduler, retries and circuit breaker as
+        request(), and the mailbox's concurrency stays held until the body
+        has been read. Error responses raise as in raise_for_status.
+        """
+        endpoint = endpoint_key("GET", url)
+        async with AsyncExitStack() as hold:
+            with tracer.start_as_current_span(f"Graph {endpoint}") as span:
+                span.set_attribute("graph.endpoint", endpoint)
+                response = await self._request(
+                    endpoint,
+                    "GET",
+                    url,
+                    None,
+                    lambda: self._open(endpoint, url, headers, hold),
+                    False,
+                    hold
+                )
+                span.set_attribute("http.status_code", response.status)
+            response.raise_for_status(action)
+            async for chunk in response.content.iter_chunked(chunk_size):
+                yield chunk
+
+    async def _request(
+        self,
+        endpoint: str,
+        method: str,
+        url: str,
+        json_body: Optional[Any],
+        attempt: Callable[[], Awaitable[GraphResponse]],
+        hedge: bool,
+        hold: Optional[AsyncExitStack] = None
+    ) -> GraphResponse:
+        circuit_breakers.check(endpoint)
+        if url.endswith("/$batch") and isinstance(json_body, dict):
+            # Every sub-request counts against its own mailbox's limits, and
+            # a batch is only as idempotent as its sub-requests.
+            sub_requests = json_body.get("requests", [])
+            mailboxes = [mailbox_of(sub["url"]) for sub in sub_requests]
+            idempotent = all(sub["method"].upper() in IDEMPOTENT_METHODS for sub in sub_requests)
+        else:
+            mailboxes = [mailbox_of(url)]
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+
+        def send() -> Any:
+            return graph_scheduler.run(mailboxes, idempotent, attempt, hold)
+
+        try:
+            if hedge and settings.GRAPH_HEDGING_ENABLED and method.upper() == "GET":
+                response = await self._hedged(endpoint, send)
+            else:
+                response = await send()
+        except CircuitOpenError:
+            raise
+        except GraphError as e:
+            # Throttling is per mailbox and handled by the scheduler; it
+            # says nothing about the health of the endpoint as a whole.
+            circuit_breakers.record(endpoint, e.status == 429)
+            raise
+        except Exception:
+            circuit_breakers.record(endpoint, False)
+            raise
+        circuit_breakers.record(endpoint, response.status < 500)
+        return response
+
+    async def _hedged(self, endpoint: str, send: Any) -> GraphResponse:
+        """Start a second copy of a slow request and return whichever finishes first"""
+        delay = latency_tracker.hedge_delay(endpoint)
+        primary = asyncio.ensure_future(send())
+        if delay is None:
+            return await primary
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        latency_tracker.hedged(endpoint)
+        trace.get_current_span().add_event("hedged", {"delay_seconds": delay})
+        pending = {primary, asyncio.ensure_future(send())}
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Use the first success; if one copy fails, wait for the other
+                succeeded = [task for task in done if task.exception() is None]
+                if succeeded:
+                    return succeeded[0].result()
+                if not pending:
+                    return done.pop().result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _send(
+        self,
+        endpoint: str,
+        method: str,
+        url: str,
+        headers: Optional[Dict[str, str]],
+        params: Optional[Dict[str, Any]],
+        json_body: Optional[Any],
+        data: Optional[bytes]
+    ) -> GraphResponse:
+        started = time.monotonic()
+        with tracer.start_as_current_span(f"HTTP {method.upper()}", kind=SpanKind.CLIENT) as span:
+            span.set_attribute("http.method", method.upper())
+            span.set_attribute("http.url", url)
+            try:
+                async with self.session.request(
+                    method,
+                    url,
+                    headers=headers,
+                    params=params,
+                    json=json_body,
+                    data=data
+                ) as response:
+                    content = await response.read()
+                    body = json.loads(content) if content and "json" in response.content_type else None
+            except Exception as e:
+                record_upstream("graph", endpoint, type(e).__name__, time.monotonic() - started)
+                raise
+            span.set_attribute("http.status_code", response.status)
+        elapsed = time.monotonic() - started
+        latency_tracker.record(endpoint, elapsed)
+        record_upstream("graph", endpoint, response.status, elapsed)
+        return GraphResponse(response.status, response.headers, body)
+
+    async def _open(
+        self,
+        endpoint: str,
+        url: str,
+        headers: Dict[str, str],
+        hold: AsyncExitStack
+    ) -> GraphResponse:
+        """Like _send, but a 200 response is left open with its body unread until hold closes"""
+        started = time.monotonic()
+        with tracer.start_as_current_span("HTTP GET", kind=SpanKind.CLIENT) as span:
+            span.set_attribute("http.method", "GET")
+            span.set_attribute("http.url", url)
+            try:
+                response = await self.session.get(
+                    url,
+                    headers=headers,
+                    # Large downloads may legitimately outlast the default total timeout
+                    timeout=aiohttp.ClientTimeout(total=None, sock_read=settings.GRAPH_REQUEST_TIMEOUT)
+                )
+                content = None
+                body = None
+                if response.status == 200:
+                    hold.callback(response.release)
+                    content = response.content
+                else:
+                    async with response:
+                        data = await response.read()
+                    body = json.loads(data) if data and "json" in response.content_type else None
+            except Exception as e:
+                record_upstream("graph", endpoint, type(e).__name__, time.monotonic() - started)
+                raise
+            span.set_attribute("http.status_code", response.status)
+        # Time to the response headers; the body is read at the caller's pace
+        elapsed = time.monotonic() - started
+        record_upstream("graph", endpoint, response.status, elapsed)
+        return GraphResponse(response.status, response.headers, body, content)
+
+    def pool_stats(self) -> Dict[str, float]:
+        """Connections in use and idle in the shared pool"""
+        connector = self._connector
+        if connector is None or connector.closed:
+            return {"in_use": 0, "idle": 0, "limit": settings.GRAPH_POOL_LIMIT}
+        return {
+            "in_use": len(connector._acquired),
+            "idle": sum(len(conns) for conns in connector._conns.values()),
+            "limit": connector.limit
+        }
+
+    async def start(self) -> None:
+        """Create the session and pre-open connections to Graph"""
+        session = self.session
+        if settings.GRAPH_WARMUP_CONNECTIONS > 0:
+            await asyncio.gather(
+                *[self._warmup(session) for _ in range(settings.GRAPH_WARMUP_CONNECTIONS)],
+                return_exceptions=True
+            )
+
+    async def _warmup(self, session: aiohttp.ClientSession) -> None:
+        # Any response will do: the point is to leave an established TLS
+        # connection in the pool for the first real request.
+        async with session.head(GRAPH_BASE_URL) as response:
+            await response.release()
+
+    async def close(self) -> None:
+        """Close the session and all pooled connections"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._connector = None
+
+graph_transport = GraphTransport()
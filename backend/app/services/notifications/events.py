@@ -0,0 +1,87 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import orjson
+import redis
+import redis.asyncio
+from ...core.config import settings
+
+ChangeHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+# Wait before resubscribing after the Redis connection drops
+RESUBSCRIBE_DELAY_SECONDS = 1
+
+class EventBus:
+    """
+    Publish/subscribe for mailbox change events.
+
+    Events are dicts with "username", "resource" ("messages", "events" or
+    "contacts"), "change_type" ("created", "updated", "deleted" or "missed")
+    and "resource_id". Handlers subscribe per resource, or to "*" for all.
+
+    With NOTIFICATIONS_BACKEND "redis", events are published on a Redis
+    channel so the handlers of every worker process run, not just those of
+    the worker that received the notification.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, List[ChangeHandler]] = {}
+        self._redis: Optional[redis.asyncio.Redis] = None
+        if settings.NOTIFICATIONS_BACKEND == "redis":
+            self._redis = redis.asyncio.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                password=settings.REDIS_PASSWORD
+            )
+        self._channel = f"{settings.NOTIFICATIONS_REDIS_PREFIX}:events"
+        self._listener: Optional[asyncio.Task] = None
+
+    def subscribe(self, resource: str, handler: ChangeHandler) -> None:
+        self._handlers.setdefault(resource, []).append(handler)
+
+    async def publish(self, event: Dict[str, Any]) -> None:
+        """Deliver an event to every worker, or only this one if Redis is unavailable"""
+        if self._redis is not None:
+            try:
+                await self._redis.publish(self._channel, orjson.dumps(event))
+                return
+            except (redis.RedisError, OSError) as e:
+                print(f"Error publishing {event['resource']} change, handling it locally: {e}")
+        await self._dispatch(event)
+
+    async def _dispatch(self, event: Dict[str, Any]) -> None:
+        """Run every matching handler concurrently; one failing handler doesn't stop the others"""
+        handlers = self._handlers.get(event["resource"], []) + self._handlers.get("*", [])
+        results = await asyncio.gather(
+            *(handler(event) for handler in handlers),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"Error handling {event['resource']} change for {event['username']}: {result}")
+
+    def start(self) -> None:
+        """Start receiving events published by other workers"""
+        if self._redis is not None and self._listener is None:
+            self._listener = asyncio.ensure_future(self._listen())
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self._channel)
+                async for message in pubsub.listen():
+                    await self._dispatch(orjson.loads(message["data"]))
+            except (redis.RedisError, OSError) as e:
+                print(f"Change event subscription lost, resubscribing: {e}")
+                await asyncio.sleep(RESUBSCRIBE_DELAY_SECONDS)
+            finally:
+                await pubsub.close()
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        if self._redis is not None:
+            await self._redis.close()
+
+event_bus = EventBus()
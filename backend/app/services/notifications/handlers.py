@@ -0,0 +1,30 @@
+from typing import Any, Dict
+from ...core.config import settings
+from ..exchange.directory import contact_directory
+from ..exchange.reads import invalidate_reads
+from ..exchange.sync import mailbox_mirror
+from ..search.index import mail_search_index
+from .events import event_bus
+
+async def _on_message_change(event: Dict[str, Any]) -> None:
+    username = event["username"]
+    await invalidate_reads("messages", username)
+    if event["change_type"] == "deleted" and event["resource_id"]:
+        await mail_search_index.remove_messages(username, [event["resource_id"]])
+    if settings.MAIL_MIRROR_ENABLED:
+        # A delta sync picks up exactly what changed and reindexes it
+        for folder in await mailbox_mirror.invalidate(username):
+            mailbox_mirror.schedule_sync(username, folder)
+
+async def _on_event_change(event: Dict[str, Any]) -> None:
+    await invalidate_reads("events", event["username"])
+
+async def _on_contact_change(event: Dict[str, Any]) -> None:
+    contact_directory.refresh(event["username"])
+    await invalidate_reads("contacts", event["username"])
+
+def register_cache_handlers() -> None:
+    """Keep local caches and indexes in step with upstream change notifications"""
+    event_bus.subscribe("messages", _on_message_change)
+    event_bus.subscribe("events", _on_event_change)
+    event_bus.subscribe("contacts", _on_contact_change)
@@ -0,0 +1,354 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+import orjson
+import redis
+import redis.asyncio
+from ...core.config import settings
+from ...core.security import auth_service
+from ..exchange.transport import graph_transport, GRAPH_BASE_URL
+from .events import event_bus
+
+RESOURCE_PATHS = {
+    "messages": "users/{username}/messages",
+    "events": "users/{username}/events",
+    "contacts": "users/{username}/contacts"
+}
+
+# Signed notifications for subscriptions no worker knows are dropped
+# without asking Redis again for this long
+UNKNOWN_SUBSCRIPTION_TTL_SECONDS = 60
+UNKNOWN_SUBSCRIPTION_MAX_ENTRIES = 10000
+
+class SubscriptionManager:
+    """
+    Creates and renews Graph change-notification subscriptions per mailbox
+    and turns incoming notifications into events on the event bus.
+
+    Every subscription gets its own random clientState, signed with
+    SECRET_KEY, which incoming notifications must echo back before they are
+    trusted. The signature is checked before the subscription is looked up,
+    so forged notifications never reach Redis.
+
+    With NOTIFICATIONS_BACKEND "redis" the subscriptions are kept in Redis,
+    so any worker can verify a notification and one worker at a time renews
+    them. They then outlive the workers instead of being deleted on shutdown.
+    """
+
+    def __init__(self):
+        self.graph_base_url = GRAPH_BASE_URL
+        self._subscriptions: Dict[str, Dict[str, Any]] = {}
+        self._creating: Dict[tuple, asyncio.Future] = {}
+        # Subscription id -> when to look it up in Redis again
+        self._unknown: "OrderedDict[str, float]" = OrderedDict()
+        self._renewal_task: Optional[asyncio.Task] = None
+        self._redis: Optional[redis.asyncio.Redis] = None
+        if settings.NOTIFICATIONS_BACKEND == "redis":
+            self._redis = redis.asyncio.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                password=settings.REDIS_PASSWORD
+            )
+        self._key = f"{settings.NOTIFICATIONS_REDIS_PREFIX}:subscriptions"
+        self._renewal_key = f"{settings.NOTIFICATIONS_REDIS_PREFIX}:renewal"
+
+    async def _get_headers(self, username: str) -> Dict[str, str]:
+        token = await auth_service.get_access_token(username)
+        return {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json"
+        }
+
+    def _expiration(self) -> str:
+        expires = datetime.now(timezone.utc) + timedelta(minutes=settings.NOTIFICATIONS_SUBSCRIPTION_MINUTES)
+        return expires.strftime("%Y-%m-%dT%H:%M:%S.0000000Z")
+
+    def is_active(self, username: str, resource: str) -> bool:
+        """Whether changes to a mailbox resource are currently pushed to us"""
+        now = datetime.now(timezone.utc)
+        return any(
+            sub["username"] == username and sub["resource"] == resource and sub["expires_at"] > now
+            for sub in self._subscriptions.values()
+        )
+
+    def max_age(self, username: str, resource: str, polling_max_age: int) -> int:
+        """How long cached data may be served before it has to be re-read"""
+        if self.is_active(username, resource):
+            return settings.NOTIFICATIONS_FALLBACK_MAX_AGE_SECONDS
+        return polling_max_age
+
+    def list_subscriptions(self, username: str) -> List[Dict[str, Any]]:
+        return [
+            {"id": sub["id"], "resource": sub["resource"], "expires_at": sub["expires_at"]}
+            for sub in self._subscriptions.values()
+            if sub["username"] == username
+        ]
+
+    async def subscribe(self, username: str) -> List[Dict[str, Any]]:
+        """Make sure every configured resource of a mailbox has a live subscription"""
+        if not settings.NOTIFICATIONS_ENABLED:
+            raise ValueError("Change notifications are disabled")
+        await self._load()
+        await asyncio.gather(*[
+            self._ensure(username, resource)
+            for resource in settings.NOTIFICATIONS_RESOURCES
+            if not self.is_active(username, resource)
+        ])
+        return self.list_subscriptions(username)
+
+    async def unsubscribe(self, username: str) -> None:
+        """Delete every subscription of a mailbox"""
+        await asyncio.gather(*[
+            self._delete(sub)
+            for sub in list(self._subscriptions.values())
+            if sub["username"] == username
+        ])
+
+    async def _ensure(self, username: str, resource: str) -> None:
+        # Concurrent subscribe calls for one mailbox share a single creation
+        key = (username, resource)
+        future = self._creating.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._create(username, resource))
+            self._creating[key] = future
+            future.add_done_callback(lambda _: self._creating.pop(key, None))
+        await asyncio.shield(future)
+
+    def _sign(self, nonce: str) -> str:
+        return hmac.new(settings.SECRET_KEY.encode("utf-8"), nonce.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def _client_state(self) -> str:
+        nonce = secrets.token_urlsafe(16)
+        return f"{nonce}.{self._sign(nonce)}"
+
+    def _signed(self, client_state: str) -> bool:
+        """Whether a clientState was issued by us, before any lookup"""
+        nonce, _, signature = client_state.partition(".")
+        return bool(nonce) and hmac.compare_digest(signature, self._sign(nonce))
+
+    async def _create(self, username: str, resource: str) -> Dict[str, Any]:
+        client_state = self._client_state()
+        body = {
+            "changeType": "created,updated,deleted",
+            "notificationUrl": settings.NOTIFICATIONS_WEBHOOK_URL,
+            "lifecycleNotificationUrl": settings.NOTIFICATIONS_WEBHOOK_URL,
+            "resource": RESOURCE_PATHS[resource].format(username=username),
+            "expirationDateTime": self._expiration(),
+            "clientState": client_state
+        }
+        response = await graph_transport.request(
+            "POST",
+            f"{self.graph_base_url}/subscriptions",
+            headers=await self._get_headers(username),
+            json_body=body
+        )
+        data = response.body
+        if response.status != 201:
+            raise Exception(f"Failed to create subscription: {data.get('error', {}).get('message')}")
+
+        subscription = {
+            "id": data["id"],
+            "username": username,
+            "resource": resource,
+            "client_state": client_state,
+            "expires_at": self._parse_expiration(data.get("expirationDateTime"))
+        }
+        await self._save(subscription)
+        return subscription
+
+    async def renew(self, subscription: Dict[str, Any]) -> None:
+        """Extend a subscription, recreating it if Graph no longer knows it"""
+        response = await graph_transport.request(
+            "PATCH",
+            f"{self.graph_base_url}/subscriptions/{subscription['id']}",
+            headers=await self._get_headers(subscription["username"]),
+            json_body={"expirationDateTime": self._expiration()}
+        )
+        if response.status == 404:
+            await self._forget(subscription["id"])
+            await self._ensure(subscription["username"], subscription["resource"])
+            return
+        if response.status != 200:
+            raise Exception(f"Failed to renew subscription: {response.body.get('error', {}).get('message')}")
+        subscription["expires_at"] = self._parse_expiration(response.body.get("expirationDateTime"))
+        await self._save(subscription)
+
+    async def _delete(self, subscription: Dict[str, Any]) -> None:
+        await self._forget(subscription["id"])
+        response = await graph_transport.request(
+            "DELETE",
+            f"{self.graph_base_url}/subscriptions/{subscription['id']}",
+            headers=await self._get_headers(subscription["username"])
+        )
+        if response.status not in (204, 404):
+            raise Exception(f"Failed to delete subscription: {response.body.get('error', {}).get('message')}")
+
+    def _parse_expiration(self, value: Optional[str]) -> datetime:
+        if not value:
+            return datetime.now(timezone.utc) + timedelta(minutes=settings.NOTIFICATIONS_SUBSCRIPTION_MINUTES)
+        return datetime.fromisoformat(value[:19]).replace(tzinfo=timezone.utc)
+
+    async def _save(self, subscription: Dict[str, Any]) -> None:
+        self._subscriptions[subscription["id"]] = subscription
+        self._unknown.pop(subscription["id"], None)
+        if self._redis is None:
+            return
+        data = dict(subscription, expires_at=subscription["expires_at"].isoformat())
+        try:
+            await self._redis.hset(self._key, subscription["id"], orjson.dumps(data))
+        except (redis.RedisError, OSError) as e:
+            print(f"Error sharing subscription {subscription['id']}: {e}")
+
+    async def _forget(self, subscription_id: str) -> None:
+        self._subscriptions.pop(subscription_id, None)
+        if self._redis is None:
+            return
+        try:
+            await self._redis.hdel(self._key, subscription_id)
+        except (redis.RedisError, OSError) as e:
+            print(f"Error removing shared subscription {subscription_id}: {e}")
+
+    async def _load(self) -> None:
+        """Replace the local view with the subscriptions every worker shares"""
+        if self._redis is None:
+            return
+        try:
+            stored = await self._redis.hgetall(self._key)
+        except (redis.RedisError, OSError) as e:
+            print(f"Error loading shared subscriptions: {e}")
+            return
+        subscriptions = {}
+        for data in stored.values():
+            subscription = orjson.loads(data)
+            subscription["expires_at"] = datetime.fromisoformat(subscription["expires_at"])
+            subscriptions[subscription["id"]] = subscription
+        self._subscriptions = subscriptions
+
+    async def _load_one(self, subscription_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch one subscription another worker may have created since the last load"""
+        if self._redis is None:
+            return None
+        retry_at = self._unknown.get(subscription_id)
+        if retry_at is not None and retry_at > time.monotonic():
+            return None
+        try:
+            data = await self._redis.hget(self._key, subscription_id)
+        except (redis.RedisError, OSError) as e:
+            print(f"Error loading shared subscription {subscription_id}: {e}")
+            return None
+        if data is None:
+            self._unknown[subscription_id] = time.monotonic() + UNKNOWN_SUBSCRIPTION_TTL_SECONDS
+            self._unknown.move_to_end(subscription_id)
+            while len(self._unknown) > UNKNOWN_SUBSCRIPTION_MAX_ENTRIES:
+                self._unknown.popitem(last=False)
+            return None
+        subscription = orjson.loads(data)
+        subscription["expires_at"] = datetime.fromisoformat(subscription["expires_at"])
+        self._subscriptions[subscription_id] = subscription
+        return subscription
+
+    async def _claim_renewal(self) -> bool:
+        """Whether this worker renews subscriptions this round"""
+        if self._redis is None:
+            return True
+        try:
+            return bool(await self._redis.set(
+                self._renewal_key, os.getpid(),
+                nx=True, ex=max(settings.NOTIFICATIONS_RENEW_INTERVAL_SECONDS - 1, 1)
+            ))
+        except (redis.RedisError, OSError) as e:
+            print(f"Error claiming subscription renewal, renewing anyway: {e}")
+            return True
+
+    async def verify(self, notification: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Return the subscription a notification belongs to, or None if it can't be trusted"""
+        client_state = str(notification.get("clientState") or "")
+        if not self._signed(client_state):
+            return None
+        subscription_id = str(notification.get("subscriptionId") or "")
+        subscription = self._subscriptions.get(subscription_id)
+        if subscription is None:
+            subscription = await self._load_one(subscription_id)
+        if subscription is None or not hmac.compare_digest(client_state, subscription["client_state"]):
+            return None
+        return subscription
+
+    async def handle_notifications(self, notifications: List[Dict[str, Any]]) -> None:
+        """Publish trusted notifications to the event bus and service lifecycle events"""
+        for notification in notifications:
+            subscription = await self.verify(notification)
+            if subscription is None:
+                print(f"Ignoring untrusted notification for subscription {notification.get('subscriptionId')}")
+                continue
+
+            lifecycle_event = notification.get("lifecycleEvent")
+            if lifecycle_event == "reauthorizationRequired":
+                await self.renew(subscription)
+                continue
+            if lifecycle_event == "subscriptionRemoved":
+                await self._forget(subscription["id"])
+                await self._ensure(subscription["username"], subscription["resource"])
+                # Changes may have been dropped while the subscription was gone
+                lifecycle_event = "missed"
+
+            await event_bus.publish({
+                "username": subscription["username"],
+                "resource": subscription["resource"],
+                "change_type": "missed" if lifecycle_event == "missed" else notification.get("changeType"),
+                "resource_id": (notification.get("resourceData") or {}).get("id")
+            })
+
+    def start(self) -> None:
+        """Start the background renewal loop"""
+        if settings.NOTIFICATIONS_ENABLED and self._renewal_task is None:
+            self._renewal_task = asyncio.ensure_future(self._renew_loop())
+
+    async def _renew_loop(self) -> None:
+        await self._load()
+        while True:
+            await asyncio.sleep(settings.NOTIFICATIONS_RENEW_INTERVAL_SECONDS)
+            await self._load()
+            if not await self._claim_renewal():
+                continue
+            threshold = datetime.now(timezone.utc) + timedelta(seconds=settings.NOTIFICATIONS_RENEW_MARGIN_SECONDS)
+            for subscription in list(self._subscriptions.values()):
+                if not self._signed(subscription["client_state"]):
+                    # Created before clientStates were signed; its notifications would be dropped
+                    try:
+                        await self._delete(subscription)
+                        await self._ensure(subscription["username"], subscription["resource"])
+                    except Exception as e:
+                        print(f"Error replacing subscription {subscription['id']}: {e}")
+                    continue
+                if subscription["expires_at"] <= threshold:
+                    try:
+                        await self.renew(subscription)
+                    except Exception as e:
+                        print(f"Error renewing subscription {subscription['id']}: {e}")
+
+    async def close(self) -> None:
+        """
+        Stop renewing and delete our subscriptions so Graph stops sending
+        notifications. Shared subscriptions are left to the other workers.
+        """
+        if self._renewal_task is not None:
+            self._renewal_task.cancel()
+            self._renewal_task = None
+        if self._redis is not None:
+            await self._redis.close()
+            return
+        results = await asyncio.gather(
+            *[self._delete(sub) for sub in list(self._subscriptions.values())],
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"Error deleting subscription: {result}")
+
+subscription_manager = SubscriptionManager()
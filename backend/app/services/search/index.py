@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from ...core.config import settings
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    doc INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    folder TEXT,
+    received TEXT,
+    subject TEXT,
+    sender TEXT,
+    recipients TEXT,
+    preview TEXT,
+    data TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+    subject, sender, recipients, preview,
+    content='docs', content_rowid='doc',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS docs_ai AFTER INSERT ON docs BEGIN
+    INSERT INTO docs_fts (rowid, subject, sender, recipients, preview)
+    VALUES (new.doc, new.subject, new.sender, new.recipients, new.preview);
+END;
+CREATE TRIGGER IF NOT EXISTS docs_ad AFTER DELETE ON docs BEGIN
+    INSERT INTO docs_fts (docs_fts, rowid, subject, sender, recipients, preview)
+    VALUES ('delete', old.doc, old.subject, old.sender, old.recipients, old.preview);
+END;
+CREATE TRIGGER IF NOT EXISTS docs_au AFTER UPDATE ON docs BEGIN
+    INSERT INTO docs_fts (docs_fts, rowid, subject, sender, recipients, preview)
+    VALUES ('delete', old.doc, old.subject, old.sender, old.recipients, old.preview);
+    INSERT INTO docs_fts (rowid, subject, sender, recipients, preview)
+    VALUES (new.doc, new.subject, new.sender, new.recipients, new.preview);
+END;
+"""
+
+# bm25 column weights: subject, sender, recipients, preview
+_RANKING = "bm25(docs_fts, 10.0, 5.0, 3.0, 1.0)"
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+def _address_text(recipient: Optional[Dict[str, Any]]) -> str:
+    address = (recipient or {}).get("emailAddress") or {}
+    return " ".join(filter(None, [address.get("name"), address.get("address")]))
+
+class MailSearchIndex:
+    """
+    Per-mailbox full-text index of message headers backed by SQLite FTS5.
+
+    Each mailbox has its own database file under SEARCH_INDEX_DIR holding
+    subject, sender, recipients and bodyPreview of every message seen, and
+    the Graph message itself so results can be served without going upstream.
+    """
+
+    def __init__(self):
+        self._connections: "OrderedDict[str, Tuple[sqlite3.Connection, threading.Lock]]" = OrderedDict()
+        self._connections_lock = threading.Lock()
+
+    def _path(self, username: str) -> str:
+        name = hashlib.sha256(username.lower().encode("utf-8")).hexdigest()
+        return os.path.join(settings.SEARCH_INDEX_DIR, f"{name}.db")
+
+    def _connection(self, username: str) -> Tuple[sqlite3.Connection, threading.Lock]:
+        with self._connections_lock:
+            entry = self._connections.get(username)
+            if entry is not None:
+                self._connections.move_to_end(username)
+                return entry
+            os.makedirs(settings.SEARCH_INDEX_DIR, exist_ok=True)
+            conn = sqlite3.connect(self._path(username), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            entry = (conn, threading.Lock())
+            self._connections[username] = entry
+            # Evicted connections are closed when the last in-flight user drops them
+            while len(self._connections) > settings.SEARCH_INDEX_MAX_OPEN:
+                self._connections.popitem(last=False)
+            return entry
+
+    async def _run(self, func, *args) -> Any:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, func, *args)
+
+    def schedule_index(self, username: str, folder: str, messages: List[Dict[str, Any]]) -> None:
+        """Index messages in the background without delaying the caller"""
+        if messages:
+            future = asyncio.ensure_future(self.index_messages(username, folder, messages))
+            future.add_done_callback(self._report_error)
+
+    def _report_error(self, future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Error updating search index: {future.exception()}")
+
+    async def index_messages(self, username: str, folder: str, messages: List[Dict[str, Any]]) -> None:
+        """Add or update messages in the mailbox index"""
+        await self._run(self._index_messages, username, folder, messages)
+
+    async def remove_messages(self, username: str, message_ids: List[str]) -> None:
+        """Remove messages from the mailbox index"""
+        if message_ids:
+            await self._run(self._remove_messages, username, message_ids)
+
+    async def search(
+        self,
+        username: str,
+        query: str,
+        folder: Optional[str] = None,
+        page_size: int = 50,
+        page_token: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Search the mailbox index, returning messages ranked by relevance
+        """
+        offset = int(page_token) if page_token else 0
+        rows = await self._run(self._search, username, query, folder, page_size + 1, offset)
+        return {
+            "messages": rows[:page_size],
+            "nextPageToken": str(offset + page_size) if len(rows) > page_size else None
+        }
+
+    def _index_messages(self, username: str, folder: str, messages: List[Dict[str, Any]]) -> None:
+        conn, lock = self._connection(username)
+        rows = [
+            (
+                message["id"],
+                folder,
+                message.get("receivedDateTime"),
+                message.get("subject") or "",
+                _address_text(message.get("from")),
+                " ".join(_address_text(r) for r in message.get("toRecipients") or []),
+                message.get("bodyPreview") or "",
+                json.dumps(message)
+            )
+            for message in messages
+            if "id" in message
+        ]
+        with lock, conn:
+            conn.executemany(
+                "INSERT INTO docs (id, folder, received, subject, sender, recipients, preview, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET folder = excluded.folder, received = excluded.received, "
+                "subject = excluded.subject, sender = excluded.sender, recipients = excluded.recipients, "
+                "preview = excluded.preview, data = excluded.data",
+                rows
+            )
+
+    def _remove_messages(self, username: str, message_ids: List[str]) -> None:
+        conn, lock = self._connection(username)
+        with lock, conn:
+            conn.executemany("DELETE FROM docs WHERE id = ?", [(i,) for i in message_ids])
+
+    def _search(
+        self,
+        username: str,
+        query: str,
+        folder: Optional[str],
+        limit: int,
+        offset: int
+    ) -> List[Dict[str, Any]]:
+        # Quote every term so user input can't inject FTS5 query syntax; each
+        # term is matched as a prefix and all terms must be present.
+        terms = _TERM.findall(query)
+        if not terms:
+            return []
+        match = " ".join(f'"{term}"*' for term in terms)
+
+        sql = (
+            "SELECT docs.data FROM docs_fts JOIN docs ON docs.doc = docs_fts.rowid "
+            "WHERE docs_fts MATCH ?"
+        )
+        params: List[Any] = [match]
+        if folder:
+            sql += " AND docs.folder = ?"
+            params.append(folder)
+        sql += f" ORDER BY {_RANKING}, docs.received DESC LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+
+        conn, lock = self._connection(username)
+        with lock:
+            rows = conn.execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def close(self) -> None:
+        with self._connections_lock:
+            for conn, lock in self._connections.values():
+                with lock:
+                    conn.close()
+            self._connections.clear()
+
+mail_search_index = MailSearchIndex()
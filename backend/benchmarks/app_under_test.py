@@ -0,0 +1,30 @@
+"""
+ASGI entry point the benchmark runner serves with uvicorn.
+
+Loads app.main unchanged except for the two dependencies that cannot run
+locally: Azure AD token acquisition returns a static token, and EWS accounts
+come from the in-process stand-in. Graph requests go to GRAPH_BASE_URL,
+which the runner points at the mock Graph server.
+"""
+import msal
+from typing import Any, Dict, List, Optional
+
+class _StaticTokenApplication:
+    """Replaces msal.ConfidentialClientApplication, which needs Azure AD"""
+
+    def __init__(self, *args: Any, token_cache: Optional[Any] = None, **kwargs: Any):
+        self.token_cache = token_cache
+
+    def acquire_token_silent(self, scopes: List[str], account: Any = None) -> Optional[Dict[str, Any]]:
+        return None
+
+    def acquire_token_for_client(self, scopes: List[str]) -> Dict[str, Any]:
+        return {"access_token": "benchmark-token", "expires_in": 3600}
+
+msal.ConfidentialClientApplication = _StaticTokenApplication
+
+from app.main import app  # noqa: E402
+from app.services.exchange.ews import ews_pool  # noqa: E402
+from .ews_standin import build_account  # noqa: E402
+
+ews_pool._build_account = build_account
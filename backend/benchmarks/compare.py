@@ -0,0 +1,75 @@
+"""
+Compare two benchmark result files route by route.
+
+    python -m benchmarks.compare benchmarks/results/OLD.json benchmarks/results/NEW.json
+
+A route regresses when its p95 latency or upstream calls per request grow,
+or its throughput drops, by more than --threshold (10% by default), or when
+it starts returning errors. Exits with status 1 if any route regressed.
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Optional
+
+def _change(old: float, new: float) -> Optional[float]:
+    if not old:
+        return None
+    return (new - old) / old
+
+def _format(change: Optional[float]) -> str:
+    return "    n/a" if change is None else f"{change * 100:+6.1f}%"
+
+def compare_routes(old: Dict[str, Any], new: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    rows = []
+    for name in sorted(set(old["routes"]) & set(new["routes"])):
+        before, after = old["routes"][name], new["routes"][name]
+        changes = {
+            "throughput": _change(before["throughput_rps"], after["throughput_rps"]),
+            "p50": _change(before["latency_ms"]["p50"], after["latency_ms"]["p50"]),
+            "p95": _change(before["latency_ms"]["p95"], after["latency_ms"]["p95"]),
+            "p99": _change(before["latency_ms"]["p99"], after["latency_ms"]["p99"]),
+            "upstream": _change(
+                before["upstream"]["graph_per_request"] + before["upstream"]["ews_per_request"],
+                after["upstream"]["graph_per_request"] + after["upstream"]["ews_per_request"]
+            )
+        }
+        reasons = []
+        if changes["throughput"] is not None and changes["throughput"] < -threshold:
+            reasons.append("throughput")
+        if changes["p95"] is not None and changes["p95"] > threshold:
+            reasons.append("p95")
+        if changes["upstream"] is not None and changes["upstream"] > threshold:
+            reasons.append("upstream calls")
+        if after["errors"] > before["errors"]:
+            reasons.append("errors")
+        rows.append({"route": name, "changes": changes, "regressions": reasons})
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative change that counts as a regression")
+    args = parser.parse_args()
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    if old["profile"] != new["profile"]:
+        print(f"Warning: comparing profile {old['profile']} with {new['profile']}")
+
+    print(f"{'route':32} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'upstrm':>8}  regressions")
+    rows = compare_routes(old, new, args.threshold)
+    for row in rows:
+        changes = row["changes"]
+        print(
+            f"{row['route']:32} {_format(changes['throughput']):>8} {_format(changes['p50']):>8} "
+            f"{_format(changes['p95']):>8} {_format(changes['p99']):>8} {_format(changes['upstream']):>8}  "
+            f"{', '.join(row['regressions'])}"
+        )
+    regressed = [row["route"] for row in rows if row["regressions"]]
+    if regressed:
+        print(f"{len(regressed)} route(s) regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
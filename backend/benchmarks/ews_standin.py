@@ -0,0 +1,51 @@
+"""
+In-process stand-in for the exchangelib Account used by EWS reads.
+
+exchangelib only speaks SOAP over https to a real Exchange server, so the
+benchmark replaces Account construction instead of serving EWS over HTTP.
+Calls still run through the EWS thread pool and circuit breakers; each
+GetItem call blocks its worker thread for BENCH_EWS_LATENCY_MS.
+"""
+import os
+import time
+from types import SimpleNamespace
+from typing import Any, List, Optional
+
+def _latency() -> float:
+    return float(os.environ.get("BENCH_EWS_LATENCY_MS", "60")) / 1000
+
+def _message(message_id: str, username: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=message_id,
+        subject=f"Message {message_id[-6:]}",
+        sender=SimpleNamespace(email_address="sender@example.com"),
+        to_recipients=[SimpleNamespace(email_address=username)],
+        cc_recipients=[SimpleNamespace(email_address="cc@example.com")],
+        bcc_recipients=None,
+        body="<html><body>" + "<p>Quarterly numbers attached.</p>" * 40 + "</body></html>",
+        attachments=[]
+    )
+
+class _Inbox:
+    def __init__(self, username: str):
+        self.username = username
+
+    def get(self, id: str) -> SimpleNamespace:
+        time.sleep(_latency())
+        return _message(id, self.username)
+
+class StandInAccount:
+    """Just enough of exchangelib's Account for ExchangeClient's EWS reads"""
+
+    def __init__(self, username: str):
+        self.username = username
+        self.inbox = _Inbox(username)
+        self.protocol = SimpleNamespace(credentials=None)
+
+    def fetch(self, ids: List[Any]) -> List[SimpleNamespace]:
+        # One GetItem round trip for the whole chunk
+        time.sleep(_latency())
+        return [_message(item.id, self.username) for item in ids]
+
+def build_account(username: str, token: Optional[str]) -> StandInAccount:
+    return StandInAccount(username)
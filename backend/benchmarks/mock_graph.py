@@ -0,0 +1,436 @@
+"""
+Local stand-in for the Microsoft Graph endpoints the backend calls.
+
+Serves deterministic mail, calendar and contact data for any mailbox, with
+configurable latency, server-side page size and throttling, and counts every
+request per endpoint so benchmarks can report upstream calls per API call.
+$batch requests are unpacked and each sub-request is simulated (and
+throttled) on its own, as Graph does.
+
+    python -m benchmarks.mock_graph --port 8901 --latency-ms 40 --throttle-rate 0.05
+
+Point the backend at it with GRAPH_BASE_URL=http://localhost:8901/v1.0.
+GET /_stats returns the request counts, POST /_reset clears them and
+POST /_config updates any of the settings below at runtime.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+from aiohttp import web
+
+DEFAULT_CONFIG = {
+    "latency_ms": 40.0,         # base latency of every (sub-)request
+    "jitter_ms": 20.0,          # uniform jitter added on top
+    "tail_rate": 0.0,           # fraction of requests that are slow
+    "tail_ms": 1000.0,          # extra latency of slow requests
+    "throttle_rate": 0.0,       # fraction of requests rejected with 429
+    "retry_after": 1,           # Retry-After of throttled responses, in seconds
+    "mailbox_concurrency": 4,   # concurrent requests per mailbox before 429, 0 for no limit
+    "max_page_size": 1000,      # server-side cap on $top
+    "default_page_size": 10,    # page size when $top is not given
+    "messages": 1000,           # messages per folder
+    "contacts": 500,            # contacts per mailbox
+    "events_per_day": 6,        # calendar events per mailbox per day
+    "busy_per_day": 3           # free/busy items per attendee per day
+}
+
+# Graph item ids are long opaque strings; keeping them long lets the backend
+# fold them into {id} in its endpoint names.
+ID_PREFIX = "AAMkAGVmMDEzMTM4LTZmYWUtNDdkNC1hMDZi"
+
+Response = Tuple[int, Dict[str, str], Any]
+
+def _error(status: int, code: str, message: str) -> Response:
+    return status, {}, {"error": {"code": code, "message": message}}
+
+def item_id(kind: str, key: str) -> str:
+    return f"{ID_PREFIX}-{kind}-{key}"
+
+def _time(value: datetime) -> Dict[str, str]:
+    return {"dateTime": value.strftime("%Y-%m-%dT%H:%M:%S"), "timeZone": "UTC"}
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.rstrip("Z")[:19])
+
+class _Items:
+    """Fixed-length item list built on slicing, so serving a page doesn't build the whole folder"""
+
+    def __init__(self, count: int, make: Callable[[int], Dict[str, Any]]):
+        self.count = count
+        self.make = make
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, window: slice) -> List[Dict[str, Any]]:
+        return [self.make(index) for index in range(*window.indices(self.count))]
+
+class MockGraph:
+    """Simulated Graph tenant: routing, latency, throttling and request counts"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        self.base_url = ""
+        self._in_flight: Dict[str, int] = {}
+        self._updated: Dict[str, Dict[str, Any]] = {}
+        self._routes = [
+            ("POST", r"/\$batch", "POST /$batch", self.batch),
+            ("GET", r"/users/([^/]+)/mailFolders/([^/]+)/messages/delta", "GET /users/{user}/mailFolders/{folder}/messages/delta", self.messages_delta),
+            ("GET", r"/users/([^/]+)/mailFolders/([^/]+)/messages", "GET /users/{user}/mailFolders/{folder}/messages", self.list_messages),
+            ("POST", r"/users/([^/]+)/sendMail", "POST /users/{user}/sendMail", self.send_mail),
+            ("POST", r"/users/([^/]+)/messages", "POST /users/{user}/messages", self.create_draft),
+            ("POST", r"/users/([^/]+)/messages/([^/]+)/attachments/createUploadSession", "POST /users/{user}/messages/{id}/attachments/createUploadSession", self.create_upload_session),
+            ("POST", r"/users/([^/]+)/messages/([^/]+)/attachments", "POST /users/{user}/messages/{id}/attachments", self.add_attachment),
+            ("POST", r"/users/([^/]+)/messages/([^/]+)/send", "POST /users/{user}/messages/{id}/send", self.send_draft),
+            ("DELETE", r"/users/([^/]+)/messages/([^/]+)", "DELETE /users/{user}/messages/{id}", self.delete_item),
+            ("GET", r"/users/([^/]+)(?:/calendars/[^/]+)?/calendarView", "GET /users/{user}/calendarView", self.calendar_view),
+            ("POST", r"/users/([^/]+)/calendar/getSchedule", "POST /users/{user}/calendar/getSchedule", self.get_schedule),
+            ("POST", r"/users/([^/]+)/events", "POST /users/{user}/events", self.create_event),
+            ("GET", r"/users/([^/]+)/events/([^/]+)", "GET /users/{user}/events/{id}", self.get_event),
+            ("PATCH", r"/users/([^/]+)/events/([^/]+)", "PATCH /users/{user}/events/{id}", self.update_event),
+            ("DELETE", r"/users/([^/]+)/events/([^/]+)", "DELETE /users/{user}/events/{id}", self.delete_item),
+            ("GET", r"/users/([^/]+)/contactFolders", "GET /users/{user}/contactFolders", self.list_contact_folders),
+            ("GET", r"/users/([^/]+)/contactFolders/([^/]+)/contacts/delta", "GET /users/{user}/contactFolders/{folder}/contacts/delta", self.contacts_delta),
+            ("GET", r"/users/([^/]+)(?:/contactFolders/[^/]+)?/contacts", "GET /users/{user}/contacts", self.list_contacts),
+            ("POST", r"/users/([^/]+)/contacts", "POST /users/{user}/contacts", self.create_contact),
+            ("GET", r"/users/([^/]+)/contacts/([^/]+)", "GET /users/{user}/contacts/{id}", self.get_contact),
+            ("PATCH", r"/users/([^/]+)/contacts/([^/]+)", "PATCH /users/{user}/contacts/{id}", self.update_contact),
+            ("DELETE", r"/users/([^/]+)/contacts/([^/]+)", "DELETE /users/{user}/contacts/{id}", self.delete_item)
+        ]
+        self._compiled = [
+            (method, re.compile(pattern + "$"), name, handler)
+            for method, pattern, name, handler in self._routes
+        ]
+        self.reset()
+
+    def reset(self) -> None:
+        self.http_requests = 0
+        self.counts: Dict[str, Dict[str, int]] = {}
+
+    def stats(self) -> Dict[str, Any]:
+        """Upstream calls since the last reset; $batch sub-requests count individually"""
+        endpoints = {name: dict(counts) for name, counts in self.counts.items() if name != "POST /$batch"}
+        return {
+            "http_requests": self.http_requests,
+            "batches": self.counts.get("POST /$batch", {}).get("200", 0),
+            "graph_requests": sum(sum(counts.values()) for counts in endpoints.values()),
+            "throttled": sum(counts.get("429", 0) for counts in endpoints.values()),
+            "endpoints": endpoints
+        }
+
+    def _count(self, name: str, status: int) -> None:
+        counts = self.counts.setdefault(name, {})
+        counts[str(status)] = counts.get(str(status), 0) + 1
+
+    async def dispatch(self, method: str, path: str, query: Dict[str, str], body: Any) -> Response:
+        """Simulate one Graph request or $batch sub-request"""
+        path = re.sub(r"^/(v1\.0|beta)", "", path)
+        for route_method, pattern, name, handler in self._compiled:
+            match = pattern.match(path)
+            if match and route_method == method:
+                break
+        else:
+            return _error(501, "NotSimulated", f"{method} {path} is not simulated")
+
+        mailbox = match.group(1).lower() if match.groups() else "*"
+        if name != "POST /$batch":
+            throttled = self._throttle(mailbox)
+            if throttled is not None:
+                self._count(name, 429)
+                return throttled
+
+        self._in_flight[mailbox] = self._in_flight.get(mailbox, 0) + 1
+        try:
+            if name != "POST /$batch":
+                await asyncio.sleep(self._latency())
+            result = await handler(*match.groups(), query=query, body=body)
+        finally:
+            self._in_flight[mailbox] -= 1
+        self._count(name, result[0])
+        return result
+
+    def _throttle(self, mailbox: str) -> Optional[Response]:
+        limit = self.config["mailbox_concurrency"]
+        over_limit = limit and self._in_flight.get(mailbox, 0) >= limit
+        if over_limit or random.random() < self.config["throttle_rate"]:
+            status, headers, body = _error(429, "ApplicationThrottled", "Application is over its MailboxConcurrency limit.")
+            return status, dict(headers, **{"Retry-After": str(self.config["retry_after"])}), body
+        return None
+
+    def _latency(self) -> float:
+        latency = self.config["latency_ms"] + random.uniform(0, self.config["jitter_ms"])
+        if random.random() < self.config["tail_rate"]:
+            latency += self.config["tail_ms"]
+        return latency / 1000
+
+    def _page(
+        self,
+        items: Sequence[Any],
+        query: Dict[str, str],
+        path: str
+    ) -> Dict[str, Any]:
+        top = min(int(query.get("$top", self.config["default_page_size"])), self.config["max_page_size"])
+        skip = int(query.get("$skiptoken", query.get("$skip", 0)))
+        page: Dict[str, Any] = {"value": items[skip:skip + top]}
+        if skip + top < len(items):
+            # The backend reads its page token from after "skiptoken=", so it goes last
+            params = {key: value for key, value in query.items() if key not in ("$top", "$skip", "$skiptoken")}
+            params.update({"$top": top, "$skiptoken": skip + top})
+            page["@odata.nextLink"] = f"{self.base_url}{path}?{urlencode(params)}"
+        return page
+
+    # Mail
+
+    def _message(self, user: str, folder: str, index: int) -> Dict[str, Any]:
+        received = datetime(2024, 1, 1) + timedelta(minutes=37 * (self.config["messages"] - index))
+        return {
+            "id": item_id("msg", f"{folder}-{index:06d}"),
+            "subject": f"Quarterly report {index} for {folder}",
+            "from": {"emailAddress": {"name": f"Sender {index % 50}", "address": f"sender{index % 50}@example.com"}},
+            "toRecipients": [{"emailAddress": {"name": user, "address": user}}],
+            "receivedDateTime": received.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "hasAttachments": index % 7 == 0,
+            "isRead": index % 4 != 0,
+            "bodyPreview": f"Hi, please find the numbers for item {index} attached. " * 3
+        }
+
+    def _messages(self, user: str, folder: str) -> _Items:
+        return _Items(self.config["messages"], lambda index: self._message(user, folder, index))
+
+    async def list_messages(self, user: str, folder: str, query: Dict[str, str], body: Any) -> Response:
+        return 200, {}, self._page(self._messages(user, folder), query, f"/users/{user}/mailFolders/{folder}/messages")
+
+    async def messages_delta(self, user: str, folder: str, query: Dict[str, str], body: Any) -> Response:
+        path = f"/users/{user}/mailFolders/{folder}/messages/delta"
+        if "$deltatoken" in query:
+            return 200, {}, {"value": [], "@odata.deltaLink": f"{self.base_url}{path}?$deltatoken=latest"}
+        page = self._page(self._messages(user, folder), query, path)
+        if "@odata.nextLink" not in page:
+            page["@odata.deltaLink"] = f"{self.base_url}{path}?$deltatoken=latest"
+        return 200, {}, page
+
+    async def send_mail(self, user: str, query: Dict[str, str], body: Any) -> Response:
+        return 202, {}, None
+
+    async def create_draft(self, user: str, query: Dict[str, str], body: Any) -> Response:
+        return 201, {}, dict(body or {}, id=item_id("draft", uuid.uuid4().hex))
+
+    async def add_attachment(self, user: str, message_id: str, query: Dict[str, str], body: Any) -> Response:
+        return 201, {}, dict(body or {}, id=item_id("att", uuid.uuid4().hex))
+
+    async def create_upload_session(self, user: str, message_id: str, query: Dict[str, str], body: Any) -> Response:
+        root = self.base_url.rsplit("/v1.0", 1)[0]
+        return 201, {}, {
+            "uploadUrl": f"{root}/_upload/{uuid.uuid4().hex}",
+            "expirationDateTime": "2099-01-01T00:00:00Z",
+            "nextExpectedRanges": ["0-"]
+        }
+
+    async def send_draft(self, user: str, message_id: str, query: Dict[str, str], body: Any) -> Response:
+        return 202, {}, None
+
+    async def delete_item(self, user: str, item_id: str, query: Dict[str, str], body: Any) -> Response:
+        # Generated items come back on the next read, so repeated runs see the same data
+        self._updated.pop(item_id, None)
+        return 204, {}, None
+
+    # Calendar
+
+    def _event(self, user: str, event_id: str, start: datetime) -> Dict[str, Any]:
+        event = {
+            "id": event_id,
+            "subject": f"Sync {start:%a %H:%M}",
+            "start": _time(start),
+            "end": _time(start + timedelta(minutes=30)),
+            "location": {"displayName": f"Room {start.hour}"},
+            "body": {"contentType": "HTML", "content": "<p>Agenda to follow</p>"},
+            "isAllDay": False,
+            "organizer": {"emailAddress": {"name": user, "address": user}},
+            "attendees": [
+                {"emailAddress": {"name": f"Colleague {n}", "address": f"colleague{n}@example.com"}, "status": {"response": "accepted"}}
+                for n in range(3)
+            ],
+            "createdDateTime": "2024-01-01T00:00:00Z",
+            "lastModifiedDateTime": "2024-01-01T00:00:00Z"
+        }
+        event.update(self._updated.get(event_id, {}))
+        return event
+
+    def _events(self, user: str, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        events = []
+        day = datetime(start.year, start.month, start.day)
+        while day < end:
+            for index in range(self.config["events_per_day"]):
+                event_start = day + timedelta(hours=8, minutes=90 * index)
+                event_id = item_id("evt", f"{day:%Y%m%d}-{index:02d}")
+                if event_start < end and event_start + timedelta(minutes=30) > start:
+                    events.append(self._event(user, event_id, event_start))
+            day += timedelta(days=1)
+        return events
+
+    async def calendar_view(self, user: str, query: Dict[str, str], body: Any) -> Response:
+        if "startDateTime" not in query or "endDateTime" not in query:
+            return _error(400, "ErrorInvalidParameter", "startDateTime and endDateTime are required")
+        events = self._events(user, _parse_time(query["startDateTime"]), _parse_time(query["endDateTime"]))
+        return 200, {}, self._page(events, query, f"/users/{user}/calendarView")
+
+    async def get_schedule(self, user: str, query: Dict[str, str], body: Any) -> Response:
+        start = _parse_time(body["startTime"]["dateTime"])
+        end = _parse_time(body["endTime"]["dateTime"])
+        value = []
+        for schedule in body.get("schedules", []):
+            items = []
+            day = datetime(start.year, start.month, start.day)
+            while day < end:
+                for index in range(self.config["busy_per_day"]):
+                    item_start = day + timedelta(hours=9 + 2 * index, minutes=(sum(map(ord, schedule)) % 4) * 15)
+                    items.append({
+                        "status": "tentative" if index == 2 else "busy",
+                        "start": _time(item_start),
+                        "end": _time(item_start + timedelta(minutes=45))
+                    })
+                day += timedelta(days=1)
+            value.append({"scheduleId": schedule, "availabilityView": "", "scheduleItems": items})
+        return 200, {}, {"value": value}
+
+    async def create_event(self, user: str, query: Dict[str, str], body: Any) -> Response:
+        event = self._event(user, item_id("evt", uuid.uuid4().hex), _parse_time(body["start"]["dateTime"]))
+        event.update(body)
+        return 201, {}, event
+
+    async def get_event(self, user: str, event_id: str, query: Dict[str, str], body: Any) -> Response:
+        return 200, {}, self._event(user, event_id, datetime(2024, 1, 1, 9))
+
+    async def update_event(self, user: str, event_id: str, query: Dict[str, str], body: Any) -> Response:
+        self._updated[event_id] = dict(body or {})
+        return 200, {}, self._event(user, event_id, datetime(2024, 1, 1, 9))
+
+    # Contacts
+
+    def _contact(self, contact_id: str, index: int) -> Dict[str, Any]:
+        first, last = f"Given{index:04d}", ["Smith", "Jones", "Garcia", "Miller", "Davis"][index % 5]
+        contact = {
+            "id": contact_id,
+            "givenName": first,
+            "surname": last,
+            "displayName": f"{first} {last}",
+            "emailAddresses": [{"name": f"{first} {last}", "address": f"{first.lower()}.{last.lower()}@example.com"}],
+            "businessPhones": [f"+1 555 01{index % 100:02d}"],
+            "homePhones": [],
+            "mobilePhone": None,
+            "addresses": [],
+            "companyName": "Contoso",
+            "jobTitle": "Engineer",
+            "department": "R&D",
+            "personalNotes": None,
+            "createdDateTime": "2024-01-01T00:00:00Z",
+            "lastModifiedDateTime": "2024-01-01T00:00:00Z"
+        }
+        contact.update(self._updated.get(contact_id, {}))
+        return contact
+
+    def _contacts(self) -> _Items:
+        return _Items(self.config["contacts"], lambda index: self._contact(item_id("con", f"{index:06d}"), index))
+
+    async def list_contacts(self, user: str, query: Dict[str, str], body: Any) -> Response:
+        return 200, {}, self._page(self._contacts(), query, f"/users/{user}/contacts")
+
+    async def list_contact_folders(self, user: str, query: Dict[str, str], body: Any) -> Response:
+        # Every contact lives in the default folder
+        return 200, {}, {"value": []}
+
+    async def contacts_delta(self, user: str, folder: str, query: Dict[str, str], body: Any) -> Response:
+        path = f"/users/{user}/contactFolders/{folder}/contacts/delta"
+        if "$deltatoken" in query:
+            return 200, {}, {"value": [], "@odata.deltaLink": f"{self.base_url}{path}?$deltatoken=latest"}
+        page = self._page(self._contacts(), dict(query, **{"$top": query.get("$top", "100")}), path)
+        if "@odata.nextLink" not in page:
+            page["@odata.deltaLink"] = f"{self.base_url}{path}?$deltatoken=latest"
+        return 200, {}, page
+
+    async def create_contact(self, user: str, query: Dict[str, str], body: Any) -> Response:
+        contact = self._contact(item_id("con", uuid.uuid4().hex), 0)
+        contact.update(body or {})
+        return 201, {}, contact
+
+    async def get_contact(self, user: str, contact_id: str, query: Dict[str, str], body: Any) -> Response:
+        return 200, {}, self._contact(contact_id, sum(map(ord, contact_id)))
+
+    async def update_contact(self, user: str, contact_id: str, query: Dict[str, str], body: Any) -> Response:
+        self._updated[contact_id] = dict(body or {})
+        return 200, {}, self._contact(contact_id, sum(map(ord, contact_id)))
+
+    # $batch
+
+    async def batch(self, query: Dict[str, str], body: Any) -> Response:
+        requests = (body or {}).get("requests", [])
+        if len(requests) > 20:
+            return _error(400, "BadRequest", "The number of batch requests exceeds the limit of 20.")
+
+        async def run(request: Dict[str, Any]) -> Dict[str, Any]:
+            parts = urlsplit(request["url"])
+            status, headers, sub_body = await self.dispatch(
+                request["method"].upper(), parts.path, dict(parse_qsl(parts.query)), request.get("body")
+            )
+            response = {"id": request["id"], "status": status, "headers": headers}
+            if sub_body is not None:
+                response["body"] = sub_body
+            return response
+
+        return 200, {}, {"responses": await asyncio.gather(*[run(request) for request in requests])}
+
+def create_app(graph: MockGraph) -> web.Application:
+    async def handle(request: web.Request) -> web.Response:
+        graph.http_requests += 1
+        if not graph.base_url:
+            graph.base_url = f"{request.scheme}://{request.host}/v1.0"
+        body = await request.json() if request.can_read_body and request.content_type == "application/json" else None
+        status, headers, data = await graph.dispatch(request.method, request.path, dict(request.query), body)
+        if data is None:
+            return web.Response(status=status, headers=headers)
+        return web.Response(status=status, headers=headers, text=json.dumps(data), content_type="application/json")
+
+    async def upload(request: web.Request) -> web.Response:
+        graph.http_requests += 1
+        await request.read()
+        graph._count("PUT {uploadUrl}", 200)
+        return web.json_response({"nextExpectedRanges": []})
+
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response(graph.stats())
+
+    async def reset(request: web.Request) -> web.Response:
+        graph.reset()
+        return web.Response(status=204)
+
+    async def configure(request: web.Request) -> web.Response:
+        updates = await request.json()
+        unknown = set(updates) - set(DEFAULT_CONFIG)
+        if unknown:
+            return web.json_response({"error": f"Unknown settings: {sorted(unknown)}"}, status=400)
+        graph.config.update(updates)
+        return web.json_response(graph.config)
+
+    app = web.Application(client_max_size=64 * 1024 ** 2)
+    app.router.add_get("/_stats", stats)
+    app.router.add_post("/_reset", reset)
+    app.router.add_post("/_config", configure)
+    app.router.add_put("/_upload/{session}", upload)
+    app.router.add_route("*", "/{tail:.*}", handle)
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for Microsoft Graph")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    for key, value in DEFAULT_CONFIG.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+    config = {key: getattr(args, key) for key in DEFAULT_CONFIG}
+    web.run_app(create_app(MockGraph(config)), host=args.host, port=args.port)
@@ -0,0 +1,329 @@
+"""
+Benchmark runner: serves the backend with uvicorn against the mock Graph
+server and drives every route under a load profile.
+
+    python -m benchmarks.run --profile steady
+    python -m benchmarks.run --profile tail --env GRAPH_HEDGING_ENABLED=true --label hedging
+    python -m benchmarks.run --profile smoke --routes "calendar.*"
+
+Run from the backend directory. For each route it reports throughput,
+latency percentiles, status codes and upstream calls (Graph requests as seen
+by the mock, EWS operations from the backend's /metrics), and writes the
+results to benchmarks/results/ as JSON for benchmarks.compare.
+"""
+import argparse
+import asyncio
+import fnmatch
+import json
+import os
+import platform
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+import aiohttp
+from aiohttp import web
+from jose import jwt
+from prometheus_client.parser import text_string_to_metric_families
+from .mock_graph import MockGraph, create_app
+from .scenarios import PROFILES, SCENARIOS
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+PERCENTILES = (50, 90, 95, 99)
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _percentile(ordered: List[float], percent: float) -> float:
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+def _git_revision() -> Dict[str, Any]:
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--", "app"], cwd=BACKEND_DIR, text=True).strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": dirty}
+
+class Backend:
+    """The backend served by uvicorn in a subprocess"""
+
+    def __init__(self, graph_url: str, ews_latency_ms: float, env: Dict[str, str]):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.secret_key = secrets.token_urlsafe(32)
+        self.data_dir = tempfile.TemporaryDirectory(prefix="benchmark-")
+        self.env = dict(
+            os.environ,
+            AZURE_AD_TENANT_ID="benchmark",
+            AZURE_AD_CLIENT_ID="benchmark",
+            AZURE_AD_CLIENT_SECRET="benchmark",
+            EXCHANGE_SERVER="https://exchange.invalid/EWS/Exchange.asmx",
+            SECRET_KEY=self.secret_key,
+            GRAPH_BASE_URL=graph_url,
+            SEARCH_INDEX_DIR=os.path.join(self.data_dir.name, "search"),
+            ATTACHMENT_CACHE_DIR=os.path.join(self.data_dir.name, "attachments"),
+            MAIL_MIRROR_DB_PATH=os.path.join(self.data_dir.name, "mail_mirror.db"),
+            BENCH_EWS_LATENCY_MS=str(ews_latency_ms),
+            **env
+        )
+        self.process: Optional[subprocess.Popen] = None
+        self._tokens: Dict[str, str] = {}
+
+    async def start(self) -> None:
+        self.process = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "benchmarks.app_under_test:app",
+                "--host", "127.0.0.1", "--port", str(self.port), "--log-level", "warning"
+            ],
+            cwd=BACKEND_DIR,
+            env=self.env
+        )
+        deadline = time.monotonic() + 30
+        async with aiohttp.ClientSession() as session:
+            while time.monotonic() < deadline:
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"Backend exited with code {self.process.returncode}")
+                try:
+                    async with session.get(f"{self.url}/health") as response:
+                        if response.status == 200:
+                            return
+                except aiohttp.ClientError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise RuntimeError("Backend did not become healthy within 30 seconds")
+
+    def token(self, username: str) -> str:
+        token = self._tokens.get(username)
+        if token is None:
+            expires = datetime.now(timezone.utc) + timedelta(hours=2)
+            token = self._tokens[username] = jwt.encode(
+                {"sub": username, "exp": expires}, self.secret_key, algorithm="HS256"
+            )
+        return token
+
+    async def ews_operations(self, session: aiohttp.ClientSession) -> Dict[str, float]:
+        """EWS operation counts from the backend's Prometheus metrics"""
+        async with session.get(f"{self.url}/metrics") as response:
+            if response.status != 200:
+                return {}
+            text = await response.text()
+        counts: Dict[str, float] = {}
+        for family in text_string_to_metric_families(text):
+            for sample in family.samples:
+                if sample.name == "upstream_responses_total" and sample.labels.get("service") == "ews":
+                    key = sample.labels["endpoint"]
+                    counts[key] = counts.get(key, 0) + sample.value
+        return counts
+
+    def stop(self) -> None:
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.data_dir.cleanup()
+
+async def _issue(
+    session: aiohttp.ClientSession,
+    backend: Backend,
+    scenario: Dict[str, Any],
+    index: int,
+    username: str,
+    users: int,
+    cursors: Dict[str, str]
+) -> Tuple[float, int]:
+    """
+    Send one request and read the whole response; returns (seconds, status).
+    Scenarios with a (header, param) "cursor" pass each user's last value of
+    that response header back as the param, starting over when it is absent.
+    """
+    spec = scenario["build"](index // users if scenario.get("per_user") else index, username)
+    path = scenario["path"].replace("{id}", spec.get("id", ""))
+    params = {key: value for key, value in (spec.get("params") or {}).items() if value is not None}
+    cursor = scenario.get("cursor")
+    if cursor and username in cursors:
+        params[cursor[1]] = cursors[username]
+    data = None
+    if "form" in spec:
+        data = aiohttp.FormData()
+        for key, value in spec["form"].items():
+            if isinstance(value, tuple):
+                name, content, content_type = value
+                data.add_field(key, content, filename=name, content_type=content_type)
+            else:
+                data.add_field(key, value)
+
+    started = time.perf_counter()
+    try:
+        async with session.request(
+            scenario["method"],
+            backend.url + path,
+            params=params,
+            json=spec.get("json"),
+            data=data,
+            headers={"Authorization": f"Bearer {backend.token(username)}"}
+        ) as response:
+            await response.read()
+            status = response.status
+            if cursor:
+                if cursor[0] in response.headers:
+                    cursors[username] = response.headers[cursor[0]]
+                else:
+                    cursors.pop(username, None)
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        status = 0
+    return time.perf_counter() - started, status
+
+async def run_scenario(
+    session: aiohttp.ClientSession,
+    backend: Backend,
+    graph: MockGraph,
+    scenario: Dict[str, Any],
+    profile: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Closed-loop load: `concurrency` clients each send their next request as soon as one completes"""
+    users = [f"bench{n}@example.com" for n in range(profile["users"])]
+    total = max(1, round(profile["requests"] * scenario.get("scale", 1.0)))
+    cursors: Dict[str, str] = {}
+    for index in range(profile["warmup"]):
+        await _issue(session, backend, scenario, index, users[index % len(users)], len(users), cursors)
+    cursors.clear()
+
+    graph.reset()
+    ews_before = await backend.ews_operations(session)
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    next_index = iter(range(total))
+
+    async def client() -> None:
+        for index in next_index:
+            seconds, status = await _issue(session, backend, scenario, index, users[index % len(users)], len(users), cursors)
+            latencies.append(seconds)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(min(profile["concurrency"], total))])
+    elapsed = time.perf_counter() - started
+
+    upstream = graph.stats()
+    ews_after = await backend.ews_operations(session)
+    ews = {key: value - ews_before.get(key, 0) for key, value in ews_after.items() if value > ews_before.get(key, 0)}
+    ordered = sorted(latencies)
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    return {
+        "requests": total,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2),
+        "latency_ms": dict(
+            {f"p{p}": round(_percentile(ordered, p) * 1000, 2) for p in PERCENTILES},
+            mean=round(sum(ordered) / len(ordered) * 1000, 2),
+            max=round(ordered[-1] * 1000, 2)
+        ),
+        "statuses": statuses,
+        "errors": errors,
+        "upstream": {
+            "graph_requests": upstream["graph_requests"],
+            "graph_http_requests": upstream["http_requests"],
+            "graph_batches": upstream["batches"],
+            "graph_throttled": upstream["throttled"],
+            "graph_per_request": round(upstream["graph_requests"] / total, 2),
+            "ews_operations": int(sum(ews.values())),
+            "ews_per_request": round(sum(ews.values()) / total, 2),
+            "graph_endpoints": upstream["endpoints"],
+            "ews_endpoints": ews
+        }
+    }
+
+def _print_row(name: str, result: Dict[str, Any]) -> None:
+    latency = result["latency_ms"]
+    upstream = result["upstream"]
+    print(
+        f"{name:32} {result['throughput_rps']:9.1f} {latency['p50']:9.1f} {latency['p95']:9.1f} "
+        f"{latency['p99']:9.1f} {result['errors']:6d} {upstream['graph_per_request']:7.2f} "
+        f"{upstream['ews_per_request']:6.2f} {upstream['graph_throttled']:5d}"
+    )
+
+async def run(profile_name: str, patterns: List[str], env: Dict[str, str], label: Optional[str]) -> Dict[str, Any]:
+    profile = PROFILES[profile_name]
+    scenarios = [s for s in SCENARIOS if any(fnmatch.fnmatch(s["name"], p) for p in patterns)]
+    if not scenarios:
+        raise ValueError(f"No scenarios match {patterns}")
+
+    graph = MockGraph(profile["graph"])
+    graph_port = _free_port()
+    graph.base_url = f"http://127.0.0.1:{graph_port}/v1.0"
+    runner = web.AppRunner(create_app(graph))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", graph_port).start()
+
+    backend = Backend(graph.base_url, profile["ews_latency_ms"], env)
+    results: Dict[str, Any] = {}
+    try:
+        await backend.start()
+        connector = aiohttp.TCPConnector(limit=profile["concurrency"])
+        timeout = aiohttp.ClientTimeout(total=120)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            print(f"Profile {profile_name}: {profile['description']}")
+            print(f"{'route':32} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>6} {'graph/r':>7} {'ews/r':>6} {'429s':>5}")
+            for scenario in scenarios:
+                results[scenario["name"]] = await run_scenario(session, backend, graph, scenario, profile)
+                _print_row(scenario["name"], results[scenario["name"]])
+    finally:
+        backend.stop()
+        await runner.cleanup()
+
+    return {
+        "label": label,
+        "profile": profile_name,
+        "profile_config": {key: value for key, value in profile.items() if key != "description"},
+        "env": env,
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git": _git_revision(),
+        "python": platform.python_version(),
+        "routes": results
+    }
+
+def save(report: Dict[str, Any], output_dir: str) -> str:
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    commit = (report["git"]["commit"] or "nogit")[:8]
+    name = "-".join(part for part in [stamp, report["profile"], commit, report["label"]] if part)
+    path = os.path.join(output_dir, f"{name}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    return path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the backend against a mock Graph server")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="steady")
+    parser.add_argument("--routes", action="append", default=None,
+                        help="Glob over scenario names, e.g. 'mail.*'; repeatable (default: all)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Backend setting for this run, e.g. GRAPH_BATCH_ENABLED=false; repeatable")
+    parser.add_argument("--label", default=None, help="Suffix for the results file name")
+    parser.add_argument("--output", default=RESULTS_DIR)
+    parser.add_argument("--list", action="store_true", help="List scenarios and profiles, then exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, profile in PROFILES.items():
+            print(f"profile  {name:10} {profile['description']}")
+        for scenario in SCENARIOS:
+            print(f"scenario {scenario['name']:32} {scenario['method']} {scenario['path']}")
+        sys.exit(0)
+
+    overrides = dict(item.split("=", 1) for item in args.env)
+    report = asyncio.run(run(args.profile, args.routes or ["*"], overrides, args.label))
+    print(f"Results written to {save(report, args.output)}")
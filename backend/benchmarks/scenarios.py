@@ -0,0 +1,170 @@
+"""
+Benchmark scenarios (one per API route) and load profiles.
+
+Each scenario builds the n-th request of a run for a given mailbox, so runs
+are reproducible and spread over many items instead of hammering one cache
+entry; "per_user" scenarios get the n-th request of that mailbox instead.
+"scale" shrinks the request count of expensive routes such as exports
+relative to the profile.
+"""
+import base64
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
+from .mock_graph import item_id
+
+RequestBuilder = Callable[[int, str], Dict[str, Any]]
+
+ATTENDEES = [f"colleague{n}@example.com" for n in range(200)]
+FIRST_WEEK = datetime(2024, 1, 1)
+
+def _week(index: int) -> datetime:
+    return FIRST_WEEK + timedelta(weeks=index % 8)
+
+def _message_id(index: int) -> str:
+    return item_id("msg", f"inbox-{index % 1000:06d}")
+
+def _event_id(index: int) -> str:
+    return item_id("evt", f"{_week(index):%Y%m%d}-{index % 6:02d}")
+
+def _contact_id(index: int) -> str:
+    return item_id("con", f"{index % 500:06d}")
+
+def _event(index: int) -> Dict[str, Any]:
+    start = _week(index) + timedelta(days=index % 5, hours=10)
+    return {
+        "subject": f"Benchmark meeting {index}",
+        "start_time": start.isoformat(),
+        "end_time": (start + timedelta(minutes=30)).isoformat(),
+        "location": "Room 1",
+        "body": "Agenda to follow",
+        "attendees": [{"email": ATTENDEES[index % 200]}]
+    }
+
+def _contact(index: int) -> Dict[str, Any]:
+    return {
+        "given_name": "Bench",
+        "surname": f"Contact{index}",
+        "display_name": f"Bench Contact{index}",
+        "email_addresses": [f"bench.contact{index}@example.com"],
+        "phone_numbers": [{"type": "business", "number": "+1 555 0100"}],
+        "company_name": "Contoso"
+    }
+
+def _message(index: int, attachment_bytes: int = 0) -> Dict[str, Any]:
+    message: Dict[str, Any] = {
+        "subject": f"Benchmark message {index}",
+        "body": "<p>Hello from the benchmark</p>",
+        "to_recipients": [ATTENDEES[index % 200]]
+    }
+    if attachment_bytes:
+        message["attachments"] = [{
+            "name": "report.pdf",
+            "content_type": "application/pdf",
+            "content_bytes": base64.b64encode(b"%" * attachment_bytes).decode("ascii")
+        }]
+    return message
+
+def _multipart(index: int, user: str) -> Dict[str, Any]:
+    # Larger than MAIL_INLINE_ATTACHMENT_MAX_BYTES, so it goes through an upload session
+    return {"form": {
+        "subject": f"Benchmark upload {index}",
+        "body": "<p>Large attachment</p>",
+        "to_recipients": ATTENDEES[index % 200],
+        "files": ("report.bin", b"\0" * (4 * 1024 ** 2), "application/octet-stream")
+    }}
+
+SCENARIOS: List[Dict[str, Any]] = [
+    # Mail
+    {"name": "mail.list_messages", "method": "GET", "path": "/api/v1/mail/messages",
+     "build": lambda i, user: {"params": {"page_size": 50, "page_token": str(50 * (i % 10)) if i % 10 else None}}},
+    # Each user pages through the inbox by following X-Next-Page-Token, as a
+    # client would and as the next page prefetch expects
+    {"name": "mail.page_inbox", "method": "GET", "path": "/api/v1/mail/messages", "per_user": True,
+     "cursor": ("X-Next-Page-Token", "page_token"),
+     "build": lambda step, user: {"params": {"page_size": 50}}},
+    {"name": "mail.search_messages", "method": "GET", "path": "/api/v1/mail/messages",
+     "build": lambda i, user: {"params": {"search": f"report {i % 100}", "page_size": 25}}},
+    {"name": "mail.export_folder", "method": "GET", "path": "/api/v1/mail/folders/inbox/export", "scale": 0.25,
+     "build": lambda i, user: {}},
+    {"name": "mail.export_folder_gzip", "method": "GET", "path": "/api/v1/mail/folders/inbox/export", "scale": 0.25,
+     "build": lambda i, user: {"params": {"compress": "true"}}},
+    {"name": "mail.get_message", "method": "GET", "path": "/api/v1/mail/messages/{id}",
+     "build": lambda i, user: {"id": _message_id(i)}},
+    {"name": "mail.bulk_messages", "method": "POST", "path": "/api/v1/mail/messages/bulk", "scale": 0.5,
+     "build": lambda i, user: {"json": {"ids": [_message_id(i * 100 + n) for n in range(100)]}}},
+    {"name": "mail.send_message", "method": "POST", "path": "/api/v1/mail/messages/send",
+     "build": lambda i, user: {"json": _message(i)}},
+    {"name": "mail.send_message_attachment", "method": "POST", "path": "/api/v1/mail/messages/send",
+     "build": lambda i, user: {"json": _message(i, attachment_bytes=256 * 1024)}},
+    {"name": "mail.send_message_multipart", "method": "POST", "path": "/api/v1/mail/messages/send/multipart", "scale": 0.25,
+     "build": _multipart},
+
+    # Calendar
+    {"name": "calendar.list_events", "method": "GET", "path": "/api/v1/calendar/events",
+     "build": lambda i, user: {"params": {
+         "start_date": _week(i).isoformat(), "end_date": (_week(i) + timedelta(days=28)).isoformat()
+     }}},
+    {"name": "calendar.availability", "method": "POST", "path": "/api/v1/calendar/availability",
+     "build": lambda i, user: {"json": {
+         "attendees": [ATTENDEES[(i * 7 + n) % 200] for n in range(10)],
+         "start_time": _week(i).isoformat(), "end_time": (_week(i) + timedelta(days=7)).isoformat()
+     }}},
+    {"name": "calendar.meeting_slots", "method": "POST", "path": "/api/v1/calendar/availability/slots",
+     "build": lambda i, user: {"json": {
+         "required_attendees": [ATTENDEES[(i * 3 + n) % 200] for n in range(5)],
+         "optional_attendees": [ATTENDEES[(i * 3 + n + 100) % 200] for n in range(3)],
+         "start_time": _week(i).isoformat(), "end_time": (_week(i) + timedelta(days=5)).isoformat(),
+         "duration_minutes": 60, "working_hours_start": "09:00", "working_hours_end": "17:00"
+     }}},
+    {"name": "calendar.create_event", "method": "POST", "path": "/api/v1/calendar/events",
+     "build": lambda i, user: {"json": _event(i)}},
+    {"name": "calendar.get_event", "method": "GET", "path": "/api/v1/calendar/events/{id}",
+     "build": lambda i, user: {"id": _event_id(i)}},
+    {"name": "calendar.update_event", "method": "PUT", "path": "/api/v1/calendar/events/{id}",
+     "build": lambda i, user: {"id": _event_id(i), "json": _event(i)}},
+    {"name": "calendar.delete_event", "method": "DELETE", "path": "/api/v1/calendar/events/{id}",
+     "build": lambda i, user: {"id": _event_id(i)}},
+
+    # Contacts
+    {"name": "contacts.list_contacts", "method": "GET", "path": "/api/v1/contacts/contacts",
+     "build": lambda i, user: {"params": {"page_size": 50, "page_token": str(50 * (i % 10)) if i % 10 else None}}},
+    {"name": "contacts.suggest", "method": "GET", "path": "/api/v1/contacts/contacts/suggest",
+     "build": lambda i, user: {"params": {"q": ["gi", "given00", "smi", "jones given01", "da"][i % 5], "limit": 10}}},
+    {"name": "contacts.create_contact", "method": "POST", "path": "/api/v1/contacts/contacts",
+     "build": lambda i, user: {"json": _contact(i)}},
+    {"name": "contacts.get_contact", "method": "GET", "path": "/api/v1/contacts/contacts/{id}",
+     "build": lambda i, user: {"id": _contact_id(i)}},
+    {"name": "contacts.update_contact", "method": "PUT", "path": "/api/v1/contacts/contacts/{id}",
+     "build": lambda i, user: {"id": _contact_id(i), "json": _contact(i)}},
+    {"name": "contacts.delete_contact", "method": "DELETE", "path": "/api/v1/contacts/contacts/{id}",
+     "build": lambda i, user: {"id": _contact_id(i)}}
+]
+
+# "graph" is applied to the mock Graph server, "env" to the backend
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "smoke": {
+        "description": "One request at a time against a fast upstream; checks every route works",
+        "concurrency": 1, "requests": 10, "warmup": 1, "users": 2,
+        "graph": {"latency_ms": 5, "jitter_ms": 0}, "ews_latency_ms": 5
+    },
+    "steady": {
+        "description": "Moderate concurrency spread over many mailboxes",
+        "concurrency": 8, "requests": 200, "warmup": 10, "users": 16,
+        "graph": {"latency_ms": 40, "jitter_ms": 20}, "ews_latency_ms": 60
+    },
+    "burst": {
+        "description": "High concurrency against few mailboxes; exercises per-mailbox queueing",
+        "concurrency": 64, "requests": 500, "warmup": 20, "users": 4,
+        "graph": {"latency_ms": 40, "jitter_ms": 20}, "ews_latency_ms": 60
+    },
+    "throttled": {
+        "description": "Graph rejects 5% of requests with 429 and Retry-After",
+        "concurrency": 16, "requests": 200, "warmup": 10, "users": 8,
+        "graph": {"latency_ms": 40, "jitter_ms": 20, "throttle_rate": 0.05, "retry_after": 1}, "ews_latency_ms": 60
+    },
+    "tail": {
+        "description": "5% of Graph requests take an extra 1.5 s; compare with GRAPH_HEDGING_ENABLED=true",
+        "concurrency": 16, "requests": 200, "warmup": 10, "users": 16,
+        "graph": {"latency_ms": 30, "jitter_ms": 10, "tail_rate": 0.05, "tail_ms": 1500}, "ews_latency_ms": 60
+    }
+}
@@ -0,0 +1,123 @@
+"""
+Measure response encoding of the list routes in-process, without HTTP.
+
+    python -m benchmarks.serialization --page-sizes 50 500 --rounds 50
+
+For each list route the same page of formatted Graph items is turned into
+response bytes the standard FastAPI way (response_model validation and
+JSONResponse) and through FastJSONResponse (orjson, no validation), and the
+two bodies are checked to decode to the same JSON. mail.get_messages also
+reports the former path that built a MessageResponse per message before
+FastAPI validated the list again.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List
+
+for _name, _value in {
+    "AZURE_AD_TENANT_ID": "benchmark", "AZURE_AD_CLIENT_ID": "benchmark",
+    "AZURE_AD_CLIENT_SECRET": "benchmark", "EXCHANGE_SERVER": "localhost",
+    "SECRET_KEY": "benchmark-serialization-secret-key"
+}.items():
+    os.environ.setdefault(_name, _value)
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from .app_under_test import app  # noqa: E402
+from .mock_graph import MockGraph  # noqa: E402
+from app.api.v1.mail import MessageResponse, _format_message  # noqa: E402
+from app.core.responses import FastJSONResponse  # noqa: E402
+from app.services.exchange.calendar import calendar_service  # noqa: E402
+from app.services.exchange.contacts import contacts_service  # noqa: E402
+
+USER = "bench.user@example.com"
+
+def _route(name: str) -> Any:
+    for route in app.routes:
+        if getattr(route, "name", None) == name.split(".")[1] and f"/{name.split('.')[0]}/" in route.path:
+            return route
+    raise KeyError(name)
+
+async def _graph_page(graph: MockGraph, path: str, query: Dict[str, str]) -> List[Dict[str, Any]]:
+    status, _, body = await graph.dispatch("GET", path, query, None)
+    assert status == 200, body
+    return body["value"]
+
+async def _pages(page_size: int) -> Dict[str, List[Dict[str, Any]]]:
+    """Formatted items, as the services hand them to the routes"""
+    graph = MockGraph({
+        "latency_ms": 0, "jitter_ms": 0, "mailbox_concurrency": 0,
+        "messages": max(page_size, 1000), "contacts": max(page_size, 500),
+        "events_per_day": max(6, page_size // 28 + 1)
+    })
+    top = {"$top": str(page_size)}
+    messages = await _graph_page(graph, f"/users/{USER}/mailFolders/inbox/messages", top)
+    events = await _graph_page(graph, f"/users/{USER}/calendarView", dict(
+        top, startDateTime="2024-01-01T00:00:00", endDateTime="2024-01-29T00:00:00"
+    ))
+    contacts = await _graph_page(graph, f"/users/{USER}/contacts", top)
+    return {
+        "mail.get_messages": [_format_message(msg) for msg in messages],
+        "calendar.get_events": [calendar_service._format_event(event) for event in events[:page_size]],
+        "contacts.get_contacts": [contacts_service._format_contact(contact) for contact in contacts]
+    }
+
+def _standard(route: Any) -> Callable[[List[Dict[str, Any]]], Any]:
+    async def encode(items: List[Dict[str, Any]]) -> bytes:
+        content = await serialize_response(field=route.secure_cloned_response_field, response_content=items)
+        return JSONResponse(content).body
+    return encode
+
+def _models(route: Any) -> Callable[[List[Dict[str, Any]]], Any]:
+    encode = _standard(route)
+    async def encode_models(items: List[Dict[str, Any]]) -> bytes:
+        return await encode([MessageResponse(**item) for item in items])
+    return encode_models
+
+async def _stream(items: List[Dict[str, Any]]) -> bytes:
+    # calendar.get_events streams one element at a time rather than validating
+    return b"[" + b",".join(json.dumps(jsonable_encoder(item)).encode() for item in items) + b"]"
+
+async def _fast(items: List[Dict[str, Any]]) -> bytes:
+    return FastJSONResponse(items).body
+
+async def _time(encode: Callable[[List[Dict[str, Any]]], Any], items: List[Dict[str, Any]], rounds: int) -> float:
+    await encode(items)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        await encode(items)
+    return (time.perf_counter() - started) / rounds * 1000
+
+async def run(page_sizes: List[int], rounds: int) -> List[Dict[str, Any]]:
+    rows = []
+    for page_size in page_sizes:
+        pages = await _pages(page_size)
+        for name, items in pages.items():
+            route = _route(name)
+            standard = _stream if name == "calendar.get_events" else _standard(route)
+            modes = {"standard": standard, "fast": _fast}
+            if name == "mail.get_messages":
+                modes = {"models": _models(route), **modes}
+            assert json.loads(await standard(items)) == json.loads(await _fast(items)), f"{name} bodies differ"
+            timings = {mode: await _time(encode, items, rounds) for mode, encode in modes.items()}
+            rows.append({"route": name, "items": len(items), "ms": timings})
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare standard and fast JSON encoding of list routes")
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[50, 500])
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'route':24} {'items':>6} {'models':>9} {'standard':>9} {'fast':>9} {'speedup':>8}")
+    for row in asyncio.run(run(args.page_sizes, args.rounds)):
+        ms = row["ms"]
+        models = f"{ms['models']:7.2f}ms" if "models" in ms else ""
+        print(
+            f"{row['route']:24} {row['items']:>6} {models:>9} {ms['standard']:7.2f}ms "
+            f"{ms['fast']:7.2f}ms {ms['standard'] / ms['fast']:7.1f}x"
+        )
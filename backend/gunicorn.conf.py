@@ -0,0 +1,59 @@
+"""
+Production server: gunicorn -c gunicorn.conf.py app.main:app
+
+Runs SERVER_WORKERS uvicorn worker processes. The app is imported once in
+the master and the workers are forked from it. On SIGTERM each worker stops
+accepting connections, drains in-flight requests for up to
+SERVER_GRACEFUL_TIMEOUT seconds, then runs the app's shutdown handler.
+
+State that would otherwise be duplicated per worker belongs in Redis:
+TOKEN_CACHE_BACKEND, CACHE_BACKEND and NOTIFICATIONS_BACKEND.
+"""
+import os
+import shutil
+import tempfile
+from app.core.config import settings
+
+bind = f"{settings.SERVER_HOST}:{settings.SERVER_PORT}"
+workers = settings.SERVER_WORKERS
+worker_class = "app.core.server.ProductionWorker"
+preload_app = True
+graceful_timeout = settings.SERVER_GRACEFUL_TIMEOUT
+keepalive = settings.SERVER_KEEPALIVE
+
+# Every worker writes its metrics here so /metrics can aggregate them. Set
+# before preloading, which is when prometheus_client is first imported.
+if settings.METRICS_ENABLED and workers > 1:
+    os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR",
+        os.path.join(tempfile.gettempdir(), "prometheus-multiproc")
+    )
+
+def on_starting(server):
+    if workers > 1 and settings.NOTIFICATIONS_ENABLED and settings.NOTIFICATIONS_BACKEND != "redis":
+        # A worker only trusts notifications for subscriptions it knows, so
+        # the others would silently drop them
+        raise RuntimeError(
+            f"NOTIFICATIONS_BACKEND must be redis when NOTIFICATIONS_ENABLED and SERVER_WORKERS={workers}"
+        )
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        # Values left by a previous run would be added to this one's
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+def when_ready(server):
+    if workers == 1:
+        return
+    shared = {
+        "TOKEN_CACHE_BACKEND": True,
+        "CACHE_BACKEND": settings.CACHE_ENABLED
+    }
+    for name, used in shared.items():
+        if used and getattr(settings, name) != "redis":
+            server.log.warning("%s is not redis, so each of the %d workers keeps its own copy", name, workers)
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
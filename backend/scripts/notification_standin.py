@@ -0,0 +1,180 @@
+"""
+Local stand-in for Graph change notifications.
+
+Implements the Graph /subscriptions endpoints, including the validationToken
+handshake against the notification URL, and posts Graph-shaped notifications
+to subscribed webhooks on demand or on a timer.
+
+    python scripts/notification_standin.py --port 8900 [--interval 10]
+
+Point the backend at it with GRAPH_BASE_URL=http://localhost:8900,
+NOTIFICATIONS_ENABLED=true and
+NOTIFICATIONS_WEBHOOK_URL=http://localhost:8000/api/v1/notifications/webhook,
+subscribe a mailbox with POST /api/v1/notifications/subscriptions, then
+trigger notifications:
+
+    curl -X POST localhost:8900/_notify \\
+        -d '{"resource": "messages", "changeType": "updated", "id": "AAMk..."}'
+
+Fields of /_notify: resource (messages, events or contacts), changeType,
+id, optional username to target one mailbox, and optional lifecycleEvent
+(reauthorizationRequired, subscriptionRemoved or missed).
+"""
+import argparse
+import asyncio
+import random
+import secrets
+import uuid
+from typing import Any, Dict, List, Optional
+import aiohttp
+from aiohttp import web
+
+ODATA_TYPES = {
+    "messages": "#Microsoft.Graph.Message",
+    "events": "#Microsoft.Graph.Event",
+    "contacts": "#Microsoft.Graph.Contact"
+}
+
+subscriptions: Dict[str, Dict[str, Any]] = {}
+
+def _error(status: int, message: str) -> web.Response:
+    return web.json_response({"error": {"code": "StandIn", "message": message}}, status=status)
+
+def _resource_type(resource: str) -> str:
+    return resource.rstrip("/").rsplit("/", 1)[-1].lower()
+
+async def create_subscription(request: web.Request) -> web.Response:
+    body = await request.json()
+    # Graph refuses the subscription unless the webhook echoes the token
+    token = secrets.token_urlsafe(16)
+    try:
+        async with request.app["session"].post(
+            body["notificationUrl"],
+            params={"validationToken": token},
+            timeout=aiohttp.ClientTimeout(total=10)
+        ) as response:
+            echoed = await response.text()
+            if response.status != 200 or echoed != token:
+                return _error(400, f"Subscription validation request failed: HTTP {response.status}")
+    except aiohttp.ClientError as e:
+        return _error(400, f"Subscription validation request failed: {e}")
+
+    subscription = dict(body, id=str(uuid.uuid4()))
+    subscriptions[subscription["id"]] = subscription
+    print(f"Created subscription {subscription['id']} for {subscription['resource']}")
+    return web.json_response(subscription, status=201)
+
+async def update_subscription(request: web.Request) -> web.Response:
+    subscription = subscriptions.get(request.match_info["id"])
+    if subscription is None:
+        return _error(404, "Subscription not found")
+    subscription.update(await request.json())
+    return web.json_response(subscription)
+
+async def delete_subscription(request: web.Request) -> web.Response:
+    if subscriptions.pop(request.match_info["id"], None) is None:
+        return _error(404, "Subscription not found")
+    return web.Response(status=204)
+
+async def unsupported(request: web.Request) -> web.Response:
+    return _error(501, f"{request.method} {request.path} is not simulated")
+
+def _notification(
+    subscription: Dict[str, Any],
+    change_type: str,
+    resource_id: str,
+    lifecycle_event: Optional[str]
+) -> Dict[str, Any]:
+    resource_type = _resource_type(subscription["resource"])
+    notification = {
+        "subscriptionId": subscription["id"],
+        "clientState": subscription.get("clientState"),
+        "subscriptionExpirationDateTime": subscription.get("expirationDateTime"),
+        "tenantId": "00000000-0000-0000-0000-000000000000"
+    }
+    if lifecycle_event:
+        notification["lifecycleEvent"] = lifecycle_event
+        return notification
+    notification.update({
+        "changeType": change_type,
+        "resource": f"{subscription['resource']}/{resource_id}",
+        "resourceData": {
+            "@odata.type": ODATA_TYPES.get(resource_type, "#Microsoft.Graph.Entity"),
+            "@odata.id": f"{subscription['resource']}/{resource_id}",
+            "id": resource_id
+        }
+    })
+    return notification
+
+async def _post(session: aiohttp.ClientSession, subscription: Dict[str, Any], notification: Dict[str, Any]) -> int:
+    url = subscription["lifecycleNotificationUrl" if "lifecycleEvent" in notification else "notificationUrl"]
+    async with session.post(url, json={"value": [notification]}) as response:
+        return response.status
+
+async def notify(request: web.Request) -> web.Response:
+    body = await request.json()
+    targets: List[Dict[str, Any]] = [
+        subscription for subscription in subscriptions.values()
+        if _resource_type(subscription["resource"]) == body.get("resource", "messages")
+        and (not body.get("username") or f"/{body['username']}/" in f"/{subscription['resource']}/")
+    ]
+    statuses = await asyncio.gather(*[
+        _post(
+            request.app["session"],
+            subscription,
+            _notification(
+                subscription,
+                body.get("changeType", "updated"),
+                body.get("id") or str(uuid.uuid4()),
+                body.get("lifecycleEvent")
+            )
+        )
+        for subscription in targets
+    ])
+    return web.json_response({"delivered": len(targets), "statuses": statuses})
+
+async def _emit_periodically(app: web.Application, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        for subscription in list(subscriptions.values()):
+            change_type = random.choice(["created", "updated", "deleted"])
+            try:
+                status = await _post(
+                    app["session"],
+                    subscription,
+                    _notification(subscription, change_type, str(uuid.uuid4()), None)
+                )
+                print(f"Sent {change_type} for {subscription['resource']}: HTTP {status}")
+            except aiohttp.ClientError as e:
+                print(f"Error sending notification: {e}")
+
+def create_app(interval: Optional[float] = None) -> web.Application:
+    app = web.Application()
+    app.router.add_post("/subscriptions", create_subscription)
+    app.router.add_patch("/subscriptions/{id}", update_subscription)
+    app.router.add_delete("/subscriptions/{id}", delete_subscription)
+    app.router.add_post("/_notify", notify)
+    app.router.add_route("*", "/{tail:.*}", unsupported)
+
+    async def on_startup(app: web.Application) -> None:
+        app["session"] = aiohttp.ClientSession()
+        if interval:
+            app["emitter"] = asyncio.ensure_future(_emit_periodically(app, interval))
+
+    async def on_cleanup(app: web.Application) -> None:
+        if "emitter" in app:
+            app["emitter"].cancel()
+        await app["session"].close()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for Graph change notifications")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--interval", type=float, default=None,
+                        help="Send a random change for every subscription every N seconds")
+    args = parser.parse_args()
+    web.run_app(create_app(args.interval), host=args.host, port=args.port)